@@ -0,0 +1,333 @@
+"""End-to-end benchmarks of the simulator server against the mock model backend.
+
+Usage:
+    python benchmark.py --output benchmark.json
+    python benchmark.py --conversations 200 --turns 10 --runner asyncio --output asyncio.json
+
+Conversations are started through Socket.IO events on the Flask app, so the
+whole request path (session manager, history, scheduler, database and event
+emission) is measured; only the model is simulated (LLM_PROVIDER=mock). The
+suite reports
+
+- conversations per second and turn latency percentiles,
+- time to the first `new_message` event and to the first bot reply,
+- SQLite write throughput of DatabaseManager (row by row and batched),
+- export times of a 10k-message conversation in every format,
+- memory per active conversation.
+
+Every run uses a fresh temporary database. Compare the JSON results of two
+releases to catch regressions.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+
+# 模型回應一律由本機模擬，必須在匯入 main 之前設定
+os.environ["LLM_PROVIDER"] = "mock"
+os.environ.setdefault("MOCK_LATENCY", "0.01")
+os.environ.setdefault("MOCK_TOKENS_PER_SECOND", "0")
+os.environ.setdefault("MOCK_ERROR_RATE", "0")
+os.environ.setdefault("MOCK_SEED", "1")
+os.environ["RESPONSE_CACHE"] = "off"
+
+import main
+from database.db_manager import DatabaseManager
+from exporters import EXPORT_FORMATS
+
+
+def percentiles(values, points=(50, 90, 99)):
+    """Nearest-rank percentiles of `values` in milliseconds, plus mean and max."""
+    if not values:
+        return {}
+    ordered = sorted(values)
+    result = {f"p{point}": round(ordered[min(len(ordered) - 1, int(len(ordered) * point / 100))] * 1000, 3)
+              for point in points}
+    result["mean"] = round(sum(ordered) / len(ordered) * 1000, 3)
+    result["max"] = round(ordered[-1] * 1000, 3)
+    return result
+
+
+def rss_bytes():
+    """Resident set size of this process, or None where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class EventRecorder:
+    """Timestamps the events the server emits, per conversation."""
+
+    def __init__(self, socketio):
+        self.socketio = socketio
+        self.events = {}
+        self._emit = None
+        # wait() 的條件會再呼叫 count()，需要可重入的鎖
+        self._lock = threading.RLock()
+        self._changed = threading.Condition(self._lock)
+
+    def __enter__(self):
+        self._emit = self.socketio.emit
+
+        def emit(event, *args, **kwargs):
+            room = kwargs.get("to") or kwargs.get("room")
+            data = args[0] if args else None
+            if isinstance(room, str) and room.startswith("conversation_"):
+                conv_id = int(room[len("conversation_"):])
+            else:
+                conv_id = data.get("conversation_id") if isinstance(data, dict) else None
+            if conv_id is not None:
+                with self._changed:
+                    self.events.setdefault(conv_id, []).append((time.perf_counter(), event))
+                    self._changed.notify_all()
+            return self._emit(event, *args, **kwargs)
+
+        self.socketio.emit = emit
+        return self
+
+    def __exit__(self, *exc):
+        self.socketio.emit = self._emit
+
+    def count(self, conv_id, event):
+        with self._lock:
+            return sum(1 for _, name in self.events.get(conv_id, ()) if name == event)
+
+    def wait(self, predicate, timeout):
+        """Wait until `predicate()` holds (checked whenever an event arrives); returns whether it did."""
+        deadline = time.perf_counter() + timeout
+        with self._changed:
+            while not predicate():
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    return False
+                self._changed.wait(min(remaining, 0.5))
+        return True
+
+    def times(self, conv_id, event):
+        with self._lock:
+            return [at for at, name in self.events.get(conv_id, ()) if name == event]
+
+
+def _conversation_config(index, turns):
+    return {
+        "bot1_name": f"Bot A{index}",
+        "bot1_model": "gpt-4o",
+        "bot2_name": f"Bot B{index}",
+        "bot2_model": "gpt-4o",
+        "initial_message": f"Let's talk about benchmark topic {index}.",
+        "conversation_title": f"Benchmark {index}",
+        "max_turns": turns,
+    }
+
+
+def _start_conversations(client, count, turns):
+    """Start `count` conversations; returns {conversation_id: start time}."""
+    started = {}
+    for index in range(count):
+        start = time.perf_counter()
+        response = client.emit("start_conversation", _conversation_config(index, turns), callback=True)
+        if not response or response.get("status") != "success":
+            raise RuntimeError(f"Could not start conversation {index}: {response}")
+        started[response["conversation_id"]] = start
+    return started
+
+
+def bench_conversations(count, turns, timeout):
+    """Run `count` conversations of `turns` replies each and time them."""
+    client = main.socketio.test_client(main.app)
+    with EventRecorder(main.socketio) as recorder:
+        began = time.perf_counter()
+        started = _start_conversations(client, count, turns)
+        finished = recorder.wait(
+            lambda: all(any(name in ("budget_exhausted", "error") for _, name in recorder.events.get(conv_id, ()))
+                        for conv_id in started),
+            timeout
+        )
+        elapsed = time.perf_counter() - began
+
+    turn_latencies = []
+    first_event = []
+    first_reply = []
+    completed_turns = 0
+    errors = 0
+    for conv_id, start in started.items():
+        messages = recorder.times(conv_id, "new_message")
+        errors += recorder.count(conv_id, "error")
+        if messages:
+            first_event.append(messages[0] - start)
+        if len(messages) > 1:
+            first_reply.append(messages[1] - start)
+        # 第一則是開場訊息，之後每則都是一個回合
+        turn_latencies.extend(later - earlier for earlier, later in zip(messages, messages[1:]))
+        completed_turns += max(0, len(messages) - 1)
+    client.disconnect()
+
+    return {
+        "conversations": count,
+        "turns_per_conversation": turns,
+        "finished": finished,
+        "errors": errors,
+        "elapsed_seconds": round(elapsed, 3),
+        "conversations_per_sec": round(count / elapsed, 3) if elapsed else 0.0,
+        "turns_per_sec": round(completed_turns / elapsed, 3) if elapsed else 0.0,
+        "turn_latency_ms": percentiles(turn_latencies),
+        "first_new_message_ms": percentiles(first_event),
+        "first_reply_ms": percentiles(first_reply),
+    }
+
+
+def bench_memory(count, turns, timeout):
+    """Memory held per active conversation after each has produced `turns` replies."""
+    client = main.socketio.test_client(main.app)
+    tracemalloc.start()
+    baseline_traced = tracemalloc.get_traced_memory()[0]
+    baseline_rss = rss_bytes()
+    with EventRecorder(main.socketio) as recorder:
+        # 回合數設得比量測點多，量測時對話仍在進行
+        started = _start_conversations(client, count, turns * 10)
+        reached = recorder.wait(
+            lambda: all(recorder.count(conv_id, "new_message") > turns for conv_id in started),
+            timeout
+        )
+        traced = tracemalloc.get_traced_memory()[0] - baseline_traced
+        rss = rss_bytes()
+        active = main.session_manager.active_count()
+        for conv_id in started:
+            main.session_manager.pause(conv_id)
+    tracemalloc.stop()
+    client.disconnect()
+
+    return {
+        "conversations": count,
+        "turns_before_measuring": turns,
+        "reached": reached,
+        "active_conversations": active,
+        "python_heap_bytes_per_conversation": traced // count,
+        "rss_bytes_per_conversation": (rss - baseline_rss) // count if rss is not None and baseline_rss else None,
+    }
+
+
+def _message_rows(conversation_id, count, content_length=300):
+    content = ("benchmark message " * (content_length // 18 + 1))[:content_length]
+    now = time.time()
+    timestamp = datetime.fromtimestamp(now).strftime("%Y-%m-%d %H:%M:%S")
+    return [
+        (conversation_id, timestamp, "Bot A" if index % 2 == 0 else "Bot B", content, 100, 50, 150, 0.001,
+         int(now * 1000) + index)
+        for index in range(count)
+    ]
+
+
+def bench_database(directory, rows, batch_size):
+    """Message insert throughput of DatabaseManager, one row per transaction and batched."""
+    db = DatabaseManager(db_path=os.path.join(directory, "write.db"))
+    db.init_db()
+    results = {}
+    try:
+        conversation_id = db.create_conversation("Bot A", "", "gpt-4o", "Bot B", "", "gpt-4o", "Benchmark")
+        single = _message_rows(conversation_id, rows)
+        start = time.perf_counter()
+        for row in single:
+            db.insert_messages([row])
+        elapsed = time.perf_counter() - start
+        results["single_rows_per_sec"] = round(rows / elapsed, 1)
+
+        batched = _message_rows(conversation_id, rows)
+        start = time.perf_counter()
+        for offset in range(0, rows, batch_size):
+            db.insert_messages(batched[offset:offset + batch_size])
+        elapsed = time.perf_counter() - start
+        results["batched_rows_per_sec"] = round(rows / elapsed, 1)
+        results["rows"] = rows
+        results["batch_size"] = batch_size
+    finally:
+        db.close()
+    return results
+
+
+def bench_export(messages):
+    """Time to export one conversation of `messages` messages in each format."""
+    conversation_id = main.db_manager.create_conversation("Bot A", "", "gpt-4o", "Bot B", "", "gpt-4o", "Export")
+    rows = _message_rows(conversation_id, messages)
+    for offset in range(0, messages, 1000):
+        main.db_manager.insert_messages(rows[offset:offset + 1000])
+
+    client = main.app.test_client()
+    results = {"messages": messages}
+    for format_type in EXPORT_FORMATS:
+        start = time.perf_counter()
+        response = client.get(f"/api/conversation/{conversation_id}/export?format={format_type}")
+        size = sum(len(chunk) for chunk in response.response) if response.is_streamed else len(response.data)
+        elapsed = time.perf_counter() - start
+        if response.status_code != 200:
+            results[format_type] = {"error": response.status_code}
+        else:
+            results[format_type] = {"seconds": round(elapsed, 4), "bytes": size}
+        response.close()
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the simulator server against the mock model backend")
+    parser.add_argument("--conversations", type=int, default=50, help="conversations run at once")
+    parser.add_argument("--turns", type=int, default=10, help="replies per conversation")
+    parser.add_argument("--runner", choices=("thread", "asyncio"), default=None,
+                        help="conversation runner (default: CONVERSATION_RUNNER)")
+    parser.add_argument("--memory-conversations", type=int, default=50, help="active conversations for the memory test")
+    parser.add_argument("--memory-turns", type=int, default=20, help="replies before measuring memory")
+    parser.add_argument("--db-rows", type=int, default=5000, help="rows inserted by the write test")
+    parser.add_argument("--db-batch", type=int, default=200, help="rows per transaction in the batched write test")
+    parser.add_argument("--export-messages", type=int, default=10000, help="messages in the exported conversation")
+    parser.add_argument("--timeout", type=float, default=300, help="seconds to wait for conversations")
+    parser.add_argument("--output", default=None, help="write the JSON results to this file")
+    parser.add_argument("--verbose", action="store_true", help="keep the server's console output")
+    return parser.parse_args(argv)
+
+
+def main_cli(argv=None):
+    args = parse_args(argv)
+    if args.runner:
+        main.CONVERSATION_RUNNER = args.runner
+    main.TURN_DELAY = 0
+    main.session_manager.max_sessions = 0
+
+    if not args.verbose:
+        # 伺服器的記錄輸出到 stderr，只保留警告與錯誤，避免蓋過結果
+        logging.getLogger().setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as directory:
+        main.db_manager.db_path = os.path.join(directory, "benchmark.db")
+        main.db_manager.init_db()
+
+        results = {
+            "started_at": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "runner": main.CONVERSATION_RUNNER,
+            "mock": {key: os.environ[key] for key in ("MOCK_LATENCY", "MOCK_TOKENS_PER_SECOND", "MOCK_SEED")},
+        }
+        results["conversations"] = bench_conversations(args.conversations, args.turns, args.timeout)
+        results["memory"] = bench_memory(args.memory_conversations, args.memory_turns, args.timeout)
+        results["database"] = bench_database(directory, args.db_rows, args.db_batch)
+        results["export"] = bench_export(args.export_messages)
+        main.db_manager.close()
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="UTF-8") as f:
+            f.write(text)
+    print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -1,75 +1,108 @@
 import sqlite3
 import os
 import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
 
+from database.connection_pool import ConnectionPool
+from database.write_behind import WriteBehindWriter
+from database.migrations import migrate
+from database.search import HIGHLIGHT_END, HIGHLIGHT_START, casefold, excerpt, first_marked, highlight, mark_terms
+from metrics import DB_OPERATION_SECONDS, timed
+
+logger = logging.getLogger(__name__)
+
 class DatabaseManager:
-    def __init__(self, db_path=None):
+    def __init__(self, db_path=None, pool_size=None, synchronous=None, usd_to_twd=31.5):
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._writer = None
+        self.pool_size = pool_size or int(os.getenv("DB_POOL_SIZE", "8"))
+        # WAL 模式下 NORMAL 只在 checkpoint 時 fsync，寫入不再每筆都等待磁碟
+        self.synchronous = synchronous or os.getenv("DB_SYNCHRONOUS", "NORMAL")
+        # 費用以新台幣儲存，換算美元時使用
+        self.usd_to_twd = usd_to_twd
         if db_path is None:
             # Use default path in the project directory
             self.db_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'conversations.db')
         else:
             self.db_path = db_path
     
+    @property
+    def db_path(self):
+        return self._db_path
+    
+    @db_path.setter
+    def db_path(self, value):
+        # 更換資料庫路徑時關閉舊的連線池
+        with self._pool_lock:
+            self._db_path = value
+            if self._pool is not None:
+                self._pool.close_all()
+                self._pool = None
+    
+    @property
+    def pool(self):
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ConnectionPool(self._db_path, max_size=self.pool_size, synchronous=self.synchronous,
+                                            functions={"casefold": (1, casefold)})
+            return self._pool
+    
     def get_connection(self):
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        return conn
+        """Borrow a pooled connection; use it as a context manager."""
+        return self.pool.connection()
+    
+    @contextmanager
+    def transaction(self):
+        """Borrow a pooled connection and commit (or roll back) when the block ends."""
+        with self.pool.connection() as conn:
+            try:
+                yield conn
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+    
+    def enable_write_behind(self, flush_interval=0.2, batch_size=200):
+        """Queue message inserts and commit them in batches on a background thread."""
+        if self._writer is None:
+            self._writer = WriteBehindWriter(self, flush_interval=flush_interval, batch_size=batch_size).start()
+        return self._writer
+    
+    def flush(self):
+        """Wait for queued message writes to reach the database.
+        
+        Raises WriteBehindError if queued messages had to be dropped.
+        """
+        if self._writer is not None:
+            self._writer.flush()
+    
+    def close(self):
+        """Write out queued messages and close every pooled connection."""
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.close_all()
+                self._pool = None
     
     def init_db(self):
-        """Initialize the database with necessary tables."""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        # Create conversations table
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS conversations (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp TEXT,
-            title TEXT,
-            bot1_name TEXT,
-            bot1_system_prompt TEXT,
-            bot1_model TEXT,
-            bot2_name TEXT,
-            bot2_system_prompt TEXT,
-            bot2_model TEXT,
-            total_tokens INTEGER DEFAULT 0,
-            total_cost REAL DEFAULT 0.0
-        )
-        ''')
-        
-        # Create messages table
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS messages (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            conversation_id INTEGER,
-            timestamp TEXT,
-            bot_name TEXT,
-            content TEXT,
-            prompt_tokens INTEGER DEFAULT 0,
-            completion_tokens INTEGER DEFAULT 0,
-            total_tokens INTEGER DEFAULT 0,
-            cost REAL DEFAULT 0.0,
-            FOREIGN KEY (conversation_id) REFERENCES conversations (id)
-        )
-        ''')
-        
-        # Check if title column exists, and add it if it doesn't
-        cursor.execute("PRAGMA table_info(conversations)")
-        columns = [column[1] for column in cursor.fetchall()]
-        
-        if 'title' not in columns:
-            cursor.execute('ALTER TABLE conversations ADD COLUMN title TEXT')
-        
-        conn.commit()
-        conn.close()
+        """Initialize the database by applying any pending schema migrations."""
+        with self.pool.connection() as conn:
+            migrate(conn)
     
+    @timed(DB_OPERATION_SECONDS, kind="write", operation="create_conversation")
     def create_conversation(self, bot1_name, bot1_system_prompt, bot1_model, 
-                           bot2_name, bot2_system_prompt, bot2_model, title=None):
-        """Create a new conversation and return its ID."""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+                           bot2_name, bot2_system_prompt, bot2_model, title=None, budget=None):
+        """Create a new conversation and return its ID.
         
+        `budget` is a dict of spend limits, stored as JSON.
+        """
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         
         # 如果没有提供自定义标题，则生成默认标题
@@ -79,94 +112,143 @@ class DatabaseManager:
             model_short = bot1_model.split('-')[-1] if '-' in bot1_model else bot1_model
             title = f"{short_timestamp}-{model_short}-{bot1_name}&{bot2_name}"
         
-        cursor.execute('''
-        INSERT INTO conversations 
-            (timestamp, title, bot1_name, bot1_system_prompt, bot1_model, 
-             bot2_name, bot2_system_prompt, bot2_model)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            timestamp, title, bot1_name, bot1_system_prompt, bot1_model,
-            bot2_name, bot2_system_prompt, bot2_model
-        ))
-        
-        # Get the ID of the inserted conversation
-        conversation_id = cursor.lastrowid
-        
-        conn.commit()
-        conn.close()
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+            INSERT INTO conversations 
+                (timestamp, title, bot1_name, bot1_system_prompt, bot1_model, 
+                 bot2_name, bot2_system_prompt, bot2_model, budget)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                timestamp, title, bot1_name, bot1_system_prompt, bot1_model,
+                bot2_name, bot2_system_prompt, bot2_model,
+                json.dumps(budget) if budget else None
+            ))
+            
+            # Get the ID of the inserted conversation
+            conversation_id = cursor.lastrowid
         
         return conversation_id
     
     def add_message(self, conversation_id, bot_name, content):
         """Add a new message to an existing conversation."""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        now = time.time()
+        timestamp = datetime.fromtimestamp(now).strftime("%Y-%m-%d %H:%M:%S")
         
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        
-        cursor.execute('''
-        INSERT INTO messages 
-            (conversation_id, timestamp, bot_name, content)
-        VALUES (?, ?, ?, ?)
-        ''', (conversation_id, timestamp, bot_name, content))
-        
-        conn.commit()
-        conn.close()
+        self.insert_messages([(conversation_id, timestamp, bot_name, content, 0, 0, 0, 0.0, int(now * 1000))])
     
     def add_message_with_tokens(self, conversation_id, bot_name, content, prompt_tokens, completion_tokens, cost):
-        """Add a new message to an existing conversation with token usage data."""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        """Add a new message to an existing conversation with token usage data.
         
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        With write-behind enabled the row is only queued, and this returns immediately.
+        """
+        now = time.time()
+        timestamp = datetime.fromtimestamp(now).strftime("%Y-%m-%d %H:%M:%S")
         total_tokens = prompt_tokens + completion_tokens
+        row = (conversation_id, timestamp, bot_name, content, prompt_tokens, completion_tokens, total_tokens, cost,
+               int(now * 1000))
         
-        cursor.execute('''
-        INSERT INTO messages 
-            (conversation_id, timestamp, bot_name, content, prompt_tokens, completion_tokens, total_tokens, cost)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (conversation_id, timestamp, bot_name, content, prompt_tokens, completion_tokens, total_tokens, cost))
-        
+        if self._writer is not None:
+            self._writer.add_message(row)
+        else:
+            self.insert_messages([row])
+    
+    @timed(DB_OPERATION_SECONDS, kind="write", operation="insert_messages")
+    def insert_messages(self, rows):
+        """Insert message rows and update conversation totals in one transaction.
+        
+        Each row is (conversation_id, timestamp, bot_name, content,
+        prompt_tokens, completion_tokens, total_tokens, cost, created_at), with
+        created_at in epoch milliseconds. The turn number is assigned from the
+        conversation's previous message.
+        """
+        totals = {}
+        bot_totals = {}
+        for row in rows:
+            conversation_total = totals.setdefault(row[0], [0, 0.0])
+            conversation_total[0] += row[6]
+            conversation_total[1] += row[7]
+            
+            bot_total = bot_totals.setdefault((row[0], row[2]), [0, 0, 0, 0.0, 0])
+            bot_total[0] += row[4]
+            bot_total[1] += row[5]
+            bot_total[2] += row[6]
+            bot_total[3] += row[7]
+            bot_total[4] += 1
+        
+        with self.transaction() as conn:
+            conn.executemany('''
+            INSERT INTO messages 
+                (conversation_id, timestamp, bot_name, content, prompt_tokens, completion_tokens, total_tokens, cost,
+                 created_at, turn)
+            VALUES (?1, ?2, ?3, ?4, ?5, ?6, ?7, ?8, ?9,
+                    COALESCE((SELECT turn FROM messages WHERE conversation_id = ?1 ORDER BY id DESC LIMIT 1), -1) + 1)
+            ''', rows)
+            
+            self._add_totals(conn, totals, bot_totals)
+
+    @timed(DB_OPERATION_SECONDS, kind="write", operation="add_usage")
+    def add_usage(self, conversation_id, bot_name, prompt_tokens, completion_tokens, cost):
+        """Add tokens spent outside a stored message (e.g. history summaries) to the totals."""
+        total_tokens = prompt_tokens + completion_tokens
+        with self.transaction() as conn:
+            self._add_totals(
+                conn,
+                {conversation_id: [total_tokens, cost]},
+                {(conversation_id, bot_name): [prompt_tokens, completion_tokens, total_tokens, cost, 0]}
+            )
+
+    @staticmethod
+    def _add_totals(conn, totals, bot_totals):
         # Update the conversation's total tokens and cost
-        cursor.execute('''
+        conn.executemany('''
         UPDATE conversations
         SET total_tokens = total_tokens + ?,
             total_cost = total_cost + ?
         WHERE id = ?
-        ''', (total_tokens, cost, conversation_id))
-        
-        conn.commit()
-        conn.close()
+        ''', [(tokens, cost, conversation_id) for conversation_id, (tokens, cost) in totals.items()])
+        
+        # Update the per-bot running totals in the same transaction
+        conn.executemany('''
+        INSERT INTO conversation_bot_stats 
+            (conversation_id, bot_name, prompt_tokens, completion_tokens, total_tokens, cost, message_count)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (conversation_id, bot_name) DO UPDATE SET
+            prompt_tokens = prompt_tokens + excluded.prompt_tokens,
+            completion_tokens = completion_tokens + excluded.completion_tokens,
+            total_tokens = total_tokens + excluded.total_tokens,
+            cost = cost + excluded.cost,
+            message_count = message_count + excluded.message_count
+        ''', [key + tuple(values) for key, values in bot_totals.items()])
 
+    @timed(DB_OPERATION_SECONDS, kind="read", operation="get_conversation_token_stats")
     def get_conversation_token_stats(self, conversation_id):
         """Get token usage statistics for a specific conversation."""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        # Get the total stats from conversation
-        cursor.execute('SELECT total_tokens, total_cost FROM conversations WHERE id = ?', (conversation_id,))
-        conv_row = cursor.fetchone()
-        
-        if not conv_row:
-            conn.close()
-            return None
-        
-        # Get bot specific stats
-        cursor.execute('''
-        SELECT bot_name, SUM(prompt_tokens) as prompt_tokens, 
-               SUM(completion_tokens) as completion_tokens, 
-               SUM(total_tokens) as total_tokens,
-               SUM(cost) as cost
-        FROM messages
-        WHERE conversation_id = ?
-        GROUP BY bot_name
-        ''', (conversation_id,))
+        self.flush()
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            
+            # Get the total stats from conversation
+            cursor.execute('SELECT total_tokens, total_cost FROM conversations WHERE id = ?', (conversation_id,))
+            conv_row = cursor.fetchone()
+            
+            if not conv_row:
+                return None
+            
+            # Get bot specific stats from the running totals
+            cursor.execute('''
+            SELECT bot_name, prompt_tokens, completion_tokens, total_tokens, cost
+            FROM conversation_bot_stats
+            WHERE conversation_id = ?
+            ORDER BY rowid
+            ''', (conversation_id,))
+            rows = cursor.fetchall()
         
         bot_stats = {}
-        for row in cursor.fetchall():
+        for row in rows:
             # 计算美元价格（从新台币反算）
             cost_twd = row['cost']
-            cost_usd = cost_twd / 31.5  # 使用TokenConfig.USD_TO_TWD常量的值
+            cost_usd = cost_twd / self.usd_to_twd
             
             bot_stats[row['bot_name']] = {
                 'prompt_tokens': row['prompt_tokens'],
@@ -176,11 +258,9 @@ class DatabaseManager:
                 'cost_usd': cost_usd  # 添加美元成本
             }
         
-        conn.close()
-        
         # 计算总的美元成本
         total_cost_twd = conv_row['total_cost']
-        total_cost_usd = total_cost_twd / 31.5  # 使用TokenConfig.USD_TO_TWD常量的值
+        total_cost_usd = total_cost_twd / self.usd_to_twd
         
         return {
             'total_tokens': conv_row['total_tokens'],
@@ -189,60 +269,298 @@ class DatabaseManager:
             'bot_stats': bot_stats
         }
 
+    @timed(DB_OPERATION_SECONDS, kind="read", operation="get_all_conversations")
     def get_all_conversations(self):
         """Get all conversations."""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT * FROM conversations ORDER BY timestamp DESC')
-        rows = cursor.fetchall()
+        self.flush()
+        with self.get_connection() as conn:
+            rows = conn.execute('SELECT * FROM conversations ORDER BY timestamp DESC').fetchall()
         
-        conversations = []
-        for row in rows:
-            conversation = dict(row)
-            conversations.append(conversation)
-        
-        conn.close()
-        return conversations
+        return [dict(row) for row in rows]
+    
+    @timed(DB_OPERATION_SECONDS, kind="read", operation="get_conversations_page")
+    def get_conversations_page(self, limit=50, before_id=None):
+        """Get one page of conversations, newest first, without the system prompts.
+        
+        Returns (conversations, next_before_id); next_before_id is None on the last page.
+        """
+        self.flush()
+        with self.get_connection() as conn:
+            rows = conn.execute('''
+            SELECT id, timestamp, title, bot1_name, bot1_model, bot2_name, bot2_model, total_tokens, total_cost
+            FROM conversations
+            WHERE id < ?
+            ORDER BY id DESC
+            LIMIT ?
+            ''', (before_id if before_id is not None else 2 ** 63 - 1, limit + 1)).fetchall()
+        
+        conversations = [dict(row) for row in rows[:limit]]
+        next_before_id = conversations[-1]['id'] if len(rows) > limit else None
+        return conversations, next_before_id
     
+    @timed(DB_OPERATION_SECONDS, kind="read", operation="get_conversation_by_id")
     def get_conversation_by_id(self, conversation_id):
         """Get a conversation by ID."""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        self.flush()
+        with self.get_connection() as conn:
+            row = conn.execute('SELECT * FROM conversations WHERE id = ?', (conversation_id,)).fetchone()
         
-        cursor.execute('SELECT * FROM conversations WHERE id = ?', (conversation_id,))
-        row = cursor.fetchone()
-        
-        if row:
-            conversation = dict(row)
-        else:
-            conversation = None
-        
-        conn.close()
-        return conversation
+        return dict(row) if row else None
     
+    @timed(DB_OPERATION_SECONDS, kind="read", operation="get_messages_by_conversation_id")
     def get_messages_by_conversation_id(self, conversation_id):
         """Get all messages for a specific conversation."""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT * FROM messages WHERE conversation_id = ? ORDER BY timestamp ASC', 
-                      (conversation_id,))
-        rows = cursor.fetchall()
-        
-        messages = []
-        for row in rows:
-            message = dict(row)
-            messages.append(message)
+        self.flush()
+        with self.get_connection() as conn:
+            rows = conn.execute('SELECT * FROM messages WHERE conversation_id = ? ORDER BY id ASC', 
+                                (conversation_id,)).fetchall()
         
-        conn.close()
-        return messages
+        return [dict(row) for row in rows]
+    
+    @timed(DB_OPERATION_SECONDS, kind="read", operation="get_conversation_history")
+    def get_conversation_history(self, conversation_id):
+        """Speaker and content of every message, oldest first, for rebuilding bot context.
+        
+        A single range scan over idx_messages_conversation_id, reading only the
+        columns needed.
+        """
+        self.flush()
+        with self.get_connection() as conn:
+            rows = conn.execute('''
+            SELECT bot_name, content FROM messages
+            WHERE conversation_id = ?
+            ORDER BY id ASC
+            ''', (conversation_id,)).fetchall()
+        
+        return [dict(row) for row in rows]
+    
+    @timed(DB_OPERATION_SECONDS, kind="read", operation="get_messages_page")
+    def get_messages_page(self, conversation_id, limit=200, before_id=None):
+        """Get the newest `limit` messages older than `before_id`, in chronological order.
+        
+        Returns (messages, next_before_id); next_before_id is None when there are no older messages.
+        """
+        self.flush()
+        with self.get_connection() as conn:
+            rows = conn.execute('''
+            SELECT * FROM messages
+            WHERE conversation_id = ? AND id < ?
+            ORDER BY id DESC
+            LIMIT ?
+            ''', (conversation_id, before_id if before_id is not None else 2 ** 63 - 1, limit + 1)).fetchall()
+        
+        messages = [dict(row) for row in rows[:limit]]
+        messages.reverse()
+        next_before_id = messages[0]['id'] if len(rows) > limit else None
+        return messages, next_before_id
+    
+    def iter_messages(self, conversation_ids=None, chunk_size=1000):
+        """Yield messages grouped by conversation, reading them in chunks of `chunk_size`.
+        
+        Each chunk borrows a pooled connection only while it is fetched, so a
+        slow consumer (e.g. a streaming download) never holds one open.
+        Conversations come in `conversation_ids` order, or in ID order when
+        `None` iterates over every stored message; messages within one
+        conversation are in id order.
+        """
+        self.flush()
+        if conversation_ids is None:
+            # 同時進行的對話的訊息 id 會交錯，以 (conversation_id, id) 作為游標依對話分組
+            yield from self._iter_message_chunks(
+                'SELECT * FROM messages WHERE (conversation_id, id) > (?, ?) '
+                'ORDER BY conversation_id, id LIMIT ?',
+                (), chunk_size, key=('conversation_id', 'id'))
+            return
+        
+        for conversation_id in conversation_ids:
+            yield from self._iter_message_chunks(
+                'SELECT * FROM messages WHERE conversation_id = ? AND id > ? ORDER BY id LIMIT ?',
+                (conversation_id,), chunk_size)
+    
+    def _iter_message_chunks(self, query, params, chunk_size, key=('id',)):
+        # 以 key 欄位作為游標逐批讀取（keyset pagination）
+        cursor = (0,) * len(key)
+        while True:
+            with DB_OPERATION_SECONDS.time(kind="read", operation="iter_messages"), self.get_connection() as conn:
+                rows = conn.execute(query, params + cursor + (chunk_size,)).fetchall()
+            for row in rows:
+                yield dict(row)
+            if len(rows) < chunk_size:
+                return
+            cursor = tuple(rows[-1][column] for column in key)
+    
+    @timed(DB_OPERATION_SECONDS, kind="read", operation="get_conversations_by_ids")
+    def get_conversations_by_ids(self, conversation_ids):
+        """Get full conversation records for the given IDs, in ID order."""
+        conversation_ids = list(conversation_ids)
+        if not conversation_ids:
+            return []
+        self.flush()
+        with self.get_connection() as conn:
+            rows = conn.execute('SELECT * FROM conversations WHERE id IN (SELECT value FROM json_each(?)) ORDER BY id',
+                                (json.dumps(conversation_ids),)).fetchall()
+        return [dict(row) for row in rows]
+    
+    # 搜尋結果的種類
+    SEARCH_KINDS = ("message", "conversation")
+    
+    @timed(DB_OPERATION_SECONDS, kind="read", operation="search")
+    def search(self, query, limit=20, offset=0, kinds=SEARCH_KINDS):
+        """Ranked full-text search over messages and conversation titles and system prompts.
+        
+        `query` is a database.search.SearchQuery. Results are ordered by BM25
+        relevance, so pages are addressed by offset rather than by id cursor.
+        Only the ids and ranks of matching rows are sorted; snippets and
+        records are read for the returned page alone. Without the FTS5
+        indexes (SQLite built without FTS5) every row is scanned instead, and
+        results come newest first with a `rank` of None.
+        Returns (results, next_offset); next_offset is None on the last page.
+        """
+        kinds = [kind for kind in self.SEARCH_KINDS if kind in kinds]
+        if not kinds:
+            return [], None
+        
+        self.flush()
+        with self.get_connection() as conn:
+            indexed = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'messages_fts'"
+            ).fetchone() is not None
+            hits = self._search_hits(conn, query, kinds, indexed, limit + 1, offset)
+            next_offset = offset + limit if len(hits) > limit else None
+            hits = hits[:limit]
+            
+            message_ids = [hit['id'] for hit in hits if hit['kind'] == 'message']
+            conversation_ids = [hit['id'] for hit in hits if hit['kind'] == 'conversation']
+            messages = self._search_messages(conn, query, message_ids, indexed) if message_ids else {}
+            conversations = self._search_conversations(conn, query, conversation_ids, indexed) if conversation_ids else {}
+        
+        results = []
+        for hit in hits:
+            if hit['kind'] == 'message':
+                row = messages.get(hit['id'])
+                if row is None:
+                    continue
+                results.append({
+                    'type': 'message',
+                    'message_id': row['id'],
+                    'conversation_id': row['conversation_id'],
+                    'title': row['title'],
+                    'bot_name': row['bot_name'],
+                    'timestamp': row['timestamp'],
+                    'snippet': highlight(excerpt(row['marked'])),
+                    'rank': hit['rank']
+                })
+            else:
+                row = conversations.get(hit['id'])
+                if row is None:
+                    continue
+                results.append({
+                    'type': 'conversation',
+                    'conversation_id': row['id'],
+                    'title': row['title'],
+                    'timestamp': row['timestamp'],
+                    'snippet': highlight(excerpt(row['marked'])),
+                    'rank': hit['rank']
+                })
+        return results, next_offset
     
+    # 對話的標題與系統提示合併成一段文字比對，中間以換行分隔
+    _CONVERSATION_TEXT = ("coalesce(conversations.title, '') || char(10) || "
+                          "coalesce(conversations.bot1_system_prompt, '') || char(10) || "
+                          "coalesce(conversations.bot2_system_prompt, '')")
+    
+    def _search_hits(self, conn, query, kinds, indexed, limit, offset):
+        """(kind, id, rank) of one page of matches, from the FTS5 indexes or a scan."""
+        branches = []
+        params = []
+        if indexed:
+            terms = query.filters
+            for kind, table, fts in (("message", "messages", "messages_fts"),
+                                     ("conversation", "conversations", "conversations_fts")):
+                if kind not in kinds:
+                    continue
+                sql = f"SELECT '{kind}' AS kind, {fts}.rowid AS id, {fts}.rank AS rank FROM {fts}"
+                conditions = [f"{fts} MATCH ?"]
+                if terms:
+                    sql += f" JOIN {table} ON {table}.id = {fts}.rowid"
+                    text = "messages.content" if kind == "message" else self._CONVERSATION_TEXT
+                    conditions += [f"instr(casefold({text}), ?)"] * len(terms)
+                branches.append(f"{sql} WHERE {' AND '.join(conditions)}")
+                params += [query.match] + terms
+            order = "rank"
+        else:
+            # 沒有索引: 每個詞都當成子字串過濾條件
+            terms = query.terms + query.filters
+            for kind, table in (("message", "messages"), ("conversation", "conversations")):
+                if kind not in kinds:
+                    continue
+                text = "messages.content" if kind == "message" else self._CONVERSATION_TEXT
+                conditions = [f"instr(casefold({text}), ?)"] * len(terms)
+                branches.append(f"SELECT '{kind}' AS kind, {table}.id AS id, NULL AS rank FROM {table} "
+                                f"WHERE {' AND '.join(conditions)}")
+                params += terms
+            order = "kind DESC, id DESC"
+        return conn.execute(
+            f"{' UNION ALL '.join(branches)} ORDER BY {order} LIMIT ? OFFSET ?",
+            params + [limit, offset]
+        ).fetchall()
+    
+    def _search_messages(self, conn, query, message_ids, indexed):
+        """Page records of matched messages, keyed by id, with the matches marked in `marked`."""
+        if indexed:
+            rows = conn.execute('''
+            SELECT messages.id, messages.conversation_id, messages.bot_name, messages.timestamp,
+                   conversations.title,
+                   highlight(messages_fts, 0, ?, ?) AS marked
+            FROM messages_fts
+            JOIN messages ON messages.id = messages_fts.rowid
+            LEFT JOIN conversations ON conversations.id = messages.conversation_id
+            WHERE messages_fts MATCH ? AND messages_fts.rowid IN (SELECT value FROM json_each(?))
+            ''', (HIGHLIGHT_START, HIGHLIGHT_END, query.match, json.dumps(message_ids))).fetchall()
+            return {row['id']: dict(row) for row in rows}
+        rows = conn.execute('''
+        SELECT messages.id, messages.conversation_id, messages.bot_name, messages.timestamp,
+               conversations.title, messages.content
+        FROM messages
+        LEFT JOIN conversations ON conversations.id = messages.conversation_id
+        WHERE messages.id IN (SELECT value FROM json_each(?))
+        ''', (json.dumps(message_ids),)).fetchall()
+        terms = query.terms + query.filters
+        return {row['id']: {**dict(row), 'marked': mark_terms(row['content'], terms)} for row in rows}
+    
+    def _search_conversations(self, conn, query, conversation_ids, indexed):
+        """Page records of matched conversations, keyed by id; `marked` is the first column that matched."""
+        if indexed:
+            rows = conn.execute('''
+            SELECT conversations.id, conversations.title, conversations.timestamp,
+                   highlight(conversations_fts, 0, ?, ?) AS marked_title,
+                   highlight(conversations_fts, 1, ?, ?) AS marked_bot1_prompt,
+                   highlight(conversations_fts, 2, ?, ?) AS marked_bot2_prompt
+            FROM conversations_fts
+            JOIN conversations ON conversations.id = conversations_fts.rowid
+            WHERE conversations_fts MATCH ? AND conversations_fts.rowid IN (SELECT value FROM json_each(?))
+            ''', (HIGHLIGHT_START, HIGHLIGHT_END) * 3 + (query.match, json.dumps(conversation_ids))).fetchall()
+            columns = [(row, (row['marked_title'], row['marked_bot1_prompt'], row['marked_bot2_prompt']))
+                       for row in rows]
+        else:
+            rows = conn.execute('''
+            SELECT id, title, timestamp, bot1_system_prompt, bot2_system_prompt
+            FROM conversations
+            WHERE id IN (SELECT value FROM json_each(?))
+            ''', (json.dumps(conversation_ids),)).fetchall()
+            terms = query.terms + query.filters
+            columns = [(row, [mark_terms(row[name], terms)
+                              for name in ('title', 'bot1_system_prompt', 'bot2_system_prompt')])
+                       for row in rows]
+        return {
+            row['id']: {'id': row['id'], 'title': row['title'], 'timestamp': row['timestamp'],
+                        'marked': first_marked(*marked)}
+            for row, marked in columns
+        }
+    
+    @timed(DB_OPERATION_SECONDS, kind="write", operation="update_bot_system_prompts")
     def update_bot_system_prompts(self, conversation_id, bot1_system_prompt=None, bot2_system_prompt=None):
         """Update the system prompts for one or both bots in a conversation."""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
         update_fields = []
         params = []
         
@@ -262,35 +580,24 @@ class DatabaseManager:
             '''
             params.append(conversation_id)
             
-            cursor.execute(query, params)
-            conn.commit()
-        
-        conn.close()
+            with self.transaction() as conn:
+                conn.execute(query, params)
     
+    @timed(DB_OPERATION_SECONDS, kind="write", operation="delete_conversation")
     def delete_conversation(self, conversation_id):
         """Delete a conversation and all its messages."""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
+        self.flush()
         try:
-            # Start a transaction
-            conn.execute('BEGIN TRANSACTION')
-            
-            # Delete all messages related to this conversation
-            cursor.execute('DELETE FROM messages WHERE conversation_id = ?', (conversation_id,))
-            
-            # Delete the conversation
-            cursor.execute('DELETE FROM conversations WHERE id = ?', (conversation_id,))
-            
-            # Commit the transaction
-            conn.execute('COMMIT')
+            with self.transaction() as conn:
+                # Delete all messages related to this conversation
+                conn.execute('DELETE FROM messages WHERE conversation_id = ?', (conversation_id,))
+                conn.execute('DELETE FROM conversation_bot_stats WHERE conversation_id = ?', (conversation_id,))
+                
+                # Delete the conversation
+                conn.execute('DELETE FROM conversations WHERE id = ?', (conversation_id,))
             success = True
         except Exception as e:
-            # Roll back in case of error
-            conn.execute('ROLLBACK')
-            print(f"Error deleting conversation: {e}")
+            logger.error("Error deleting conversation: %s", e)
             success = False
-        finally:
-            conn.close()
         
-        return success
\ No newline at end of file
+        return success
@@ -0,0 +1,232 @@
+"""Versioned schema migrations.
+
+The schema version is stored in SQLite's `PRAGMA user_version`. Each
+migration runs once, in its own transaction, in ascending version order.
+To change the schema, append a new function to MIGRATIONS; never edit one
+that has already shipped.
+"""
+import logging
+import sqlite3
+
+logger = logging.getLogger(__name__)
+
+
+def _initial_schema(cursor):
+    # Create conversations table
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS conversations (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp TEXT,
+        title TEXT,
+        bot1_name TEXT,
+        bot1_system_prompt TEXT,
+        bot1_model TEXT,
+        bot2_name TEXT,
+        bot2_system_prompt TEXT,
+        bot2_model TEXT,
+        total_tokens INTEGER DEFAULT 0,
+        total_cost REAL DEFAULT 0.0
+    )
+    ''')
+
+    # Create messages table
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS messages (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        conversation_id INTEGER,
+        timestamp TEXT,
+        bot_name TEXT,
+        content TEXT,
+        prompt_tokens INTEGER DEFAULT 0,
+        completion_tokens INTEGER DEFAULT 0,
+        total_tokens INTEGER DEFAULT 0,
+        cost REAL DEFAULT 0.0,
+        FOREIGN KEY (conversation_id) REFERENCES conversations (id)
+    )
+    ''')
+
+    # 早期版本的資料庫沒有 title 欄位
+    cursor.execute("PRAGMA table_info(conversations)")
+    columns = [column[1] for column in cursor.fetchall()]
+    if 'title' not in columns:
+        cursor.execute('ALTER TABLE conversations ADD COLUMN title TEXT')
+
+
+def _conversation_bot_stats(cursor):
+    # Per-bot running totals, kept up to date by DatabaseManager.insert_messages
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'conversation_bot_stats'")
+    bot_stats_exists = cursor.fetchone() is not None
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS conversation_bot_stats (
+        conversation_id INTEGER,
+        bot_name TEXT,
+        prompt_tokens INTEGER DEFAULT 0,
+        completion_tokens INTEGER DEFAULT 0,
+        total_tokens INTEGER DEFAULT 0,
+        cost REAL DEFAULT 0.0,
+        message_count INTEGER DEFAULT 0,
+        PRIMARY KEY (conversation_id, bot_name)
+    )
+    ''')
+
+    if not bot_stats_exists:
+        # 從既有訊息一次性回填統計資料
+        cursor.execute('''
+        INSERT INTO conversation_bot_stats
+            (conversation_id, bot_name, prompt_tokens, completion_tokens, total_tokens, cost, message_count)
+        SELECT conversation_id, bot_name, SUM(prompt_tokens), SUM(completion_tokens),
+               SUM(total_tokens), SUM(cost), COUNT(*)
+        FROM messages
+        GROUP BY conversation_id, bot_name
+        ORDER BY MIN(id)
+        ''')
+
+
+def _message_order_columns(cursor):
+    # Messages are read per conversation in insertion order
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_messages_conversation_id ON messages (conversation_id, id)')
+
+    # created_at: epoch milliseconds; turn: 0 for the initial message, then 1, 2, ...
+    cursor.execute('ALTER TABLE messages ADD COLUMN created_at INTEGER')
+    cursor.execute('ALTER TABLE messages ADD COLUMN turn INTEGER')
+
+    cursor.execute('''
+    UPDATE messages
+    SET created_at = CAST(strftime('%s', timestamp, 'utc') AS INTEGER) * 1000
+    WHERE timestamp IS NOT NULL
+    ''')
+
+    # 用暫存表計算每則訊息的回合數，避免對每列執行相關子查詢
+    cursor.execute('CREATE TEMP TABLE message_turns (id INTEGER PRIMARY KEY, turn INTEGER)')
+    cursor.execute('''
+    INSERT INTO message_turns (id, turn)
+    SELECT id, ROW_NUMBER() OVER (PARTITION BY conversation_id ORDER BY id) - 1
+    FROM messages
+    ''')
+    cursor.execute('UPDATE messages SET turn = (SELECT turn FROM message_turns WHERE message_turns.id = messages.id)')
+    cursor.execute('DROP TABLE message_turns')
+
+
+def _conversation_budget(cursor):
+    # JSON of the conversation's spend limits (engine.budget.ConversationBudget), NULL = unlimited
+    cursor.execute('ALTER TABLE conversations ADD COLUMN budget TEXT')
+
+
+def _fts_tokenizer(cursor):
+    """The best FTS5 tokenizer this SQLite offers, or None if it was built without FTS5."""
+    # trigram 可比對任意子字串，中文沒有空白分詞也能搜尋 (SQLite 3.34+)
+    for tokenizer in ("trigram", "unicode61"):
+        try:
+            cursor.execute(f"CREATE VIRTUAL TABLE temp.fts_probe USING fts5(x, tokenize='{tokenizer}')")
+        except sqlite3.OperationalError:
+            continue
+        cursor.execute("DROP TABLE temp.fts_probe")
+        return tokenizer
+    return None
+
+
+def _full_text_search(cursor):
+    # FTS5 indexes over message content and conversation titles and system prompts.
+    # External content tables: the text is stored once, in messages/conversations,
+    # and the triggers below keep the indexes in sync.
+    tokenizer = _fts_tokenizer(cursor)
+    if tokenizer is None:
+        # 沒有索引時 DatabaseManager.search 改為逐列掃描
+        logger.warning("SQLite %s was built without FTS5, search scans every message instead of using an index",
+                       sqlite3.sqlite_version)
+        return
+    if tokenizer != "trigram":
+        logger.warning("SQLite %s has no trigram tokenizer, full-text search only matches whole words",
+                       sqlite3.sqlite_version)
+
+    cursor.execute(f'''
+    CREATE VIRTUAL TABLE messages_fts USING fts5(
+        content,
+        content='messages', content_rowid='id', tokenize='{tokenizer}'
+    )
+    ''')
+    cursor.execute(f'''
+    CREATE VIRTUAL TABLE conversations_fts USING fts5(
+        title, bot1_system_prompt, bot2_system_prompt,
+        content='conversations', content_rowid='id', tokenize='{tokenizer}'
+    )
+    ''')
+
+    cursor.execute('''
+    CREATE TRIGGER messages_fts_insert AFTER INSERT ON messages BEGIN
+        INSERT INTO messages_fts (rowid, content) VALUES (new.id, new.content);
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER messages_fts_delete AFTER DELETE ON messages BEGIN
+        INSERT INTO messages_fts (messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER messages_fts_update AFTER UPDATE OF content ON messages BEGIN
+        INSERT INTO messages_fts (messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        INSERT INTO messages_fts (rowid, content) VALUES (new.id, new.content);
+    END
+    ''')
+
+    cursor.execute('''
+    CREATE TRIGGER conversations_fts_insert AFTER INSERT ON conversations BEGIN
+        INSERT INTO conversations_fts (rowid, title, bot1_system_prompt, bot2_system_prompt)
+        VALUES (new.id, new.title, new.bot1_system_prompt, new.bot2_system_prompt);
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER conversations_fts_delete AFTER DELETE ON conversations BEGIN
+        INSERT INTO conversations_fts (conversations_fts, rowid, title, bot1_system_prompt, bot2_system_prompt)
+        VALUES ('delete', old.id, old.title, old.bot1_system_prompt, old.bot2_system_prompt);
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER conversations_fts_update
+    AFTER UPDATE OF title, bot1_system_prompt, bot2_system_prompt ON conversations BEGIN
+        INSERT INTO conversations_fts (conversations_fts, rowid, title, bot1_system_prompt, bot2_system_prompt)
+        VALUES ('delete', old.id, old.title, old.bot1_system_prompt, old.bot2_system_prompt);
+        INSERT INTO conversations_fts (rowid, title, bot1_system_prompt, bot2_system_prompt)
+        VALUES (new.id, new.title, new.bot1_system_prompt, new.bot2_system_prompt);
+    END
+    ''')
+
+    # 為既有資料建立索引
+    cursor.execute("INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')")
+    cursor.execute("INSERT INTO conversations_fts (conversations_fts) VALUES ('rebuild')")
+
+
+MIGRATIONS = [
+    (1, "initial schema", _initial_schema),
+    (2, "per-bot running token totals", _conversation_bot_stats),
+    (3, "messages index, created_at and turn columns", _message_order_columns),
+    (4, "conversation budget column", _conversation_budget),
+    (5, "full-text search indexes", _full_text_search),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    """Apply every pending migration and return the resulting schema version."""
+    version = get_schema_version(conn)
+    for target_version, description, migration in MIGRATIONS:
+        if target_version <= version:
+            continue
+        cursor = conn.cursor()
+        cursor.execute("BEGIN")
+        try:
+            migration(cursor)
+            cursor.execute(f"PRAGMA user_version = {int(target_version)}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        logger.info("Applied database migration %d: %s", target_version, description)
+        version = target_version
+    return version
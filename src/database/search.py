@@ -0,0 +1,107 @@
+"""Turn user search text into an FTS5 query.
+
+The full-text tables use the trigram tokenizer, which matches any substring
+of three or more characters, in any language (Chinese text has no spaces to
+split words on). Shorter terms cannot use the index; they are returned
+separately and applied as substring filters to the rows the longer terms
+matched. Filters and the text they are compared with are both folded with
+`casefold`, which the database registers as an SQL function.
+
+On an SQLite built without FTS5 there are no indexes; every term is then
+applied as a substring filter and `mark_terms` stands in for highlight().
+"""
+import html
+import re
+
+# FTS5 trigram 索引只能比對三個字元以上的字串
+MIN_TERM_LENGTH = 3
+
+# highlight() 標記，回傳前換成 <mark>
+HIGHLIGHT_START = "\x02"
+HIGHLIGHT_END = "\x03"
+# 搜尋結果摘錄的長度 (字元數)；FTS5 snippet() 最多 64 個 token，trigram 下只有約 64 個字元
+EXCERPT_LENGTH = 200
+
+_TERM = re.compile(r'"([^"]+)"|(\S+)')
+_SPACE = re.compile(r"\s")
+
+
+class SearchQuery:
+    """`match` is the FTS5 expression; `filters` are case-folded terms too short for it.
+
+    `terms` are the case-folded terms of `match`, for searching without an index.
+    """
+
+    def __init__(self, match, filters, terms=()):
+        self.match = match
+        self.filters = filters
+        self.terms = list(terms)
+
+
+def parse_query(text):
+    """Parse search text: words (or "quoted phrases") that must all appear.
+
+    Raises ValueError if no term is at least MIN_TERM_LENGTH characters long.
+    """
+    terms = [phrase or word for phrase, word in _TERM.findall(text or "")]
+    indexed = [term for term in terms if len(term) >= MIN_TERM_LENGTH]
+    if not indexed:
+        raise ValueError(f"Search needs at least one term of {MIN_TERM_LENGTH} or more characters")
+    # 每個詞都以雙引號包成字串，使用者輸入的 AND、*、: 等不會被當成 FTS5 語法
+    match = " AND ".join('"{}"'.format(term.replace('"', '""')) for term in indexed)
+    filters = [casefold(term) for term in terms if len(term) < MIN_TERM_LENGTH]
+    return SearchQuery(match, filters, [casefold(term) for term in indexed])
+
+
+def casefold(text):
+    """Unicode case folding for substring filters, in Python and as the SQL function casefold()."""
+    return text.casefold() if text is not None else None
+
+
+def excerpt(marked, length=EXCERPT_LENGTH):
+    """Cut about `length` characters of highlight() output around its first match.
+
+    Cuts fall on whitespace where there is some nearby, so words are not
+    split (text without spaces, such as Chinese, is cut where it falls), and
+    never inside a match.
+    """
+    if marked is None or len(marked) <= length:
+        return marked
+    first = max(0, marked.find(HIGHLIGHT_START))
+    # 匹配前保留約四分之一的上下文
+    end = min(len(marked), max(0, first - length // 4) + length)
+    start = max(0, end - length)
+    if marked.count(HIGHLIGHT_START, start, end) > marked.count(HIGHLIGHT_END, start, end):
+        end = marked.index(HIGHLIGHT_END, end) + 1
+    if start > 0 and not marked[start - 1].isspace():
+        space = _SPACE.search(marked, start, first)
+        if space:
+            start = space.end()
+    if end < len(marked) and not marked[end].isspace():
+        keep = max(first, marked.rfind(HIGHLIGHT_END, start, end) + 1)
+        spaces = [match.start() for match in _SPACE.finditer(marked, keep, end)]
+        if spaces:
+            end = spaces[-1]
+    text = marked[start:end].strip()
+    return ("…" if start > 0 else "") + text + ("…" if end < len(marked) else "")
+
+
+def mark_terms(text, terms):
+    """Mark every case-insensitive occurrence of `terms` in `text` like highlight() does."""
+    if not text or not terms:
+        return text
+    pattern = "|".join(re.escape(term) for term in sorted(set(terms), key=len, reverse=True))
+    return re.sub(pattern, lambda match: f"{HIGHLIGHT_START}{match.group(0)}{HIGHLIGHT_END}", text,
+                  flags=re.IGNORECASE)
+
+
+def first_marked(*texts):
+    """The first highlight() output containing a match, e.g. the column a conversation matched in."""
+    return next((text for text in texts if text and HIGHLIGHT_START in text), texts[0] if texts else None)
+
+
+def highlight(snippet):
+    """HTML-escape a snippet and mark the matched text with <mark>."""
+    if snippet is None:
+        return None
+    return html.escape(snippet).replace(HIGHLIGHT_START, "<mark>").replace(HIGHLIGHT_END, "</mark>")
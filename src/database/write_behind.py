@@ -0,0 +1,178 @@
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# 寫入失敗的資料最多嘗試幾次，以及兩次重試之間的秒數
+MAX_WRITE_ATTEMPTS = 5
+RETRY_INTERVAL = 0.2
+
+
+class WriteBehindError(RuntimeError):
+    """Queued message rows were dropped after failing MAX_WRITE_ATTEMPTS times."""
+
+
+class _FlushRequest:
+    def __init__(self):
+        self.done = threading.Event()
+        self.error = None
+
+
+_STOP = object()
+
+
+class WriteBehindWriter:
+    """Collects message inserts and writes them in batches on a background thread.
+
+    Rows are committed in one transaction once `batch_size` rows are queued or
+    `flush_interval` seconds have passed since the first queued row, whichever
+    comes first. `flush()` blocks until everything queued so far is on disk.
+
+    If a batch fails, its rows are written one at a time. Rows that still
+    fail are retried with later batches, and later rows of the same
+    conversation wait behind them so turns stay in order. After
+    MAX_WRITE_ATTEMPTS a row is dropped, and the next flush() raises
+    WriteBehindError.
+    """
+
+    def __init__(self, db_manager, flush_interval=0.2, batch_size=200):
+        self.db_manager = db_manager
+        self.flush_interval = flush_interval
+        self.batch_size = max(1, int(batch_size))
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="db-write-behind", daemon=True)
+        self._closed = False
+        # 上次 flush 之後丟棄的資料筆數與最後的錯誤
+        self._dropped = 0
+        self._last_error = None
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def add_message(self, row):
+        """Queue a message row (see DatabaseManager.insert_messages) for writing."""
+        if self._closed:
+            raise RuntimeError("Write-behind writer is closed")
+        self._queue.put(row)
+
+    def flush(self, timeout=None):
+        """Wait until every row queued before this call has been committed.
+
+        Returns False on timeout. Raises WriteBehindError if rows were
+        dropped since the previous flush.
+        """
+        if self._closed or threading.current_thread() is self._thread:
+            return True
+        request = _FlushRequest()
+        self._queue.put(request)
+        if not request.done.wait(timeout):
+            return False
+        if request.error is not None:
+            raise request.error
+        return True
+
+    def close(self):
+        """Write out everything still queued and stop the writer thread."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def _run(self):
+        # [row, attempts]: 寫入失敗、等待重試的資料
+        retry = []
+        while True:
+            batch = []
+            waiters = []
+            stop = False
+
+            try:
+                # 有待重試的資料時不要一直等新資料
+                item = self._queue.get(timeout=RETRY_INTERVAL if retry else None)
+            except queue.Empty:
+                item = None
+            deadline = time.monotonic() + self.flush_interval
+            while item is not None:
+                if item is _STOP:
+                    stop = True
+                    break
+                if isinstance(item, _FlushRequest):
+                    waiters.append(item)
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+
+            if stop:
+                # 關閉前把佇列中剩下的資料全部寫入
+                while True:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if isinstance(item, _FlushRequest):
+                        waiters.append(item)
+                    elif item is not _STOP:
+                        batch.append(item)
+
+            # 先寫待重試的資料，保持寫入順序
+            retry = self._write(retry + [[row, 0] for row in batch])
+            if waiters or stop:
+                # flush() 與 close() 要等到重試成功或放棄
+                while retry:
+                    time.sleep(RETRY_INTERVAL)
+                    retry = self._write(retry)
+                error = None
+                if self._dropped:
+                    error = WriteBehindError(
+                        f"{self._dropped} message rows could not be written: {self._last_error}")
+                    self._dropped = 0
+                for waiter in waiters:
+                    waiter.error = error
+                    waiter.done.set()
+
+            if stop:
+                return
+
+    def _write(self, entries):
+        """Insert the rows of [row, attempts] entries; return the entries to retry."""
+        if not entries:
+            return []
+        try:
+            self.db_manager.insert_messages([row for row, _ in entries])
+            return []
+        except Exception as e:
+            logger.warning("Error writing message batch (%d rows), writing them one at a time: %s", len(entries), e)
+
+        retry = []
+        blocked = set()
+        for entry in entries:
+            conversation_id = entry[0][0]
+            if conversation_id in blocked:
+                # 同一個對話較早的訊息還沒寫入，回合編號要依序指定
+                retry.append(entry)
+                continue
+            try:
+                self.db_manager.insert_messages([entry[0]])
+            except Exception as e:
+                entry[1] += 1
+                if entry[1] < MAX_WRITE_ATTEMPTS:
+                    retry.append(entry)
+                    blocked.add(conversation_id)
+                    continue
+                logger.error("Dropping a message of conversation %s after %d failed writes: %s",
+                             conversation_id, entry[1], e)
+                self._dropped += 1
+                self._last_error = e
+        return retry
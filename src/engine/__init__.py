@@ -0,0 +1 @@
+# This file makes the engine directory a Python package
\ No newline at end of file
@@ -0,0 +1,146 @@
+import asyncio
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from engine.session_manager import ConversationSession
+
+
+def load_batch_configs(lines, default_max_turns=10):
+    """Parse JSONL bot configs. Blank lines and `#` comments are skipped."""
+    configs = []
+    for line_number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        try:
+            config = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Line {line_number}: invalid JSON ({e})")
+        if not isinstance(config, dict):
+            raise ValueError(f"Line {line_number}: expected a JSON object")
+        config.setdefault('max_turns', default_max_turns)
+        configs.append(config)
+    return configs
+
+
+class BatchJob:
+    """Progress and throughput of one batch of headless conversations."""
+
+    def __init__(self, configs, concurrency):
+        self.id = uuid.uuid4().hex[:12]
+        self.configs = configs
+        self.concurrency = max(1, int(concurrency))
+        self.status = "pending"
+        self.conversation_ids = []
+        self.completed = 0
+        self.failed = 0
+        self.turns = 0
+        self.tokens = 0
+        self.errors = []
+        self.started_at = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    def record(self, session):
+        # run_batch_threaded 由多個執行緒同時回報
+        with self._lock:
+            self.turns += session.turns
+            self.tokens += session.total_tokens
+            if session.last_error:
+                self.failed += 1
+                self.errors.append({'conversation_id': session.conversation_id, 'error': session.last_error})
+            else:
+                self.completed += 1
+
+    def summary(self):
+        end = self.finished_at or time.time()
+        elapsed = end - self.started_at if self.started_at else 0.0
+        return {
+            'batch_id': self.id,
+            'status': self.status,
+            'total': len(self.configs),
+            'completed': self.completed,
+            'failed': self.failed,
+            'concurrency': self.concurrency,
+            'conversation_ids': self.conversation_ids,
+            'turns': self.turns,
+            'tokens': self.tokens,
+            'elapsed_seconds': round(elapsed, 3),
+            'turns_per_sec': round(self.turns / elapsed, 3) if elapsed else 0.0,
+            'tokens_per_sec': round(self.tokens / elapsed, 3) if elapsed else 0.0,
+            'errors': self.errors
+        }
+
+
+async def run_batch(job, create_conversation, run_conversation):
+    """Run every config of the job with at most `job.concurrency` at a time.
+
+    `create_conversation(config)` stores the conversation and returns its ID;
+    `run_conversation(session, config)` is the coroutine that drives it.
+    """
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(job.concurrency)
+
+    async def run_one(config):
+        async with semaphore:
+            conv_id = await loop.run_in_executor(None, create_conversation, config)
+            job.conversation_ids.append(conv_id)
+            session = ConversationSession(conv_id)
+            session.resume()
+            try:
+                await run_conversation(session, config)
+            except Exception as e:
+                session.last_error = str(e)
+            finally:
+                session.pause()
+            job.record(session)
+
+    job.status = "running"
+    job.started_at = time.time()
+    try:
+        await asyncio.gather(*(run_one(config) for config in job.configs))
+        job.status = "finished"
+    except Exception:
+        job.status = "failed"
+        raise
+    finally:
+        job.finished_at = time.time()
+    return job.summary()
+
+
+def run_batch_threaded(job, create_conversation, run_conversation):
+    """Blocking counterpart of run_batch for the thread runner.
+
+    `run_conversation(session, config)` is a plain function; up to
+    `job.concurrency` conversations run at once on worker threads (green
+    threads once eventlet or gevent has patched the standard library).
+    """
+    def run_one(config):
+        conv_id = create_conversation(config)
+        job.conversation_ids.append(conv_id)
+        session = ConversationSession(conv_id)
+        session.resume()
+        try:
+            run_conversation(session, config)
+        except Exception as e:
+            session.last_error = str(e)
+        finally:
+            session.pause()
+        job.record(session)
+
+    job.status = "running"
+    job.started_at = time.time()
+    try:
+        with ThreadPoolExecutor(max_workers=job.concurrency, thread_name_prefix=f"batch-{job.id}") as executor:
+            for future in [executor.submit(run_one, config) for config in job.configs]:
+                future.result()
+        job.status = "finished"
+    except Exception:
+        job.status = "failed"
+        raise
+    finally:
+        job.finished_at = time.time()
+    return job.summary()
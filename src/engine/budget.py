@@ -0,0 +1,56 @@
+def _limit(value, cast):
+    # 表單與環境變數傳來的是字串，空字串或 0 表示不限制
+    if value in (None, ''):
+        return None
+    value = cast(float(value))
+    return value if value > 0 else None
+
+
+class ConversationBudget:
+    """Hard limits on what one conversation may spend.
+
+    Every limit is optional (None = unlimited). The conversation loop checks
+    the projected usage after the next turn, so a turn that would go over a
+    limit is never sent.
+    """
+
+    LIMITS = ('max_turns', 'max_tokens', 'max_cost_twd', 'max_cost_usd')
+
+    def __init__(self, max_turns=None, max_tokens=None, max_cost_twd=None, max_cost_usd=None):
+        self.max_turns = max_turns
+        self.max_tokens = max_tokens
+        self.max_cost_twd = max_cost_twd
+        self.max_cost_usd = max_cost_usd
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build a budget from a config or stored dict; missing, empty or zero values mean no limit."""
+        data = data or {}
+        return cls(
+            max_turns=_limit(data.get('max_turns'), int),
+            max_tokens=_limit(data.get('max_tokens'), int),
+            max_cost_twd=_limit(data.get('max_cost_twd'), float),
+            max_cost_usd=_limit(data.get('max_cost_usd'), float)
+        )
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.LIMITS if getattr(self, name) is not None}
+
+    @property
+    def limits_spend(self):
+        """True if a token or cost limit is set, i.e. turns need a cost estimate."""
+        return any(value is not None for value in (self.max_tokens, self.max_cost_twd, self.max_cost_usd))
+
+    def exceeded(self, turns=0, tokens=0, cost_twd=0.0, cost_usd=0.0):
+        """Return the name of the first limit the projected usage would exceed, or None."""
+        projected = {
+            'max_turns': turns,
+            'max_tokens': tokens,
+            'max_cost_twd': float(cost_twd),
+            'max_cost_usd': float(cost_usd)
+        }
+        for name in self.LIMITS:
+            limit = getattr(self, name)
+            if limit is not None and projected[name] > limit:
+                return name
+        return None
@@ -0,0 +1,157 @@
+import uuid
+
+from engine.history import FullHistoryPolicy
+from llm.models import get_capabilities
+
+
+class BotConfig:
+    """Name, system prompt and model of one side of the conversation."""
+
+    def __init__(self, name, system_prompt, model):
+        self.name = name
+        self.system_prompt = system_prompt
+        self.model = model
+
+
+class Turn:
+    """The request to send for a single reply."""
+
+    def __init__(self, responding_bot, model, messages, next_bot):
+        self.responding_bot = responding_bot
+        self.model = model
+        self.messages = messages
+        self.next_bot = next_bot
+        # Conversation messages the history policy left out of this request
+        self.dropped = 0
+        self.summarized = 0
+        self.user_tokens = 0
+        # 讓前端把串流片段與最後的完整訊息對應起來
+        self.stream_id = uuid.uuid4().hex[:12]
+
+
+class ConversationState:
+    """Chat histories of both bots and whose turn it is."""
+
+    def __init__(self, conversation_id, bot1, bot2, initial_message, is_resuming=False,
+                 history_policy=None, count_message_tokens=None):
+        self.conversation_id = conversation_id
+        self.bots = {"bot1": bot1, "bot2": bot2}
+        self.history_policy = history_policy or FullHistoryPolicy()
+        # count_message_tokens(message, model) -> int; each message is counted once
+        self.count_message_tokens = count_message_tokens or (lambda message, model: 0)
+
+        # Initialize conversation history for each bot - different handling based on model
+        # Models without system messages (o1-mini) get the system prompt prepended to the user message instead
+        self.histories = {key: self._initial_history(bot) for key, bot in self.bots.items()}
+        self.token_counts = {
+            key: [self.count_message_tokens(message, self.bots[key].model) for message in history]
+            for key, history in self.histories.items()
+        }
+        self.summaries = {"bot1": None, "bot2": None}
+
+        # Start with initial message from Bot 1
+        self.current_message = initial_message
+        self.current_bot = "bot1" if not is_resuming else "bot2"  # 如果是恢復對話，從bot2開始
+
+    @staticmethod
+    def _initial_history(bot):
+        if not get_capabilities(bot.model).system_messages:
+            return []
+        return [{"role": "system", "content": bot.system_prompt}]
+
+    def next_turn(self):
+        """Build the request for the bot that replies to the current message."""
+        next_bot = "bot2" if self.current_bot == "bot1" else "bot1"
+        bot = self.bots[next_bot]
+
+        if not get_capabilities(bot.model).system_messages:
+            # Prepend the system prompt to the user message; no history is sent
+            system_prompt_prefix = f"{bot.system_prompt}\n\n"
+            enhanced_message = f"{system_prompt_prefix}User message: {self.current_message}"
+            return Turn(bot.name, bot.model, [{"role": "user", "content": enhanced_message}], next_bot)
+
+        user_message = {"role": "user", "content": self.current_message}
+        user_tokens = self.count_message_tokens(user_message, bot.model)
+        messages, dropped = self.history_policy.select(
+            self.histories[next_bot] + [user_message],
+            self.token_counts[next_bot] + [user_tokens],
+            bot.model,
+            summary=self.summaries[next_bot]
+        )
+
+        turn = Turn(bot.name, bot.model, messages, next_bot)
+        turn.dropped = dropped
+        turn.user_tokens = user_tokens
+        return turn
+
+    def restore(self, messages):
+        """Rebuild both histories from stored messages (dicts with bot_name and content), oldest first.
+
+        The first message is bot1's opening line. Each later message is a
+        reply to the one before it, owned by the bot whose name it carries;
+        when both bots share a name, turns simply alternate.
+        """
+        if not messages:
+            return
+        owners = [self._owner(index, message) for index, message in enumerate(messages)]
+        for index in range(1, len(messages)):
+            key = owners[index]
+            model = self.bots[key].model
+            for role, message in (("user", messages[index - 1]), ("assistant", messages[index])):
+                entry = {"role": role, "content": message["content"]}
+                self.histories[key].append(entry)
+                self.token_counts[key].append(self._count(entry, model))
+
+        # 最後一則訊息的發言者決定下一個回應的機器人
+        self.current_message = messages[-1]["content"]
+        self.current_bot = owners[-1]
+
+    def _count(self, message, model):
+        # 不送歷史紀錄的模型不必計算 token
+        if not get_capabilities(model).system_messages:
+            return 0
+        return self.count_message_tokens(message, model)
+
+    def _owner(self, index, message):
+        if index == 0:
+            return "bot1"
+        bot1_name, bot2_name = self.bots["bot1"].name, self.bots["bot2"].name
+        if bot1_name != bot2_name:
+            if message["bot_name"] == bot1_name:
+                return "bot1"
+            if message["bot_name"] == bot2_name:
+                return "bot2"
+        return "bot2" if index % 2 else "bot1"
+
+    def summary_request(self, turn):
+        """Messages for summarizing what `turn` left out, or None if no summary is due."""
+        summary_request = getattr(self.history_policy, "summary_request", None)
+        if summary_request is None or not turn.dropped:
+            return None
+        request = summary_request(self.histories[turn.next_bot], turn.dropped, self.summaries[turn.next_bot])
+        if request is None:
+            return None
+        messages, turn.summarized = request
+        return messages
+
+    def apply_summary(self, turn, summary):
+        """Replace the messages summarized for `turn` with `summary`; call next_turn() again afterwards."""
+        key = turn.next_bot
+        history = self.histories[key]
+        pinned = 0
+        while pinned < len(history) and history[pinned]["role"] == "system":
+            pinned += 1
+        del history[pinned:pinned + turn.summarized]
+        del self.token_counts[key][pinned:pinned + turn.summarized]
+        self.summaries[key] = summary
+
+    def record_reply(self, turn, reply):
+        """Append the exchange to the responder's history and hand the turn over."""
+        history = self.histories[turn.next_bot]
+        history.append({"role": "user", "content": self.current_message})
+        history.append({"role": "assistant", "content": reply})
+        self.token_counts[turn.next_bot].extend([turn.user_tokens, self._count(history[-1], turn.model)])
+
+        # Update current message and bot for next iteration
+        self.current_message = reply
+        self.current_bot = turn.next_bot
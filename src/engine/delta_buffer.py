@@ -0,0 +1,36 @@
+import time
+
+
+class DeltaBuffer:
+    """Coalesces the streamed deltas of one reply into fewer, larger frames.
+
+    Deltas are joined and sent at most once every `interval` seconds; call
+    flush() when the reply is complete to send what is left. An interval of
+    0 sends every delta as it arrives. `send(text, reset)` delivers a frame.
+    """
+
+    def __init__(self, send, interval=0.05):
+        self.send = send
+        self.interval = interval
+        self.pending = []
+        self.sent_at = 0.0
+
+    def __call__(self, delta, reset=False):
+        if reset:
+            # 重試時丟掉還沒送出的內容，並立即通知前端清除
+            self.pending = []
+            self._send("", True)
+            return
+        self.pending.append(delta)
+        if time.monotonic() - self.sent_at >= self.interval:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            text = "".join(self.pending)
+            self.pending = []
+            self._send(text, False)
+
+    def _send(self, text, reset):
+        self.sent_at = time.monotonic()
+        self.send(text, reset)
@@ -0,0 +1,118 @@
+"""History policies: which part of a bot's chat history is sent with each request.
+
+A policy receives the bot's full history (system prompt first, newest user
+message last) with a parallel list of per-message token counts, and returns
+the messages to send plus how many conversation messages it left out.
+"""
+
+SUMMARY_PROMPT = (
+    "Summarize the conversation so far in a few sentences. Keep the facts, names, "
+    "decisions and open questions needed to continue it naturally."
+)
+
+
+def _pinned_count(history):
+    count = 0
+    while count < len(history) and history[count]["role"] == "system":
+        count += 1
+    return count
+
+
+class FullHistoryPolicy:
+    """Send the whole history every time."""
+
+    name = "full"
+
+    def select(self, history, token_counts, model, summary=None):
+        return list(history), 0
+
+
+class SlidingWindowPolicy:
+    """Keep the system prompt pinned and send as many recent messages as fit the budget.
+
+    The budget is the model's input limit (`context_limit_for(model)`, e.g.
+    litellm's max_input_tokens) minus `reserve_tokens` for the reply,
+    optionally capped by `max_tokens` to bound prompt cost.
+    """
+
+    name = "window"
+
+    def __init__(self, context_limit_for, reserve_tokens=1000, max_tokens=0):
+        self.context_limit_for = context_limit_for
+        self.reserve_tokens = reserve_tokens
+        self.max_tokens = max_tokens
+
+    def budget(self, model):
+        budget = self.context_limit_for(model) - self.reserve_tokens
+        if self.max_tokens:
+            budget = min(budget, self.max_tokens)
+        return budget
+
+    def select(self, history, token_counts, model, summary=None):
+        pinned = _pinned_count(history)
+        summary_message = None
+        used = sum(token_counts[:pinned]) + token_counts[-1]
+        if summary:
+            summary_message = {"role": "system", "content": f"Summary of the earlier conversation: {summary}"}
+            # 摘要長度以字元粗估，避免每回合再編碼一次
+            used += len(summary) // 3 + 8
+
+        # The newest message is always sent; walk back while older ones still fit
+        budget = self.budget(model)
+        start = len(history) - 1
+        while start - 1 >= pinned and used + token_counts[start - 1] <= budget:
+            start -= 1
+            used += token_counts[start]
+
+        # 不要從 assistant 訊息開始，保持 user/assistant 成對
+        while start < len(history) - 1 and history[start]["role"] != "user":
+            start += 1
+
+        messages = history[:pinned] + ([summary_message] if summary_message else []) + history[start:]
+        return messages, start - pinned
+
+
+class SummarizingPolicy(SlidingWindowPolicy):
+    """Sliding window that folds messages falling out of it into a rolling summary.
+
+    Once `interval` messages have been left out, the runner asks the model to
+    summarize them (see `summary_request`); the summary is then sent after
+    the system prompt and the summarized messages are discarded.
+    """
+
+    name = "summary"
+
+    def __init__(self, context_limit_for, reserve_tokens=1000, max_tokens=0, interval=10):
+        super().__init__(context_limit_for, reserve_tokens=reserve_tokens, max_tokens=max_tokens)
+        self.interval = max(2, int(interval))
+
+    def summary_request(self, history, dropped, summary=None):
+        """Return (messages, count) to summarize the oldest `count` left-out messages, or None if not due.
+
+        At most `4 * interval` messages are folded in at once, so a long
+        resumed history is summarized over several turns instead of in one
+        oversized request.
+        """
+        if dropped < self.interval:
+            return None
+        pinned = _pinned_count(history)
+        count = min(dropped, self.interval * 4)
+        transcript = "\n".join(f"{m['role']}: {m['content']}" for m in history[pinned:pinned + count])
+        content = f"New messages:\n{transcript}"
+        if summary:
+            content = f"Previous summary: {summary}\n\n{content}"
+        return [
+            {"role": "system", "content": SUMMARY_PROMPT},
+            {"role": "user", "content": content}
+        ], count
+
+
+def create_history_policy(name, context_limit_for, reserve_tokens=1000, max_tokens=0, summary_interval=10):
+    """Build a policy from its configured name ("full", "window" or "summary")."""
+    if name == "full":
+        return FullHistoryPolicy()
+    if name == "summary":
+        return SummarizingPolicy(context_limit_for, reserve_tokens, max_tokens, interval=summary_interval)
+    if name == "window":
+        return SlidingWindowPolicy(context_limit_for, reserve_tokens, max_tokens)
+    raise ValueError(f"Unknown history policy: {name}")
@@ -0,0 +1,203 @@
+"""Model pricing from litellm's model_prices_and_context_window.json.
+
+The price list is parsed once into a PricingTable, an index keyed by
+normalized model name. ModelPricing serves lookups from the current table
+and swaps in a new one when a background refresh succeeds. It never
+downloads on a request thread and falls back to the last downloaded copy or
+to the snapshot bundled next to this module, so it also works offline.
+"""
+import json
+import logging
+import os
+import threading
+import time
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+PRICING_URL = "https://raw.githubusercontent.com/BerriAI/litellm/main/model_prices_and_context_window.json"
+SNAPSHOT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "model_prices.json")
+
+PROVIDER_PREFIXES = ("openai/", "github/", "google_genai/", "deepseek/")
+MODEL_SUFFIXES = ("-tuned",)
+
+# 常見的簡寫對應到價格表中的名稱
+MODEL_ALIASES = {
+    "gpt4": "gpt-4",
+    "gpt4o": "gpt-4o",
+    "gpt-3.5": "gpt-3.5-turbo",
+    "gpt-35-turbo": "gpt-3.5-turbo",
+}
+
+
+def normalize_model_name(name):
+    """Strip provider prefixes and suffixes and lowercase the name."""
+    name = name.lower().strip()
+    for prefix in PROVIDER_PREFIXES:
+        if name.startswith(prefix):
+            name = name[len(prefix):]
+    for suffix in MODEL_SUFFIXES:
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+    return name
+
+
+class PricingTable:
+    """Price entries indexed by normalized model name."""
+
+    def __init__(self, data, aliases=None):
+        self.entries = {}
+        for key, entry in data.items():
+            if not isinstance(entry, dict) or "input_cost_per_token" not in entry:
+                continue  # e.g. litellm's "sample_spec"
+            name = normalize_model_name(key)
+            # 帶前綴的重複項目 (例如 openai/gpt-4o) 不覆蓋原本的名稱
+            if name not in self.entries or key.lower() == name:
+                self.entries[name] = entry
+        self.aliases = {**MODEL_ALIASES, **(aliases or {})}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def lookup(self, model):
+        """Return the entry for `model`, or None.
+
+        Tries the exact name, then aliases, then the longest prefix at a
+        `-` boundary, so dated variants like gpt-4o-2024-08-06 resolve to gpt-4o.
+        """
+        name = normalize_model_name(model)
+        name = self.aliases.get(name, name)
+        entry = self.entries.get(name)
+        if entry is not None:
+            return entry
+        parts = name.split("-")
+        for end in range(len(parts) - 1, 0, -1):
+            entry = self.entries.get("-".join(parts[:end]))
+            if entry is not None:
+                return entry
+        return None
+
+
+class ModelPricing:
+    """Current pricing table plus a background refresh from litellm."""
+
+    def __init__(self, cache_path, url=PRICING_URL, ttl=432000, timeout=10,
+                 snapshot_path=SNAPSHOT_PATH, fallback_model="gpt-3.5-turbo"):
+        self.cache_path = cache_path
+        self.url = url
+        self.ttl = ttl
+        self.timeout = timeout
+        self.snapshot_path = snapshot_path
+        self.fallback_model = fallback_model
+        # (table, best-match cache) 一起替換，避免新表格配到舊的快取
+        self._state = (self._load_initial(), {})
+        self._refresh_thread = None
+        self._stop = threading.Event()
+
+    @property
+    def table(self):
+        return self._state[0]
+
+    def _load_initial(self):
+        for path in (self.cache_path, self.snapshot_path):
+            try:
+                with open(path, "r", encoding="UTF-8") as f:
+                    table = PricingTable(json.load(f))
+                if len(table):
+                    return table
+            except (OSError, ValueError) as e:
+                if path == self.snapshot_path:
+                    logger.error("Error loading bundled model prices: %s", e)
+        return PricingTable({})
+
+    def get_model_data(self, model):
+        """Pricing entry for `model`, or the fallback model's entry if it is unknown."""
+        table, match_cache = self._state
+        entry = match_cache.get(model)
+        if entry is None:
+            entry = table.lookup(model) or table.lookup(self.fallback_model) or {}
+            match_cache[model] = entry
+        return entry
+
+    def get_context_limit(self, model):
+        """模型可接受的輸入 token 上限 (litellm 的 max_input_tokens)"""
+        model_data = self.get_model_data(model)
+        return int(model_data.get("max_input_tokens") or model_data.get("max_tokens") or 8192)
+
+    def is_stale(self):
+        try:
+            return time.time() - os.path.getmtime(self.cache_path) >= self.ttl
+        except OSError:
+            return True
+
+    def refresh(self):
+        """Download the price list, store it and swap it in. Returns True on success."""
+        try:
+            response = requests.get(self.url, timeout=self.timeout)
+            response.raise_for_status()
+            data = response.json()
+            table = PricingTable(data)
+            if not len(table):
+                raise ValueError("price list has no models")
+        except Exception as e:
+            logger.warning("Error fetching model price data: %s", e)
+            return False
+
+        # 先寫暫存檔再替換，讀取端不會看到寫到一半的檔案
+        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+        tmp_path = self.cache_path + ".tmp"
+        with open(tmp_path, "w", encoding="UTF-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.cache_path)
+
+        self._state = (table, {})
+        return True
+
+    def start_background_refresh(self, interval=3600):
+        """Refresh the prices in a daemon thread whenever the cached copy is older than the TTL."""
+        if self._refresh_thread is not None:
+            return
+        self._refresh_thread = threading.Thread(target=self._refresh_loop, args=(interval,), daemon=True)
+        self._refresh_thread.start()
+
+    def _refresh_loop(self, interval):
+        while not self._stop.is_set():
+            if self.is_stale():
+                self.refresh()
+            self._stop.wait(interval)
+
+    def stop(self):
+        self._stop.set()
+
+
+class ExchangeRates:
+    """Conversion rates from USD, e.g. {"TWD": 31.5}.
+
+    Currencies not given keep their DEFAULT_RATES value, so setting only
+    another currency still leaves the TWD rate the costs are stored in.
+    """
+
+    DEFAULT_RATES = {"USD": 1.0, "TWD": 31.5}
+
+    def __init__(self, rates):
+        self.rates = {**self.DEFAULT_RATES, **{currency.upper(): float(rate) for currency, rate in rates.items()}}
+
+    @classmethod
+    def parse(cls, text):
+        """Parse "TWD=31.5,JPY=150" style configuration."""
+        rates = {}
+        for item in (text or "").split(","):
+            if not item.strip():
+                continue
+            currency, _, rate = item.partition("=")
+            if not rate:
+                raise ValueError(f"Invalid exchange rate: {item.strip()}")
+            rates[currency.strip()] = float(rate)
+        return cls(rates)
+
+    def rate(self, currency):
+        try:
+            return self.rates[currency.upper()]
+        except KeyError:
+            raise ValueError(f"No exchange rate for {currency.upper()}; add it to EXCHANGE_RATES") from None
@@ -0,0 +1,159 @@
+import asyncio
+import threading
+
+from engine.async_runner import AsyncLoopRunner
+
+
+def room_name(conversation_id):
+    """Socket.IO room that receives a conversation's events."""
+    return f"conversation_{conversation_id}"
+
+
+class ConversationSession:
+    """Runtime state for a single conversation being simulated."""
+
+    def __init__(self, conversation_id, owner_sid=None):
+        self.conversation_id = conversation_id
+        self.owner_sid = owner_sid
+        self.room = room_name(conversation_id)
+        # 執行緒模式下是 threading.Thread，asyncio 模式下是 concurrent.futures.Future
+        self.thread = None
+        self.future = None
+        # 本次執行的回合數與 token 用量，供批次模式計算吞吐量
+        self.turns = 0
+        self.total_tokens = 0
+        self.last_error = None
+        # 執行中對話的 TokenStats，由對話迴圈設定
+        self.token_stats = None
+        self._active = threading.Event()
+
+    @property
+    def active(self):
+        return self._active.is_set()
+
+    def pause(self):
+        self._active.clear()
+
+    def resume(self):
+        self._active.set()
+
+    def record_turn(self, total_tokens):
+        self.turns += 1
+        self.total_tokens += total_tokens
+
+    def is_alive(self):
+        if self.future is not None:
+            return not self.future.done()
+        return self.thread is not None and self.thread.is_alive()
+
+
+class SessionManager:
+    """Keeps track of every running conversation, keyed by conversation ID.
+
+    A session is dropped as soon as its runner returns (finished, paused or
+    failed); resuming it later starts a new runner from the stored messages.
+    """
+
+    def __init__(self, max_sessions=0, loop_runner=None):
+        # 0 表示不限制同時進行的對話數量
+        self.max_sessions = max_sessions
+        self.loop_runner = loop_runner or AsyncLoopRunner()
+        self._sessions = {}
+        # 每個客戶端最近啟動的對話 ID，供沒有傳 conversation_id 的暫停/繼續請求使用
+        self._last_started = {}
+        self._lock = threading.Lock()
+
+    def start(self, conversation_id, target, args=(), kwargs=None, owner_sid=None):
+        """Run `target(session, *args, **kwargs)` for the conversation.
+
+        Plain functions get their own thread; coroutine functions are scheduled
+        on the shared event loop. Returns the session, or None when the concurrency limit is reached or
+        the conversation is already running.
+        """
+        with self._lock:
+            existing = self._sessions.get(conversation_id)
+            if existing is not None and existing.is_alive():
+                return None
+            if self.max_sessions and self._count_alive() >= self.max_sessions:
+                return None
+
+            session = ConversationSession(conversation_id, owner_sid=owner_sid)
+            session.resume()
+            if asyncio.iscoroutinefunction(target):
+                session.future = self.loop_runner.submit(self._run_async(session, target, args, kwargs or {}))
+            else:
+                session.thread = threading.Thread(
+                    target=self._run,
+                    args=(session, target, args, kwargs or {}),
+                    name=f"conversation-{conversation_id}",
+                    daemon=True
+                )
+            # 重新插入以保持啟動順序
+            self._sessions.pop(conversation_id, None)
+            self._sessions[conversation_id] = session
+            if owner_sid is not None:
+                self._last_started[owner_sid] = conversation_id
+
+        if session.thread is not None:
+            session.thread.start()
+        return session
+
+    def _run(self, session, target, args, kwargs):
+        try:
+            target(session, *args, **kwargs)
+        finally:
+            self._finish(session)
+
+    async def _run_async(self, session, target, args, kwargs):
+        try:
+            await target(session, *args, **kwargs)
+        finally:
+            self._finish(session)
+
+    def _finish(self, session):
+        session.pause()
+        with self._lock:
+            # 同一個對話可能已經以新的 session 重新啟動
+            if self._sessions.get(session.conversation_id) is session:
+                del self._sessions[session.conversation_id]
+
+    def _count_alive(self):
+        return sum(1 for session in self._sessions.values() if session.is_alive())
+
+    def get(self, conversation_id):
+        with self._lock:
+            return self._sessions.get(conversation_id)
+
+    def pause(self, conversation_id):
+        """Pause a conversation. Returns False if it is unknown."""
+        session = self.get(conversation_id)
+        if session is None:
+            return False
+        session.pause()
+        return True
+
+    def pause_owned_by(self, owner_sid):
+        """Pause every conversation started by the given Socket.IO client, e.g. when it disconnects."""
+        with self._lock:
+            self._last_started.pop(owner_sid, None)
+            sessions = [s for s in self._sessions.values() if s.owner_sid == owner_sid]
+        for session in sessions:
+            session.pause()
+        return len(sessions)
+
+    def last_started_by(self, owner_sid):
+        """ID of the conversation a client started most recently, even if it has finished."""
+        with self._lock:
+            return self._last_started.get(owner_sid)
+
+    def active_count(self):
+        with self._lock:
+            return sum(1 for session in self._sessions.values() if session.active)
+
+    def remove(self, conversation_id):
+        """Stop and forget a conversation (e.g. after it was deleted)."""
+        with self._lock:
+            session = self._sessions.pop(conversation_id, None)
+        if session is not None:
+            session.pause()
+        return session is not None
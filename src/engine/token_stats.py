@@ -0,0 +1,59 @@
+class TokenStats:
+    """Running per-bot token and cost totals of one conversation.
+
+    Updated once per reply, so publishing stats no longer needs a GROUP BY
+    over every stored message. `to_dict()` has the same shape as
+    DatabaseManager.get_conversation_token_stats.
+    """
+
+    def __init__(self):
+        self.total_tokens = 0
+        self.total_cost = 0.0
+        self.total_cost_usd = 0.0
+        self.bot_stats = {}
+
+    @classmethod
+    def from_dict(cls, stats):
+        """Seed the totals from stored stats, e.g. when a conversation is resumed."""
+        token_stats = cls()
+        if not stats:
+            return token_stats
+        token_stats.total_tokens = stats.get('total_tokens') or 0
+        token_stats.total_cost = float(stats.get('total_cost') or 0)
+        token_stats.total_cost_usd = float(stats.get('total_cost_usd') or 0)
+        for bot_name, bot in stats.get('bot_stats', {}).items():
+            token_stats.bot_stats[bot_name] = {
+                'prompt_tokens': bot.get('prompt_tokens') or 0,
+                'completion_tokens': bot.get('completion_tokens') or 0,
+                'total_tokens': bot.get('total_tokens') or 0,
+                'cost': float(bot.get('cost') or 0),
+                'cost_usd': float(bot.get('cost_usd') or 0)
+            }
+        return token_stats
+
+    def add(self, bot_name, prompt_tokens, completion_tokens, cost_twd, cost_usd):
+        total_tokens = prompt_tokens + completion_tokens
+        bot = self.bot_stats.setdefault(bot_name, {
+            'prompt_tokens': 0,
+            'completion_tokens': 0,
+            'total_tokens': 0,
+            'cost': 0.0,
+            'cost_usd': 0.0
+        })
+        bot['prompt_tokens'] += prompt_tokens
+        bot['completion_tokens'] += completion_tokens
+        bot['total_tokens'] += total_tokens
+        bot['cost'] += float(cost_twd)
+        bot['cost_usd'] += float(cost_usd)
+
+        self.total_tokens += total_tokens
+        self.total_cost += float(cost_twd)
+        self.total_cost_usd += float(cost_usd)
+
+    def to_dict(self):
+        return {
+            'total_tokens': self.total_tokens,
+            'total_cost': self.total_cost,
+            'total_cost_usd': self.total_cost_usd,
+            'bot_stats': {bot_name: dict(bot) for bot_name, bot in self.bot_stats.items()}
+        }
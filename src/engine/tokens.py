@@ -0,0 +1,161 @@
+"""Token counting with memoized tiktoken encoders.
+
+Loading an encoding reads (and on first use downloads) its BPE file, so each
+encoding is loaded once per process and kept here. Each one is loaded under its
+own lock, so a slow download holds up only the models that need that encoding.
+If loading fails, counts are approximate until a retry after
+LOAD_RETRY_INTERVAL seconds. `warm_up` loads the encoders ahead of time.
+`configure_cache_dir` points tiktoken at a local directory of BPE files. With
+those files copied there, hosts without network access can still count tokens.
+"""
+import functools
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import tiktoken
+from tiktoken.model import MODEL_PREFIX_TO_ENCODING, MODEL_TO_ENCODING
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ENCODING = "cl100k_base"
+# 每則訊息約有4個格式token，回覆開頭另有3個
+MESSAGE_OVERHEAD_TOKENS = 4
+REPLY_PRIMING_TOKENS = 3
+# 載入失敗 (例如暫時無法連線) 後，隔多少秒再重試
+LOAD_RETRY_INTERVAL = 60.0
+# 文字總長度達到此值才平行編碼；較短的對話歷史逐一編碼比交給執行緒更快
+PARALLEL_ENCODE_MIN_CHARS = 50_000
+ENCODE_THREADS = 8
+
+# 模型名稱 -> 已載入的編碼器
+_encoders = {}
+# 編碼名稱 -> 已載入的編碼器、載入用的鎖、下次可重試的時間
+_encodings = {}
+_load_locks = {}
+_retry_at = {}
+_lock = threading.Lock()
+# 平行編碼共用的執行緒池，第一次需要時才建立
+_executor = None
+
+
+class ApproximateEncoding:
+    """Stand-in used when no BPE file can be loaded: about four characters per token."""
+
+    name = "approximate"
+
+    def encode(self, text, disallowed_special=()):
+        return [0] * ((len(text) + 3) // 4)
+
+
+_APPROXIMATE = ApproximateEncoding()
+
+
+def get_encoding(model):
+    """Return the encoder for `model`, loading it on first use.
+
+    Returns an ApproximateEncoding while the model's encoding cannot be loaded.
+    """
+    encoder = _encoders.get(model)
+    if encoder is not None:
+        return encoder
+    encoder = _load_encoding(_encoding_name(model))
+    if encoder is not _APPROXIMATE:
+        _encoders[model] = encoder
+    return encoder
+
+
+def _encoding_name(model):
+    # 與 tiktoken.encoding_for_model 相同的對應方式；不認得的模型使用預設編碼
+    if model in MODEL_TO_ENCODING:
+        return MODEL_TO_ENCODING[model]
+    for prefix, name in MODEL_PREFIX_TO_ENCODING.items():
+        if model.startswith(prefix):
+            return name
+    return DEFAULT_ENCODING
+
+
+def _load_encoding(name):
+    retry_at = _retry_at.get(name)
+    if retry_at is not None and time.monotonic() < retry_at:
+        return _APPROXIMATE
+    with _lock:
+        load_lock = _load_locks.setdefault(name, threading.Lock())
+    # 下載 BPE 檔案時只鎖住這個編碼，其他編碼的模型不必等待
+    with load_lock:
+        encoder = _encodings.get(name)
+        if encoder is not None:
+            return encoder
+        retry_at = _retry_at.get(name)
+        if retry_at is not None and time.monotonic() < retry_at:
+            return _APPROXIMATE
+        try:
+            encoder = tiktoken.get_encoding(name)
+        except Exception as e:
+            # 離線且沒有快取檔案時改用估算，避免對話因此中斷；稍後再重試
+            log = logger.warning if retry_at is None else logger.debug
+            log("Could not load tokenizer %s, token counts are approximate for %.0fs: %s",
+                name, LOAD_RETRY_INTERVAL, e)
+            _retry_at[name] = time.monotonic() + LOAD_RETRY_INTERVAL
+            return _APPROXIMATE
+        _retry_at.pop(name, None)
+        _encodings[name] = encoder
+        return encoder
+
+
+def configure_cache_dir(cache_dir):
+    """Have tiktoken read and store BPE files in `cache_dir`.
+
+    tiktoken reads TIKTOKEN_CACHE_DIR each time it loads a file, so call this
+    before the first encoder is loaded. A directory already named in the
+    environment is kept.
+    """
+    if cache_dir:
+        os.environ.setdefault("TIKTOKEN_CACHE_DIR", cache_dir)
+
+
+def warm_up(models):
+    """Load the encoders of `models`; returns those that fell back to approximate counting."""
+    return [model for model in models if isinstance(get_encoding(model), ApproximateEncoding)]
+
+
+def count_tokens(text, model="gpt-4"):
+    """Number of tokens in `text`."""
+    return len(get_encoding(model).encode(text, disallowed_special=()))
+
+
+def _encode_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=ENCODE_THREADS, thread_name_prefix="tokens")
+        return _executor
+
+
+def count_tokens_batch(texts, model="gpt-4"):
+    """Token counts of many texts at once.
+
+    Large batches are encoded in parallel on a shared thread pool (tiktoken
+    releases the GIL while encoding); small ones are encoded in turn, which
+    is cheaper than handing them to threads.
+    """
+    texts = list(texts)
+    encode = functools.partial(get_encoding(model).encode, disallowed_special=())
+    if len(texts) > 1 and sum(len(text) for text in texts) >= PARALLEL_ENCODE_MIN_CHARS:
+        encoded = _encode_executor().map(encode, texts)
+    else:
+        encoded = map(encode, texts)
+    return [len(tokens) for tokens in encoded]
+
+
+def count_message_tokens(message, model="gpt-4"):
+    """Tokens of one chat message including its formatting overhead."""
+    return count_tokens(message["content"], model) + MESSAGE_OVERHEAD_TOKENS
+
+
+def estimate_prompt_tokens(messages, model="gpt-4"):
+    """Estimate the prompt tokens of a chat request (content plus per-message overhead)."""
+    counts = count_tokens_batch([message["content"] for message in messages], model)
+    return sum(counts) + MESSAGE_OVERHEAD_TOKENS * len(counts) + REPLY_PRIMING_TOKENS
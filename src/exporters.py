@@ -0,0 +1,140 @@
+"""Streaming conversation exporters.
+
+Text formats (csv, txt, jsonl) are generators that yield the file piece by
+piece, so a download starts immediately and memory use does not grow with
+the conversation. Columnar formats (parquet, arrow) are written batch by
+batch into a file object and need the optional `pyarrow` package.
+"""
+import csv
+import json
+
+# format -> (mimetype, file extension)
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'txt': ('text/plain', 'txt'),
+    'jsonl': ('application/x-ndjson', 'jsonl'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'arrow': ('application/vnd.apache.arrow.file', 'arrow'),
+}
+
+COLUMNAR_FORMATS = ('parquet', 'arrow')
+
+CSV_HEADER = ['Timestamp', 'Bot', 'Message', 'Prompt Tokens', 'Completion Tokens', 'Total Tokens', 'Cost (TWD)']
+
+
+class _EchoWriter:
+    """File-like object whose write() returns the data, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(messages, get_token_stats=None, include_conversation_id=False):
+    writer = csv.writer(_EchoWriter())
+    header = (['Conversation ID'] if include_conversation_id else []) + CSV_HEADER
+    yield writer.writerow(header)
+
+    for msg in messages:
+        row = [
+            msg['timestamp'],
+            msg['bot_name'],
+            msg['content'],
+            msg.get('prompt_tokens', 0),
+            msg.get('completion_tokens', 0),
+            msg.get('total_tokens', 0),
+            f"NT$ {msg.get('cost', 0):.2f}"
+        ]
+        if include_conversation_id:
+            row.insert(0, msg['conversation_id'])
+        yield writer.writerow(row)
+
+    # Add token summary
+    token_stats = get_token_stats() if get_token_stats else None
+    if token_stats:
+        yield writer.writerow([])
+        yield writer.writerow(['Token Summary'])
+        yield writer.writerow(['Total Tokens', token_stats['total_tokens']])
+        yield writer.writerow(['Total Cost (TWD)', f"NT$ {token_stats['total_cost']:.2f}"])
+
+
+def iter_txt(messages, get_token_stats=None, conversations=None):
+    """Yield the plain-text transcript.
+
+    With `conversations` (id -> conversation dict) a heading is written
+    whenever a new conversation starts, for multi-conversation exports.
+    """
+    current_conversation_id = None
+    for msg in messages:
+        if conversations is not None and msg['conversation_id'] != current_conversation_id:
+            current_conversation_id = msg['conversation_id']
+            conversation = conversations.get(current_conversation_id, {})
+            yield f"=== Conversation {current_conversation_id}: {conversation.get('title') or ''} ===\n\n"
+
+        output = f"[{msg['timestamp']}] {msg['bot_name']}: {msg['content']}\n"
+        if 'total_tokens' in msg and msg['total_tokens'] > 0:
+            output += f"Tokens: {msg.get('total_tokens', 0)} (Prompt: {msg.get('prompt_tokens', 0)}, Completion: {msg.get('completion_tokens', 0)})\n"
+            output += f"Cost: NT$ {msg.get('cost', 0):.2f}\n"
+        yield output + "\n"
+
+    # Add token summary
+    token_stats = get_token_stats() if get_token_stats else None
+    if token_stats:
+        yield "\n--- Token Summary ---\n"
+        yield f"Total Tokens: {token_stats['total_tokens']}\n"
+        yield f"Total Cost: NT$ {token_stats['total_cost']:.2f}\n"
+
+
+def iter_jsonl(messages):
+    for msg in messages:
+        yield json.dumps(msg, ensure_ascii=False) + "\n"
+
+
+def _message_schema(pa):
+    return pa.schema([
+        ('id', pa.int64()),
+        ('conversation_id', pa.int64()),
+        ('turn', pa.int64()),
+        ('created_at', pa.int64()),
+        ('timestamp', pa.string()),
+        ('bot_name', pa.string()),
+        ('content', pa.string()),
+        ('prompt_tokens', pa.int64()),
+        ('completion_tokens', pa.int64()),
+        ('total_tokens', pa.int64()),
+        ('cost', pa.float64()),
+    ])
+
+
+def write_columnar(messages, file_obj, format_type, batch_size=1000):
+    """Write messages to `file_obj` as Parquet or Arrow IPC, one batch at a time.
+
+    Raises ImportError when pyarrow is not installed.
+    """
+    import pyarrow as pa
+
+    schema = _message_schema(pa)
+    if format_type == 'parquet':
+        import pyarrow.parquet as pq
+        writer = pq.ParquetWriter(file_obj, schema)
+        write_batch = writer.write_batch
+    elif format_type == 'arrow':
+        writer = pa.ipc.new_file(file_obj, schema)
+        write_batch = writer.write_batch
+    else:
+        raise ValueError(f"Unsupported columnar format: {format_type}")
+
+    def flush(rows):
+        columns = {name: [row.get(name) for row in rows] for name in schema.names}
+        write_batch(pa.RecordBatch.from_pydict(columns, schema=schema))
+
+    try:
+        rows = []
+        for msg in messages:
+            rows.append(msg)
+            if len(rows) >= batch_size:
+                flush(rows)
+                rows = []
+        if rows:
+            flush(rows)
+    finally:
+        writer.close()
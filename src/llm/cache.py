@@ -0,0 +1,100 @@
+"""Content-addressed cache of chat completions, for record/replay runs.
+
+A response is keyed by the SHA-256 of its model, messages and request
+parameters. Lookups go to an in-memory LRU first and then to a directory of
+JSON files; both expire entries after `ttl` seconds (0 = never).
+
+Modes:
+    off     - no caching
+    on      - serve hits, call the API and record on a miss
+    record  - always call the API and (re)record the response
+    replay  - serve recorded responses only; a miss raises ReplayMissError
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+from cachetools import LRUCache, TTLCache
+
+CACHE_MODES = ("off", "on", "record", "replay")
+
+
+class ReplayMissError(LookupError):
+    """Replay mode found no recorded response for a request."""
+
+
+def cache_key(model, messages, params):
+    payload = json.dumps({"model": model, "messages": messages, "params": params},
+                         sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Memory and disk tiers of recorded (reply, prompt_tokens, completion_tokens, total_tokens)."""
+
+    def __init__(self, mode="off", directory=None, max_entries=1024, ttl=0):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown response cache mode: {mode}")
+        self.mode = mode
+        self.directory = directory
+        self.ttl = ttl
+        self._memory = TTLCache(max_entries, ttl) if ttl else LRUCache(max_entries)
+        # cachetools 的快取不是執行緒安全的
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.mode != "off"
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".json")
+
+    def get(self, key):
+        """Return the recorded response for `key`, or None."""
+        with self._lock:
+            result = self._memory.get(key)
+        if result is not None or not self.directory:
+            return result
+
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="UTF-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if self.ttl and time.time() - entry["created_at"] > self.ttl:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+
+        result = (entry["reply"],) + tuple(entry["usage"])
+        with self._lock:
+            self._memory[key] = result
+        return result
+
+    def put(self, key, model, result):
+        with self._lock:
+            self._memory[key] = result
+        if not self.directory:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        entry = {"created_at": time.time(), "model": model, "reply": result[0], "usage": list(result[1:])}
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="UTF-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def lookup(self, model, messages, params):
+        """Return (key, cached result or None) for a request, honouring the mode."""
+        key = cache_key(model, messages, params)
+        if self.mode == "record":
+            return key, None
+        result = self.get(key)
+        if result is None and self.mode == "replay":
+            raise ReplayMissError(f"No recorded response for {model} request {key[:12]}")
+        return key, result
@@ -0,0 +1,97 @@
+"""Simulated chat model for load tests on machines without network access.
+
+MockBackend produces deterministic filler replies at a configurable
+latency and token rate and fails a configurable share of requests. It is
+used in-process by MockProvider and over HTTP by src/mock_server.py
+(`python mock_server.py`).
+"""
+import hashlib
+import random
+import threading
+
+WORDS = (
+    "the conversation continues with a thoughtful reply about ideas plans questions "
+    "and stories that two simulated speakers share while the benchmark measures "
+    "latency throughput tokens and cost under load"
+).split()
+
+
+class MockAPIError(Exception):
+    """An injected API failure, shaped like openai's APIStatusError for the request scheduler."""
+
+    def __init__(self, status_code, retry_after=None):
+        super().__init__(f"Mock API error {status_code}")
+        self.status_code = status_code
+        self.response = _MockResponse({"retry-after": str(retry_after)} if retry_after else {})
+
+
+class _MockResponse:
+    def __init__(self, headers):
+        self.headers = headers
+
+
+class MockUsage:
+    def __init__(self, prompt_tokens, completion_tokens):
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.total_tokens = prompt_tokens + completion_tokens
+
+
+class MockBackend:
+    """Canned replies with configurable latency, token rate and error injection.
+
+    - latency: seconds before the first token
+    - tokens_per_second: streaming rate of the reply (0 = all at once)
+    - reply_tokens: words per reply
+    - error_rate: share of requests that fail with one of `error_statuses`
+    """
+
+    def __init__(self, latency=0.2, tokens_per_second=50, reply_tokens=60, error_rate=0.0,
+                 error_statuses=(429, 500, 503), retry_after=1, seed=None):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.reply_tokens = reply_tokens
+        self.error_rate = error_rate
+        self.error_statuses = tuple(error_statuses)
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, environ):
+        """Build a backend from MOCK_LATENCY, MOCK_TOKENS_PER_SECOND, MOCK_REPLY_TOKENS, MOCK_ERROR_RATE and MOCK_SEED."""
+        seed = environ.get("MOCK_SEED")
+        return cls(
+            latency=float(environ.get("MOCK_LATENCY", "0.2")),
+            tokens_per_second=float(environ.get("MOCK_TOKENS_PER_SECOND", "50")),
+            reply_tokens=int(environ.get("MOCK_REPLY_TOKENS", "60")),
+            error_rate=float(environ.get("MOCK_ERROR_RATE", "0")),
+            seed=int(seed) if seed else None
+        )
+
+    def injected_error(self):
+        """Return the MockAPIError this request should fail with, or None."""
+        with self._lock:
+            if self._random.random() >= self.error_rate:
+                return None
+            status = self._random.choice(self.error_statuses)
+        return MockAPIError(status, self.retry_after if status == 429 else None)
+
+    def reply(self, messages):
+        """Reply words for `messages`; the same request always gets the same reply."""
+        seed = hashlib.sha256(messages[-1]["content"].encode("utf-8")).digest() if messages else b""
+        rng = random.Random(seed)
+        return [rng.choice(WORDS) for _ in range(self.reply_tokens)]
+
+    @staticmethod
+    def deltas(words):
+        """Stream chunks of a reply, one word each."""
+        return [word if index == 0 else " " + word for index, word in enumerate(words)]
+
+    def usage(self, messages, words):
+        # 約每4個字元1個token，與 tokens.ApproximateEncoding 相同
+        prompt_tokens = sum((len(m["content"]) + 3) // 4 + 4 for m in messages) + 3
+        return MockUsage(prompt_tokens, len(words))
+
+    def token_delay(self):
+        return 1.0 / self.tokens_per_second if self.tokens_per_second else 0.0
@@ -0,0 +1,56 @@
+"""Per-model capabilities, so callers don't special-case model names.
+
+Capabilities are looked up by the longest known prefix at a `-` boundary,
+so dated variants such as o1-mini-2024-09-12 share the entry of o1-mini.
+"""
+
+
+class ModelCapabilities:
+    """What a model accepts and how to request a reply from it.
+
+    - system_messages: False folds the system prompt into a single user
+      message, and the model is then sent no history
+    - streaming: whether replies are requested as a stream
+    - stream_fallback: retry without streaming when a stream fails or
+      comes back empty
+    - max_tokens_param: request parameter limiting the reply length
+    - temperature: sampling temperature, or None if the model rejects it
+    """
+
+    def __init__(self, system_messages=True, streaming=True, stream_fallback=False,
+                 max_tokens_param="max_tokens", max_output_tokens=1000, temperature=0.7):
+        self.system_messages = system_messages
+        self.streaming = streaming
+        self.stream_fallback = stream_fallback
+        self.max_tokens_param = max_tokens_param
+        self.max_output_tokens = max_output_tokens
+        self.temperature = temperature
+
+    def request_params(self):
+        """Model-specific parameters of a chat completion request."""
+        params = {self.max_tokens_param: self.max_output_tokens}
+        if self.temperature is not None:
+            params["temperature"] = self.temperature
+        return params
+
+
+DEFAULT_CAPABILITIES = ModelCapabilities()
+
+# o1 系列的推理模型不接受 temperature，回覆長度用 max_completion_tokens 限制
+MODEL_CAPABILITIES = {
+    "o1": ModelCapabilities(stream_fallback=True, max_tokens_param="max_completion_tokens",
+                            max_output_tokens=4000, temperature=None),
+    "o1-mini": ModelCapabilities(system_messages=False, stream_fallback=True,
+                                 max_tokens_param="max_completion_tokens",
+                                 max_output_tokens=4000, temperature=None),
+}
+
+
+def get_capabilities(model):
+    """Capabilities of `model`, or the defaults if no prefix of its name is known."""
+    parts = model.lower().split("-")
+    for end in range(len(parts), 0, -1):
+        capabilities = MODEL_CAPABILITIES.get("-".join(parts[:end]))
+        if capabilities is not None:
+            return capabilities
+    return DEFAULT_CAPABILITIES
@@ -0,0 +1,210 @@
+"""Chat completion backends.
+
+A provider sends one chat request and returns (reply, usage), where usage
+has prompt_tokens, completion_tokens and total_tokens or is None if the
+backend did not report it. Streamed content is forwarded to `on_delta` as
+it arrives; `on_delta("", reset=True)` tells the receiver to discard what
+was sent so far, when a broken stream is replaced by a non-streaming
+reply. Retries, rate limits and caching are handled by the caller.
+"""
+import asyncio
+import logging
+import time
+
+import openai
+
+from llm.mock import MockBackend
+
+logger = logging.getLogger(__name__)
+
+
+def _collect_stream(stream_response, on_delta=None):
+    """Join streamed content deltas, forwarding each one to `on_delta`.
+
+    Returns (content, usage); usage is None unless the stream reported it.
+    """
+    collected_response = ""
+    usage = None
+    for chunk in stream_response:
+        if getattr(chunk, 'usage', None):
+            usage = chunk.usage
+        if chunk.choices and chunk.choices[0].delta.content:
+            delta = chunk.choices[0].delta.content
+            collected_response += delta
+            if on_delta:
+                on_delta(delta)
+    return collected_response, usage
+
+
+async def _collect_stream_async(stream_response, on_delta=None):
+    collected_response = ""
+    usage = None
+    async for chunk in stream_response:
+        if getattr(chunk, 'usage', None):
+            usage = chunk.usage
+        if chunk.choices and chunk.choices[0].delta.content:
+            delta = chunk.choices[0].delta.content
+            collected_response += delta
+            if on_delta:
+                on_delta(delta)
+    return collected_response, usage
+
+
+class _DeltaTracker:
+    """Forwards deltas to `on_delta` and remembers whether any were sent."""
+
+    def __init__(self, on_delta):
+        self.on_delta = on_delta
+        self.sent = False
+
+    def __call__(self, delta):
+        self.sent = True
+        if self.on_delta:
+            self.on_delta(delta)
+
+    def reset(self):
+        # 串流中途失敗時，前端已顯示的部分內容要先清掉，再改用非串流回覆
+        if self.sent and self.on_delta:
+            self.on_delta("", reset=True)
+        self.sent = False
+
+
+class ChatProvider:
+    """Interface of a chat completion backend."""
+
+    name = None
+
+    def complete(self, model, messages, capabilities, on_delta=None):
+        """Request a reply; returns (reply, usage or None)."""
+        raise NotImplementedError
+
+    async def complete_async(self, model, messages, capabilities, on_delta=None):
+        """Async counterpart of complete()."""
+        raise NotImplementedError
+
+
+class OpenAIProvider(ChatProvider):
+    """OpenAI's API, or any OpenAI-compatible server at `base_url`."""
+
+    name = "openai"
+
+    def __init__(self, api_key=None, base_url=None):
+        self.api_key = api_key
+        self.base_url = base_url
+        self._client = None
+        self._async_client = None
+
+    def client(self):
+        if self._client is None:
+            # 重試由 request_scheduler 統一處理
+            self._client = openai.OpenAI(api_key=self.api_key, base_url=self.base_url, max_retries=0)
+        return self._client
+
+    def async_client(self):
+        if self._async_client is None:
+            self._async_client = openai.AsyncOpenAI(api_key=self.api_key, base_url=self.base_url, max_retries=0)
+        return self._async_client
+
+    def complete(self, model, messages, capabilities, on_delta=None):
+        """Stream the reply with usage in the final chunk (stream_options.include_usage), so a turn costs one request."""
+        create = self.client().chat.completions.create
+        params = capabilities.request_params()
+        reply, usage = "", None
+        deltas = _DeltaTracker(on_delta)
+        if capabilities.streaming:
+            try:
+                stream_response = create(
+                    model=model,
+                    messages=messages,
+                    stream=True,
+                    stream_options={"include_usage": True},
+                    **params
+                )
+                reply, usage = _collect_stream(stream_response, deltas)
+            except Exception as e:
+                if not capabilities.stream_fallback:
+                    raise
+                logger.warning("流式处理失败: %s，尝试标准方式...", e)
+
+        # 串流失敗或回應為空時改用非串流方式
+        if not reply and (capabilities.stream_fallback or not capabilities.streaming):
+            deltas.reset()
+            response = create(model=model, messages=messages, **params)
+            reply = response.choices[0].message.content
+            usage = response.usage
+        return reply, usage
+
+    async def complete_async(self, model, messages, capabilities, on_delta=None):
+        create = self.async_client().chat.completions.create
+        params = capabilities.request_params()
+        reply, usage = "", None
+        deltas = _DeltaTracker(on_delta)
+        if capabilities.streaming:
+            try:
+                stream_response = await create(
+                    model=model,
+                    messages=messages,
+                    stream=True,
+                    stream_options={"include_usage": True},
+                    **params
+                )
+                reply, usage = await _collect_stream_async(stream_response, deltas)
+            except Exception as e:
+                if not capabilities.stream_fallback:
+                    raise
+                logger.warning("流式处理失败: %s，尝试标准方式...", e)
+
+        if not reply and (capabilities.stream_fallback or not capabilities.streaming):
+            deltas.reset()
+            response = await create(model=model, messages=messages, **params)
+            reply = response.choices[0].message.content
+            usage = response.usage
+        return reply, usage
+
+
+class MockProvider(ChatProvider):
+    """In-process stand-in for a model API, driven by a MockBackend."""
+
+    name = "mock"
+
+    def __init__(self, backend=None):
+        self.backend = backend or MockBackend()
+
+    def complete(self, model, messages, capabilities, on_delta=None):
+        backend = self.backend
+        time.sleep(backend.latency)
+        error = backend.injected_error()
+        if error:
+            raise error
+        words = backend.reply(messages)
+        delay = backend.token_delay() if capabilities.streaming else 0
+        for delta in backend.deltas(words):
+            if delay:
+                time.sleep(delay)
+            if on_delta:
+                on_delta(delta)
+        return "".join(backend.deltas(words)), backend.usage(messages, words)
+
+    async def complete_async(self, model, messages, capabilities, on_delta=None):
+        backend = self.backend
+        await asyncio.sleep(backend.latency)
+        error = backend.injected_error()
+        if error:
+            raise error
+        words = backend.reply(messages)
+        delay = backend.token_delay() if capabilities.streaming else 0
+        for delta in backend.deltas(words):
+            if delay:
+                await asyncio.sleep(delay)
+            if on_delta:
+                on_delta(delta)
+        return "".join(backend.deltas(words)), backend.usage(messages, words)
+
+
+def create_provider(name, api_key=None, base_url=None, mock_backend=None):
+    """Build a provider from its configured name ("openai" or "mock")."""
+    if name == "openai":
+        return OpenAIProvider(api_key=api_key, base_url=base_url)
+    if name == "mock":
+        return MockProvider(mock_backend)
+    raise ValueError(f"Unknown LLM provider: {name}")
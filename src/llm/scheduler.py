@@ -0,0 +1,297 @@
+"""Shared scheduler for model API requests.
+
+Every request of every conversation goes through one RequestScheduler, which
+
+- keeps per-model token buckets for requests per minute (RPM) and tokens
+  per minute (TPM), so concurrent conversations share the quota instead of
+  tripping it,
+- caps the number of requests in flight,
+- retries transient failures (429, 5xx, timeouts, connection errors) with
+  jittered exponential backoff, honouring the server's Retry-After.
+
+A 429 also holds back the model's other requests until the retry time, so
+one rate-limit response slows the whole pool rather than each conversation
+discovering it separately.
+"""
+import asyncio
+import collections
+import functools
+import logging
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import openai
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+MAX_RETRY_AFTER = 300
+
+
+class TokenBucket:
+    """Refills `per_minute` units per minute, holding at most one minute's worth.
+
+    Reservations may overdraw the bucket; the caller then waits until the
+    debt has been refilled, so waiting requests are served in order.
+    """
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount):
+        """Take `amount` units and return the seconds to wait before using them."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            # 超過桶子容量的請求永遠等不到，最多只預留一分鐘的量
+            self.level -= min(amount, self.capacity)
+            return 0.0 if self.level >= 0 else -self.level / self.rate
+
+    def adjust(self, amount):
+        """Take (or, if negative, give back) `amount` units without waiting, e.g. to correct an estimate."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.level = min(self.capacity, self.level - amount)
+
+
+class ConcurrencyLimit:
+    """At most `limit` holders at a time, shared by threads and event loops.
+
+    Waiters are served in arrival order. A thread blocks on an Event; a
+    coroutine awaits a future of its own loop, which release() resolves with
+    call_soon_threadsafe, so no loop is blocked or polled.
+    """
+
+    def __init__(self, limit):
+        self.available = limit
+        self._waiters = collections.deque()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            if self.available and not self._waiters:
+                self.available -= 1
+                return
+            event = threading.Event()
+            self._waiters.append(event.set)
+        event.wait()
+
+    async def acquire_async(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self.available and not self._waiters:
+                self.available -= 1
+                return
+            future = loop.create_future()
+            waiter = functools.partial(loop.call_soon_threadsafe, self._hand_over, future)
+            self._waiters.append(waiter)
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                    raise
+            # 已分到名額才被取消: 結果已設定就自己歸還，否則交給 _hand_over 轉給下一位
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def _hand_over(self, future):
+        if future.done():
+            # 等待者已取消，名額轉給下一位
+            self.release()
+        else:
+            future.set_result(None)
+
+    def release(self):
+        with self._lock:
+            while self._waiters:
+                waiter = self._waiters.popleft()
+                try:
+                    waiter()
+                    return
+                except RuntimeError:
+                    # 等待者的事件迴圈已關閉
+                    continue
+            self.available += 1
+
+
+class _ModelLimiter:
+    def __init__(self, rpm, tpm):
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.blocked_until = 0.0
+
+
+def parse_rate_limits(text):
+    """Parse "gpt-4o=500:30000,gpt-3.5-turbo=3500:200000" (model=RPM:TPM, 0 = unlimited)."""
+    limits = {}
+    for item in (text or "").split(","):
+        if not item.strip():
+            continue
+        model, _, values = item.partition("=")
+        rpm, _, tpm = values.partition(":")
+        limits[model.strip()] = (int(rpm or 0), int(tpm or 0))
+    return limits
+
+
+def is_retryable(error):
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    return getattr(error, "status_code", None) in RETRYABLE_STATUS
+
+
+def retry_after(error):
+    """Seconds the server asked us to wait (Retry-After / retry-after-ms), or None."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RequestScheduler:
+    """Rate limits, concurrency cap and retries for model requests.
+
+    `limits` maps model names to (rpm, tpm); other models use the defaults.
+    A limit of 0 means unlimited, as does `max_concurrency=0`.
+    """
+
+    def __init__(self, limits=None, default_rpm=0, default_tpm=0, max_concurrency=0,
+                 max_retries=5, backoff_base=1.0, backoff_max=60.0):
+        self.limits = limits or {}
+        self.default_rpm = default_rpm
+        self.default_tpm = default_tpm
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._slots = ConcurrencyLimit(max_concurrency) if max_concurrency else None
+        self._limiters = {}
+        self._lock = threading.Lock()
+
+    def _limiter(self, model):
+        with self._lock:
+            limiter = self._limiters.get(model)
+            if limiter is None:
+                rpm, tpm = self.limits.get(model, (self.default_rpm, self.default_tpm))
+                limiter = self._limiters[model] = _ModelLimiter(rpm, tpm)
+            return limiter
+
+    def _reserve(self, limiter, tokens):
+        """Reserve one request and `tokens` tokens; return the seconds to wait."""
+        wait = max(0.0, limiter.blocked_until - time.monotonic())
+        if limiter.requests:
+            wait = max(wait, limiter.requests.reserve(1))
+        if limiter.tokens and tokens:
+            wait = max(wait, limiter.tokens.reserve(tokens))
+        return wait
+
+    def _estimate(self, limiter, estimate_tokens):
+        # 只有設定了 TPM 才需要預估 token
+        return estimate_tokens() if limiter.tokens and estimate_tokens else 0
+
+    def _settle(self, limiter, estimated, result, usage_of):
+        if limiter.tokens and usage_of:
+            limiter.tokens.adjust(usage_of(result) - estimated)
+
+    def _refund(self, limiter, estimated):
+        # 請求最終失敗，預留的 token 沒有被使用
+        if limiter.tokens and estimated:
+            limiter.tokens.adjust(-estimated)
+
+    def _retry_delay(self, limiter, error, attempt):
+        """Seconds to wait before retrying, or None if the error should be raised."""
+        if attempt >= self.max_retries or not is_retryable(error):
+            return None
+        delay = retry_after(error)
+        if delay is None:
+            # Equal jitter: half the exponential step plus a random share of the other half
+            step = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+            delay = step / 2 + random.uniform(0, step / 2)
+        delay = min(delay, MAX_RETRY_AFTER)
+        if getattr(error, "status_code", None) == 429:
+            limiter.blocked_until = max(limiter.blocked_until, time.monotonic() + delay)
+        logger.warning("Request failed (%s), retrying in %.1fs (attempt %d/%d)", error, delay, attempt + 1, self.max_retries)
+        return delay
+
+    def call(self, model, request, estimate_tokens=None, usage_of=None):
+        """Run `request()` under the model's limits, retrying transient failures.
+
+        `estimate_tokens()` predicts the request's tokens for the TPM bucket
+        and `usage_of(result)` returns what it actually used. The estimate is
+        reserved once for all attempts and given back if the request fails.
+        """
+        limiter = self._limiter(model)
+        estimated = self._estimate(limiter, estimate_tokens)
+        attempt = 0
+        while True:
+            # 每次嘗試都是一個請求 (RPM)，但 token 只在第一次預留
+            time.sleep(self._reserve(limiter, estimated if attempt == 0 else 0))
+            if self._slots:
+                self._slots.acquire()
+            try:
+                result = request()
+            except Exception as e:
+                delay = self._retry_delay(limiter, e, attempt)
+                if delay is None:
+                    self._refund(limiter, estimated)
+                    raise
+            else:
+                self._settle(limiter, estimated, result, usage_of)
+                return result
+            finally:
+                if self._slots:
+                    self._slots.release()
+            time.sleep(delay)
+            attempt += 1
+
+    async def call_async(self, model, request, estimate_tokens=None, usage_of=None):
+        """Async counterpart of call(); `request()` returns an awaitable."""
+        limiter = self._limiter(model)
+        estimated = 0
+        if limiter.tokens and estimate_tokens:
+            # 計算 token 會用到 tiktoken，放到執行緒池避免卡住事件迴圈
+            estimated = await asyncio.get_running_loop().run_in_executor(None, estimate_tokens)
+        attempt = 0
+        while True:
+            # 每次嘗試都是一個請求 (RPM)，但 token 只在第一次預留
+            await asyncio.sleep(self._reserve(limiter, estimated if attempt == 0 else 0))
+            if self._slots:
+                await self._slots.acquire_async()
+            try:
+                result = await request()
+            except Exception as e:
+                delay = self._retry_delay(limiter, e, attempt)
+                if delay is None:
+                    self._refund(limiter, estimated)
+                    raise
+            else:
+                self._settle(limiter, estimated, result, usage_of)
+                return result
+            finally:
+                if self._slots:
+                    self._slots.release()
+            await asyncio.sleep(delay)
+            attempt += 1
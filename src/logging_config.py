@@ -0,0 +1,80 @@
+"""Logging setup: leveled, structured and sampled.
+
+Modules log through `logging.getLogger(__name__)`. High-volume records (one
+per turn or request) are logged at DEBUG with `extra=sampled(...)`, so they
+are off by default and, once enabled, only a share of them is written. The
+keyword fields of `sampled()` / `fields()` become keys of the JSON output
+(or key=value pairs in text output).
+"""
+import json
+import logging
+import random
+
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+# 只有開啟 SOCKETIO_DEBUG 時才輸出每個封包
+SOCKETIO_LOGGERS = ("socketio", "engineio")
+
+
+def fields(**values):
+    """`extra` for a record with structured fields."""
+    return {"fields": values}
+
+
+def sampled(**values):
+    """`extra` for a high-volume record that is subject to LOG_SAMPLE_RATE."""
+    return {"fields": values, "sampled": True}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line."""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Plain text with the structured fields appended as key=value."""
+
+    def format(self, record):
+        text = super().format(record)
+        values = getattr(record, "fields", None)
+        if values:
+            text += " " + " ".join(f"{key}={value}" for key, value in values.items())
+        return text
+
+
+class SamplingFilter(logging.Filter):
+    """Pass a `rate` share of sampled records; everything else, and WARNING and above, always passes."""
+
+    def __init__(self, rate=1.0):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if self.rate >= 1 or record.levelno >= logging.WARNING or not getattr(record, "sampled", False):
+            return True
+        return random.random() < self.rate
+
+
+def configure_logging(level="INFO", fmt="text", sample_rate=1.0, socketio_debug=False):
+    """Route every logger to stderr with the given level, format ("text" or "json") and sampling."""
+    handler = logging.StreamHandler()
+    handler.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter(TEXT_FORMAT))
+    handler.addFilter(SamplingFilter(sample_rate))
+
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+    for name in SOCKETIO_LOGGERS:
+        logging.getLogger(name).setLevel(logging.DEBUG if socketio_debug else logging.WARNING)
+    # werkzeug 的每個 HTTP 請求記錄屬於除錯資訊
+    logging.getLogger("werkzeug").setLevel(logging.INFO if socketio_debug else logging.WARNING)
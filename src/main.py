@@ -1,65 +1,156 @@
 import os
 import json
+import asyncio
+import atexit
+import functools
+import hmac
+import logging
+from contextlib import contextmanager
 from flask import Flask, render_template, request, jsonify, send_file
-from flask_socketio import SocketIO, emit
+from flask_socketio import SocketIO, join_room, leave_room, rooms
 from flask_cors import CORS
 from dotenv import load_dotenv
-import openai
-import threading
 import time
+import threading
 from datetime import datetime
-import csv
-from io import StringIO
+import tempfile
 import hashlib
-import requests
 from decimal import ROUND_HALF_UP, Decimal
-from typing import Dict, Any
-from cachetools import TTLCache
-import tiktoken
 
 # Import database module
 from database.db_manager import DatabaseManager
+from database.search import parse_query
+from engine.session_manager import SessionManager, room_name
+from engine.conversation import BotConfig, ConversationState
+from engine.delta_buffer import DeltaBuffer
+from engine.history import create_history_policy
+from engine.batch import BatchJob, load_batch_configs, run_batch, run_batch_threaded
+from engine.budget import ConversationBudget
+from engine.pricing import PRICING_URL, ExchangeRates, ModelPricing
+from llm.cache import ResponseCache
+from llm.mock import MockBackend
+from llm.models import get_capabilities
+from llm.providers import create_provider
+from llm.scheduler import RequestScheduler, parse_rate_limits
+from engine.token_stats import TokenStats
+from engine.tokens import count_message_tokens, configure_cache_dir, count_tokens, estimate_prompt_tokens, warm_up
+from exporters import COLUMNAR_FORMATS, EXPORT_FORMATS, iter_csv, iter_jsonl, iter_txt, write_columnar
+from logging_config import configure_logging, fields, sampled
+from message_queue import LocalQueueManager
+from metrics import (
+    ACTIVE_CONVERSATIONS, CONVERSATION_TURN_SECONDS, COST_CALCULATION_SECONDS, HTTP_REQUEST_SECONDS, LLM_COST_USD,
+    LLM_REQUEST_SECONDS, LLM_TIME_TO_FIRST_TOKEN_SECONDS, LLM_TOKENS, REGISTRY, SOCKETIO_EVENT_DELIVERIES,
+    SOCKETIO_EVENTS
+)
+from profiler import SamplingProfiler, green_thread_library
+from tracing import FileExporter, Tracer
 
 # Load environment variables
 load_dotenv()
 
-# Configure OpenAI API
-openai.api_key = os.getenv("OPENAI_API_KEY")
+# 預設只輸出 INFO 以上；每回合的除錯記錄需設定 LOG_LEVEL=DEBUG，並依 LOG_SAMPLE_RATE 抽樣
+SOCKETIO_DEBUG = os.getenv("SOCKETIO_DEBUG", "0") == "1"
+configure_logging(
+    level=os.getenv("LOG_LEVEL", "INFO"),
+    fmt=os.getenv("LOG_FORMAT", "text").lower(),
+    sample_rate=float(os.getenv("LOG_SAMPLE_RATE", "1")),
+    socketio_debug=SOCKETIO_DEBUG
+)
+logger = logging.getLogger(__name__)
+
+# 每回合各階段的追蹤 span 寫入 TRACE_FILE (未設定則關閉)；TRACE_SAMPLE_RATE 可在執行中由 /admin/tracing 調整
+TRACE_FILE = os.getenv("TRACE_FILE")
+tracer = Tracer(
+    FileExporter(TRACE_FILE, os.getenv("TRACE_FORMAT", "json").lower()) if TRACE_FILE else None,
+    sample_rate=float(os.getenv("TRACE_SAMPLE_RATE", "1"))
+)
+atexit.register(tracer.close)
+
+# 模型後端: "openai" (OpenAI 或以 OPENAI_BASE_URL 指定的相容伺服器) 或 "mock" (本機模擬回應，供壓力測試)
+llm_provider = create_provider(
+    os.getenv("LLM_PROVIDER", "openai").lower(),
+    api_key=os.getenv("OPENAI_API_KEY"),
+    base_url=os.getenv("OPENAI_BASE_URL") or None,
+    mock_backend=MockBackend.from_env(os.environ)
+)
+
+# 對話執行模式: "thread" 每個對話一個執行緒, "asyncio" 所有對話共用一個事件迴圈
+CONVERSATION_RUNNER = os.getenv("CONVERSATION_RUNNER", "thread").lower()
+# 每回合之間的延遲秒數
+TURN_DELAY = float(os.getenv("CONVERSATION_TURN_DELAY", "0"))
+# 串流片段合併後送出的最短間隔秒數 (0 表示每個片段都立即送出)
+STREAM_FLUSH_INTERVAL = float(os.getenv("STREAM_FLUSH_INTERVAL", "0.05"))
+# 送給模型的歷史紀錄: "full" 全部, "window" 依 token 預算滑動視窗, "summary" 視窗加滾動摘要
+HISTORY_POLICY = os.getenv("HISTORY_POLICY", "full").lower()
+HISTORY_MAX_TOKENS = int(os.getenv("HISTORY_MAX_TOKENS", "0"))
+HISTORY_RESERVE_TOKENS = int(os.getenv("HISTORY_RESERVE_TOKENS", "1000"))
+HISTORY_SUMMARY_INTERVAL = int(os.getenv("HISTORY_SUMMARY_INTERVAL", "10"))
+# 每個對話的預設花費上限，未在對話設定中指定時使用 (0 表示不限制)
+DEFAULT_BUDGET = ConversationBudget.from_dict({
+    'max_tokens': os.getenv("CONVERSATION_MAX_TOKENS"),
+    'max_cost_twd': os.getenv("CONVERSATION_MAX_COST_TWD"),
+    'max_cost_usd': os.getenv("CONVERSATION_MAX_COST_USD")
+})
 
 # Initialize Flask app
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.getenv("SECRET_KEY", "default_secret_key")
-print(os.getenv("OPENAI_API_KEY"))
 CORS(app)
-# 更新 Socket.IO 配置，解決即時更新問題
+
+# 多個 worker 共用事件: redis:// 等 URL 交給 Flask-SocketIO，local://host:port 使用 message_queue.py 的本機代理
+SOCKETIO_MESSAGE_QUEUE = os.getenv("SOCKETIO_MESSAGE_QUEUE")
+if SOCKETIO_MESSAGE_QUEUE and SOCKETIO_MESSAGE_QUEUE.startswith("local://"):
+    _queue_options = {'client_manager': LocalQueueManager(SOCKETIO_MESSAGE_QUEUE)}
+elif SOCKETIO_MESSAGE_QUEUE:
+    _queue_options = {'message_queue': SOCKETIO_MESSAGE_QUEUE}
+else:
+    _queue_options = {}
+
+# 開發時使用 threading；正式環境由 serve.py 設定為 eventlet 或 gevent
 socketio = SocketIO(app, 
                    cors_allowed_origins="*", 
-                   async_mode='threading',  # 改為 threading 模式以提高穩定性
+                   async_mode=os.getenv("SOCKETIO_ASYNC_MODE", "threading"),
                    ping_timeout=60,        # 增加超時設定
                    ping_interval=25,       # 增加ping間隔
-                   engineio_logger=True,   # 啟用引擎日誌以便調試
-                   logger=True)            # 啟用主日誌
+                   http_compression=True,  # 超過門檻的 polling 封包以 gzip/deflate 壓縮
+                   compression_threshold=int(os.getenv("SOCKETIO_COMPRESSION_THRESHOLD", "1024")),
+                   engineio_logger=SOCKETIO_DEBUG,  # 每個封包的記錄只在除錯時開啟
+                   logger=SOCKETIO_DEBUG,
+                   **_queue_options)
+
+# 美元匯率表，例如 "TWD=31.5,JPY=150"
+exchange_rates = ExchangeRates.parse(os.getenv("EXCHANGE_RATES", "TWD=31.5"))
+
+# 所有對話共用的請求排程: 每個模型的 RPM/TPM 限制、同時請求上限與重試
+request_scheduler = RequestScheduler(
+    limits=parse_rate_limits(os.getenv("RATE_LIMITS")),
+    default_rpm=int(os.getenv("RATE_LIMIT_RPM", "0")),
+    default_tpm=int(os.getenv("RATE_LIMIT_TPM", "0")),
+    max_concurrency=int(os.getenv("MAX_CONCURRENT_REQUESTS", "32")),
+    max_retries=int(os.getenv("REQUEST_MAX_RETRIES", "5")),
+    backoff_base=float(os.getenv("REQUEST_BACKOFF_BASE", "1")),
+    backoff_max=float(os.getenv("REQUEST_BACKOFF_MAX", "60"))
+)
 
 # Initialize database
-db_manager = DatabaseManager()
+db_manager = DatabaseManager(usd_to_twd=exchange_rates.rate("TWD"))
+if os.getenv("DB_WRITE_BEHIND", "0") == "1":
+    db_manager.enable_write_behind(
+        flush_interval=float(os.getenv("DB_WRITE_BEHIND_INTERVAL", "0.2")),
+        batch_size=int(os.getenv("DB_WRITE_BEHIND_BATCH", "200"))
+    )
+atexit.register(db_manager.close)
 
-# Global variables
-conversation_active = False
-conversation_thread = None
-conversation_id = None
+# Running conversations, keyed by conversation ID
+session_manager = SessionManager(max_sessions=int(os.getenv("MAX_ACTIVE_CONVERSATIONS", "50")))
+ACTIVE_CONVERSATIONS.callback = session_manager.active_count
 
 # Token pricing configuration
 class TokenConfig:
     DATA_DIR = os.path.join(os.getcwd(), "data")
     CACHE_DIR = os.path.join(DATA_DIR, ".cache")
     DECIMALS = "0.00000001"
-    DEBUG = False
     CACHE_TTL = 432000  # 5 days cache TTL for model pricing
-    CACHE_MAXSIZE = 16
-    USD_TO_TWD = 31.5  # 1 USD = 31.5 TWD
-
-# Initialize token pricing cache
-token_cache = TTLCache(maxsize=TokenConfig.CACHE_MAXSIZE, ttl=TokenConfig.CACHE_TTL)
 
 # Available models
 available_models = [
@@ -71,140 +162,43 @@ available_models = [
     "o1-mini"
 ]
 
-# Helper function to get encoding for a model
-def get_encoding(model):
-    try:
-        return tiktoken.encoding_for_model(model)
-    except KeyError:
-        return tiktoken.get_encoding("cl100k_base")
-
-# Model Cost Manager class
-class ModelCostManager:
-    _instance = None
-    _best_match_cache = {}
-    
-    def __new__(cls):
-        if cls._instance is None:
-            cls._instance = super(ModelCostManager, cls).__new__(cls)
-            cls._instance.url = "https://raw.githubusercontent.com/BerriAI/litellm/main/model_prices_and_context_window.json"
-            cls._instance.cache_file_path = cls._instance._get_cache_filename()
-            cls._instance._ensure_cache_dir()
-        return cls._instance
-    
-    def _ensure_cache_dir(self):
-        if not os.path.exists(TokenConfig.CACHE_DIR):
-            os.makedirs(TokenConfig.CACHE_DIR)
-    
-    def _get_cache_filename(self):
-        cache_file_name = hashlib.sha256(self.url.encode()).hexdigest() + ".json"
-        return os.path.normpath(os.path.join(TokenConfig.CACHE_DIR, cache_file_name))
-    
-    def _is_cache_valid(self, cache_file_path):
-        if not os.path.exists(cache_file_path):
-            return False
-        cache_file_mtime = os.path.getmtime(cache_file_path)
-        return time.time() - cache_file_mtime < TokenConfig.CACHE_TTL
-    
-    def get_cost_data(self):
-        """获取模型价格数据，优先从缓存获取"""
-        if os.path.exists(self.cache_file_path) and self._is_cache_valid(self.cache_file_path):
-            with open(self.cache_file_path, "r", encoding="UTF-8") as cache_file:
-                return json.load(cache_file)
-        
-        try:
-            response = requests.get(self.url)
-            response.raise_for_status()
-            data = response.json()
-            
-            # 备份和存储新的价格数据
-            if os.path.exists(self.cache_file_path):
-                os.rename(self.cache_file_path, self.cache_file_path + ".bkp")
-                
-            with open(self.cache_file_path, "w", encoding="UTF-8") as cache_file:
-                json.dump(data, cache_file)
-            
-            return data
-        except Exception as e:
-            print(f"Error fetching model price data: {e}")
-            # 尝试使用备份
-            if os.path.exists(self.cache_file_path + ".bkp"):
-                with open(self.cache_file_path + ".bkp", "r", encoding="UTF-8") as cache_file:
-                    return json.load(cache_file)
-            # 如果没有备份，使用内置默认价格
-            return self._get_default_pricing()
-    
-    def _get_default_pricing(self):
-        """返回默认价格，当在线获取失败时使用"""
-        return {
-            "gpt-4o": {
-                "input_cost_per_token": 0.000005,
-                "output_cost_per_token": 0.000015
-            },
-            "gpt-4-turbo": {
-                "input_cost_per_token": 0.00001,
-                "output_cost_per_token": 0.00003
-            },
-            "gpt-4": {
-                "input_cost_per_token": 0.00003,
-                "output_cost_per_token": 0.00006
-            },
-            "gpt-3.5-turbo": {
-                "input_cost_per_token": 0.0000005,
-                "output_cost_per_token": 0.0000015
-            }
-        }
-    
-    def get_model_data(self, model: str) -> Dict[str, Any]:
-        """获取指定模型的价格数据"""
-        if model in self._best_match_cache:
-            return self._best_match_cache[model]
-        
-        json_data = self.get_cost_data()
-        sanitized_model = self._sanitize_model_name(model)
-        
-        # 直接匹配
-        if sanitized_model in json_data:
-            self._best_match_cache[model] = json_data[sanitized_model]
-            return json_data[sanitized_model]
-        
-        # 部分匹配
-        for key in json_data:
-            if sanitized_model in key or key in sanitized_model:
-                self._best_match_cache[model] = json_data[key]
-                return json_data[key]
-        
-        # 如果都找不到匹配，使用默认价格或者模型别名映射
-        default_pricing = self._get_default_pricing()
-        if model in default_pricing:
-            self._best_match_cache[model] = default_pricing[model]
-            return default_pricing[model]
-        
-        # 使用gpt-3.5-turbo作为后备方案
-        self._best_match_cache[model] = default_pricing["gpt-3.5-turbo"]
-        return default_pricing["gpt-3.5-turbo"]
-    
-    def _sanitize_model_name(self, name: str) -> str:
-        """清理模型名称，移除前缀和后缀"""
-        prefixes = ["openai/", "github/", "google_genai/", "deepseek/"]
-        suffixes = ["-tuned"]
-        # 移除前缀
-        for prefix in prefixes:
-            if name.startswith(prefix):
-                name = name[len(prefix):]
-        # 移除后缀
-        for suffix in suffixes:
-            if name.endswith(suffix):
-                name = name[:-len(suffix)]
-        return name.lower().strip()
+# 回應快取: off / on / record / replay，replay 只使用錄好的回應，可離線重跑模擬
+response_cache = ResponseCache(
+    mode=os.getenv("RESPONSE_CACHE", "off"),
+    directory=os.getenv("RESPONSE_CACHE_DIR", os.path.join(TokenConfig.CACHE_DIR, "responses")),
+    max_entries=int(os.getenv("RESPONSE_CACHE_SIZE", "1024")),
+    ttl=int(os.getenv("RESPONSE_CACHE_TTL", "0"))
+)
+
+# tiktoken 的 BPE 檔案快取目錄，放好檔案後離線主機也能計算 token
+TIKTOKEN_CACHE_DIR = os.getenv("TIKTOKEN_CACHE_DIR", os.path.join(TokenConfig.CACHE_DIR, "tiktoken"))
+# 在任何編碼器載入前設定，背景預熱與對話執行緒都讀同一個目錄
+configure_cache_dir(TIKTOKEN_CACHE_DIR)
+
+# 模型價格: 啟動時載入快取或內建快照，之後由背景執行緒更新
+model_pricing = ModelPricing(
+    cache_path=os.path.join(
+        TokenConfig.CACHE_DIR,
+        hashlib.sha256(os.getenv("PRICING_URL", PRICING_URL).encode()).hexdigest() + ".json"
+    ),
+    url=os.getenv("PRICING_URL", PRICING_URL),
+    ttl=TokenConfig.CACHE_TTL,
+    timeout=float(os.getenv("PRICING_TIMEOUT", "10"))
+)
 
 # Cost Calculator class
 class CostCalculator:
-    def __init__(self):
-        self.model_cost_manager = ModelCostManager()
+    def __init__(self, model_pricing, exchange_rates):
+        self.model_pricing = model_pricing
+        self.exchange_rates = exchange_rates
     
     def calculate_cost(self, model: str, prompt_tokens: int, completion_tokens: int) -> (Decimal, Decimal):
         """计算使用模型的成本，返回美元和新台币价格"""
-        model_pricing_data = self.model_cost_manager.get_model_data(model)
+        with COST_CALCULATION_SECONDS.time():
+            return self._calculate_cost(model, prompt_tokens, completion_tokens)
+    
+    def _calculate_cost(self, model, prompt_tokens, completion_tokens):
+        model_pricing_data = self.model_pricing.get_model_data(model)
         
         # 获取每个token的输入输出成本
         input_cost_per_token = Decimal(str(model_pricing_data.get("input_cost_per_token", 0)))
@@ -216,7 +210,7 @@ class CostCalculator:
         
         # 计算总成本(美元)并转换为新台币
         total_cost_usd = input_cost + output_cost
-        total_cost_twd = total_cost_usd * Decimal(TokenConfig.USD_TO_TWD)
+        total_cost_twd = total_cost_usd * Decimal(str(self.exchange_rates.rate("TWD")))
         
         # 四舍五入到指定精度
         total_cost_usd = total_cost_usd.quantize(Decimal(TokenConfig.DECIMALS), rounding=ROUND_HALF_UP)
@@ -225,482 +219,1034 @@ class CostCalculator:
         return total_cost_usd, total_cost_twd
 
 # 初始化成本计算器
-cost_calculator = CostCalculator()
+cost_calculator = CostCalculator(model_pricing, exchange_rates)
+
+# 依模型的 context 上限裁切送出的歷史紀錄
+history_policy = create_history_policy(
+    HISTORY_POLICY,
+    model_pricing.get_context_limit,
+    reserve_tokens=HISTORY_RESERVE_TOKENS,
+    max_tokens=HISTORY_MAX_TOKENS,
+    summary_interval=HISTORY_SUMMARY_INTERVAL
+)
 
 # Routes
 @app.route('/')
 def index():
     return render_template('index.html', models=available_models)
 
+# Prometheus 格式的指標；設定 METRICS_ENABLED=0 可關閉
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    if os.getenv("METRICS_ENABLED", "1") != "1":
+        return jsonify({"error": "Metrics are disabled"}), 404
+    return app.response_class(REGISTRY.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+# 管理端點 (效能剖析、追蹤取樣率) 需要 ADMIN_TOKEN；未設定時停用
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+# 一次剖析的最長秒數
+MAX_PROFILE_SECONDS = 60
+profiler = SamplingProfiler()
+
+def _admin_route(view):
+    """Require `Authorization: Bearer <ADMIN_TOKEN>`; without ADMIN_TOKEN the route does not exist."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not ADMIN_TOKEN:
+            return jsonify({"error": "Admin endpoints are disabled"}), 404
+        header = request.headers.get('Authorization', '')
+        supplied = header[7:] if header.startswith('Bearer ') else ''
+        if not hmac.compare_digest(supplied.encode(), ADMIN_TOKEN.encode()):
+            return jsonify({"error": "Unauthorized"}), 401
+        return view(*args, **kwargs)
+    return wrapper
+
+@app.route('/admin/profile', methods=['GET', 'POST'])
+@_admin_route
+def admin_profile():
+    """Sample every thread's stack for `seconds` and return the wall-clock profile.
+    
+    Waiting threads are sampled too, so blocking calls show up alongside
+    computation. `format` is "collapsed" (flame graph input) or "json" (top functions);
+    `threads` keeps only threads whose name contains it.
+    """
+    seconds = request.args.get('seconds', 10, type=float)
+    if not 0 < seconds <= MAX_PROFILE_SECONDS:
+        return jsonify({"error": f"seconds must be between 0 and {MAX_PROFILE_SECONDS}"}), 400
+    format_type = request.args.get('format', 'collapsed')
+    if format_type not in ('collapsed', 'json'):
+        return jsonify({"error": "Invalid format specified"}), 400
+    green_threads = green_thread_library()
+    if green_threads:
+        return jsonify({"error": f"Profiling is not available under {green_threads}: its green threads are "
+                                 "invisible to the sampler. Profile a worker started with `python main.py`."}), 501
+    
+    profile = profiler.run(seconds, thread_filter=request.args.get('threads'))
+    if profile is None:
+        return jsonify({"error": "A profile is already running"}), 409
+    if format_type == 'json':
+        return jsonify(profile.top(request.args.get('limit', 30, type=int)))
+    return app.response_class(profile.collapsed(), mimetype='text/plain')
+
+@app.route('/admin/tracing', methods=['GET', 'POST'])
+@_admin_route
+def admin_tracing():
+    """Show the tracing settings; POST {"sample_rate": 0.1} changes the share of traced turns."""
+    if request.method == 'POST':
+        if not tracer.enabled:
+            return jsonify({"error": "Tracing is off; set TRACE_FILE and restart"}), 409
+        sample_rate = (request.get_json(silent=True) or {}).get('sample_rate')
+        if not isinstance(sample_rate, (int, float)) or not 0 <= sample_rate <= 1:
+            return jsonify({"error": "sample_rate must be a number between 0 and 1"}), 400
+        tracer.sample_rate = float(sample_rate)
+        logger.info("追蹤取樣率已變更", extra=fields(sample_rate=tracer.sample_rate))
+    return jsonify({
+        "enabled": tracer.enabled,
+        "file": TRACE_FILE,
+        "format": tracer.exporter.fmt if tracer.enabled else None,
+        "sample_rate": tracer.sample_rate
+    })
+
+def _timed_route(view):
+    """Observe a route's latency in HTTP_REQUEST_SECONDS.
+    
+    Streamed responses are observed when the last chunk has been sent.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        response = app.make_response(view(*args, **kwargs))
+        response.call_on_close(lambda: HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - start, endpoint=view.__name__, status=response.status_code
+        ))
+        return response
+    return wrapper
+
 # API routes
 @app.route('/api/models', methods=['GET'])
 def get_models():
     return jsonify({"models": available_models})
 
+# 分頁大小上限
+MAX_PAGE_SIZE = 500
+
+def _page_args(default_limit):
+    """Read `limit` and `before_id` query parameters for cursor pagination."""
+    limit = request.args.get('limit', default_limit, type=int)
+    limit = max(0, min(limit, MAX_PAGE_SIZE))
+    before_id = request.args.get('before_id', type=int)
+    return limit, before_id
+
 @app.route('/api/conversations', methods=['GET'])
+@_timed_route
 def get_conversations():
-    conversations = db_manager.get_all_conversations()
-    return jsonify({"conversations": conversations})
+    limit, before_id = _page_args(50)
+    conversations, next_before_id = db_manager.get_conversations_page(limit, before_id)
+    return jsonify({"conversations": conversations, "next_before_id": next_before_id})
+
+@app.route('/api/search', methods=['GET'])
+@_timed_route
+def search():
+    """Full-text search: `q` (words or "phrases" that must all appear), `type`
+    ("all", "message" or "conversation"), `limit` and `offset`.
+    
+    Snippets are HTML with the matched text in <mark>.
+    """
+    try:
+        query = parse_query(request.args.get('q', ''))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    search_type = request.args.get('type', 'all')
+    if search_type == 'all':
+        kinds = db_manager.SEARCH_KINDS
+    elif search_type in db_manager.SEARCH_KINDS:
+        kinds = (search_type,)
+    else:
+        return jsonify({"error": "Invalid type specified"}), 400
+    limit = max(0, min(request.args.get('limit', 20, type=int), MAX_PAGE_SIZE))
+    offset = max(0, request.args.get('offset', 0, type=int))
+    
+    results, next_offset = db_manager.search(query, limit, offset, kinds)
+    return jsonify({"results": results, "next_offset": next_offset})
 
 @app.route('/api/conversation/<int:conv_id>', methods=['GET'])
+@_timed_route
 def get_conversation(conv_id):
     conversation = db_manager.get_conversation_by_id(conv_id)
     if conversation:
-        messages = db_manager.get_messages_by_conversation_id(conv_id)
-        token_stats = db_manager.get_conversation_token_stats(conv_id)
+        limit, before_id = _page_args(200)
+        if limit:
+            messages, next_before_id = db_manager.get_messages_page(conv_id, limit, before_id)
+        else:
+            messages, next_before_id = [], None
+        # 只有第一頁需要附上統計資料
+        token_stats = db_manager.get_conversation_token_stats(conv_id) if before_id is None else None
         return jsonify({
             "conversation": conversation, 
             "messages": messages,
+            "next_before_id": next_before_id,
             "token_stats": token_stats
         })
     return jsonify({"error": "Conversation not found"}), 404
 
 @app.route('/api/conversation/<int:conv_id>/token_stats', methods=['GET'])
+@_timed_route
 def get_conversation_token_stats(conv_id):
+    # 進行中的對話直接使用記憶體中的統計
+    session = session_manager.get(conv_id)
+    if session is not None and session.token_stats is not None:
+        return jsonify({"token_stats": session.token_stats.to_dict()})
+    
     token_stats = db_manager.get_conversation_token_stats(conv_id)
     if token_stats:
         # Convert any possible Decimal values to float for JSON serialization
-        token_stats['total_cost'] = float(token_stats['total_cost'])
-        
-        # Convert any Decimal values in bot_stats
-        if 'bot_stats' in token_stats:
-            for bot_name in token_stats['bot_stats']:
-                if 'cost' in token_stats['bot_stats'][bot_name]:
-                    token_stats['bot_stats'][bot_name]['cost'] = float(token_stats['bot_stats'][bot_name]['cost'])
-        
+        _serialize_token_stats(token_stats)
         return jsonify({"token_stats": token_stats})
     return jsonify({"error": "Conversation not found or no token data available"}), 404
 
 @app.route('/api/conversation/<int:conv_id>', methods=['DELETE'])
 def delete_conversation(conv_id):
+    session_manager.remove(conv_id)
     success = db_manager.delete_conversation(conv_id)
     if success:
         return jsonify({"status": "success", "message": f"Conversation {conv_id} deleted"})
     return jsonify({"error": "Failed to delete conversation"}), 500
 
+def _export_response(format_type, filename, messages, get_token_stats=None, conversations=None):
+    """Build a streaming download of `messages` in the requested format.
+    
+    `conversations` (id -> record) marks a multi-conversation export.
+    """
+    mimetype, extension = EXPORT_FORMATS[format_type]
+    headers = {"Content-Disposition": f"attachment;filename={filename}.{extension}"}
+    
+    if format_type in COLUMNAR_FORMATS:
+        # 欄位式格式需要完整檔案結構，逐批寫入暫存檔後再傳送
+        output = tempfile.TemporaryFile()
+        try:
+            write_columnar(messages, output, format_type)
+        except ImportError:
+            output.close()
+            return jsonify({"error": f"{format_type} export requires the pyarrow package"}), 501
+        output.seek(0)
+        return send_file(output, mimetype=mimetype, as_attachment=True, download_name=f"{filename}.{extension}")
+    
+    if format_type == 'csv':
+        body = iter_csv(messages, get_token_stats, include_conversation_id=conversations is not None)
+    elif format_type == 'txt':
+        body = iter_txt(messages, get_token_stats, conversations=conversations)
+    else:
+        body = iter_jsonl(messages)
+    
+    return app.response_class(response=body, mimetype=mimetype, headers=headers)
+
 @app.route('/api/conversation/<int:conv_id>/export', methods=['GET'])
+@_timed_route
 def export_conversation(conv_id):
     format_type = request.args.get('format', 'csv')
     conversation = db_manager.get_conversation_by_id(conv_id)
-    messages = db_manager.get_messages_by_conversation_id(conv_id)
-    token_stats = db_manager.get_conversation_token_stats(conv_id)
     
     if not conversation:
         return jsonify({"error": "Conversation not found"}), 404
+    if format_type not in EXPORT_FORMATS:
+        return jsonify({"error": "Invalid format specified"}), 400
     
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     filename = f"conversation_{conv_id}_{timestamp}"
     
-    if format_type == 'csv':
-        output = StringIO()
-        writer = csv.writer(output)
-        writer.writerow(['Timestamp', 'Bot', 'Message', 'Prompt Tokens', 'Completion Tokens', 'Total Tokens', 'Cost (TWD)'])
-        for msg in messages:
-            writer.writerow([
-                msg['timestamp'], 
-                msg['bot_name'], 
-                msg['content'],
-                msg.get('prompt_tokens', 0),
-                msg.get('completion_tokens', 0),
-                msg.get('total_tokens', 0),
-                f"NT$ {msg.get('cost', 0):.2f}"
-            ])
-        
-        # Add token summary
-        if token_stats:
-            writer.writerow([])
-            writer.writerow(['Token Summary'])
-            writer.writerow(['Total Tokens', token_stats['total_tokens']])
-            writer.writerow(['Total Cost (TWD)', f"NT$ {token_stats['total_cost']:.2f}"])
-        
-        response = app.response_class(
-            response=output.getvalue(),
-            mimetype='text/csv',
-            headers={"Content-Disposition": f"attachment;filename={filename}.csv"}
-        )
-        return response
+    return _export_response(
+        format_type, filename,
+        db_manager.iter_messages([conv_id]),
+        get_token_stats=lambda: db_manager.get_conversation_token_stats(conv_id)
+    )
+
+@app.route('/api/export', methods=['GET', 'POST'])
+@_timed_route
+def export_conversations():
+    """Export many conversations in one file.
     
-    elif format_type == 'txt':
-        output = ""
-        for msg in messages:
-            output += f"[{msg['timestamp']}] {msg['bot_name']}: {msg['content']}\n"
-            if 'total_tokens' in msg and msg['total_tokens'] > 0:
-                output += f"Tokens: {msg.get('total_tokens', 0)} (Prompt: {msg.get('prompt_tokens', 0)}, Completion: {msg.get('completion_tokens', 0)})\n"
-                output += f"Cost: NT$ {msg.get('cost', 0):.2f}\n"
-            output += "\n"
-        
-        # Add token summary
-        if token_stats:
-            output += "\n--- Token Summary ---\n"
-            output += f"Total Tokens: {token_stats['total_tokens']}\n"
-            output += f"Total Cost: NT$ {token_stats['total_cost']:.2f}\n"
-        
-        response = app.response_class(
-            response=output,
-            mimetype='text/plain',
-            headers={"Content-Disposition": f"attachment;filename={filename}.txt"}
-        )
-        return response
+    Conversation IDs come from `ids` (comma separated query parameter or a JSON
+    body {"ids": [...]}); without IDs every conversation is exported.
+    """
+    format_type = request.args.get('format', 'jsonl')
+    if format_type not in EXPORT_FORMATS:
+        return jsonify({"error": "Invalid format specified"}), 400
     
-    return jsonify({"error": "Invalid format specified"}), 400
-
-# Helper function to calculate token count
-def count_tokens(text: str, model: str = "gpt-4") -> int:
-    """Calculate the number of tokens in a text string"""
-    enc = get_encoding(model)
-    return len(enc.encode(text))
+    body = request.get_json(silent=True) or {}
+    ids = body.get('ids') if isinstance(body, dict) else None
+    if ids is not None:
+        # bool 是 int 的子類別，因此比對確切型別
+        if not isinstance(ids, list) or not all(type(conv_id) is int for conv_id in ids):
+            return jsonify({"error": "ids must be a list of integers"}), 400
+    elif request.args.get('ids'):
+        try:
+            ids = [int(conv_id) for conv_id in request.args['ids'].split(',') if conv_id.strip()]
+        except ValueError:
+            return jsonify({"error": "ids must be a comma separated list of integers"}), 400
+    
+    # 純文字格式需要每個對話的標題
+    conversations = {}
+    if format_type == 'txt':
+        if ids is not None:
+            records = db_manager.get_conversations_by_ids(ids)
+        else:
+            records = db_manager.get_all_conversations()
+        conversations = {record['id']: record for record in records}
+    
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return _export_response(
+        format_type, f"conversations_{timestamp}",
+        db_manager.iter_messages(ids),
+        conversations=conversations
+    )
 
 # Socket events
 @socketio.on('connect')
 def handle_connect():
-    print('Client connected')
+    logger.debug('Client connected', extra=fields(sid=request.sid))
 
 @socketio.on('disconnect')
 def handle_disconnect():
-    print('Client disconnected')
-    global conversation_active
-    conversation_active = False
+    logger.debug('Client disconnected', extra=fields(sid=request.sid))
+    # 只暫停這個客戶端啟動的對話，不影響其他人的對話
+    session_manager.pause_owned_by(request.sid)
+
+def _watch(room):
+    """Subscribe the requesting client to one conversation room, leaving any other."""
+    for joined in rooms():
+        if joined.startswith('conversation_') and joined != room:
+            leave_room(joined)
+    join_room(room)
+
+@socketio.on('watch_conversation')
+def handle_watch_conversation(data):
+    """Receive the events of a conversation, e.g. after loading it; returns its current token stats."""
+    conv_id = int(data['conversation_id'])
+    _watch(room_name(conv_id))
+    session = session_manager.get(conv_id)
+    if session is not None and session.is_alive() and session.token_stats is not None:
+        token_stats = session.token_stats.to_dict()
+    else:
+        token_stats = _serialize_token_stats(db_manager.get_conversation_token_stats(conv_id))
+    return {"status": "success", "conversation_id": conv_id, "token_stats": token_stats}
+
+def _resolve_session(data):
+    """Find the session a pause/resume request refers to."""
+    conv_id = data.get('conversation_id') if isinstance(data, dict) else None
+    if conv_id is not None:
+        return int(conv_id), session_manager.get(int(conv_id))
+    # 舊版客戶端沒有傳 conversation_id，使用該客戶端最近啟動的對話
+    conv_id = session_manager.last_started_by(request.sid)
+    return conv_id, (session_manager.get(conv_id) if conv_id is not None else None)
+
+def _parse_conversation_config(data):
+    """Fill in defaults for a conversation config sent by a client or batch file."""
+    return {
+        'bot1_name': data.get('bot1_name', 'Bot 1'),
+        'bot1_system_prompt': data.get('bot1_system_prompt', 'You are a helpful AI assistant.'),
+        'bot1_model': data.get('bot1_model', 'gpt-3.5-turbo'),
+        
+        'bot2_name': data.get('bot2_name', 'Bot 2'),
+        'bot2_system_prompt': data.get('bot2_system_prompt', 'You are a helpful AI assistant.'),
+        'bot2_model': data.get('bot2_model', 'gpt-3.5-turbo'),
+        
+        'initial_message': data.get('initial_message', 'Hello! Let\'s have a conversation.'),
+        
+        # 获取自定义标题（如果有提供）
+        'conversation_title': data.get('conversation_title'),
+        
+        # 花費上限，未指定的項目使用伺服器預設值
+        **{name: data.get(name, getattr(DEFAULT_BUDGET, name)) for name in ConversationBudget.LIMITS}
+    }
+
+def _create_conversation(config):
+    """Create a new conversation in database and return its ID."""
+    return db_manager.create_conversation(
+        config['bot1_name'], config['bot1_system_prompt'], config['bot1_model'],
+        config['bot2_name'], config['bot2_system_prompt'], config['bot2_model'],
+        title=config['conversation_title'],  # 传递自定义标题
+        budget=ConversationBudget.from_dict(config).to_dict()
+    )
+
+def _conversation_args(config):
+    return (
+        config['bot1_name'], config['bot1_system_prompt'], config['bot1_model'],
+        config['bot2_name'], config['bot2_system_prompt'], config['bot2_model'],
+        config['initial_message']
+    )
 
 @socketio.on('start_conversation')
 def handle_start_conversation(data):
-    global conversation_active, conversation_thread, conversation_id
-    
-    if conversation_active:
-        return {"status": "error", "message": "Conversation already active"}
-    
     # Get parameters from request
-    bot1_name = data.get('bot1_name', 'Bot 1')
-    bot1_system_prompt = data.get('bot1_system_prompt', 'You are a helpful AI assistant.')
-    bot1_model = data.get('bot1_model', 'gpt-3.5-turbo')
-    
-    bot2_name = data.get('bot2_name', 'Bot 2')
-    bot2_system_prompt = data.get('bot2_system_prompt', 'You are a helpful AI assistant.')
-    bot2_model = data.get('bot2_model', 'gpt-3.5-turbo')
-    
-    initial_message = data.get('initial_message', 'Hello! Let\'s have a conversation.')
-    
-    # 获取自定义标题（如果有提供）
-    custom_title = data.get('conversation_title')
+    config = _parse_conversation_config(data)
     
     # Create a new conversation in database
-    conversation_id = db_manager.create_conversation(
-        bot1_name, bot1_system_prompt, bot1_model,
-        bot2_name, bot2_system_prompt, bot2_model,
-        title=custom_title  # 传递自定义标题
-    )
+    conversation_id = _create_conversation(config)
+    
+    # 先加入房間再啟動，避免第一則訊息在加入前送出而遺失
+    _watch(room_name(conversation_id))
     
     # Start conversation thread
-    conversation_active = True
-    conversation_thread = threading.Thread(
-        target=run_conversation,
-        args=(
-            conversation_id,
-            bot1_name, bot1_system_prompt, bot1_model,
-            bot2_name, bot2_system_prompt, bot2_model,
-            initial_message
-        )
+    session = session_manager.start(
+        conversation_id,
+        run_conversation_async if CONVERSATION_RUNNER == "asyncio" else run_conversation,
+        args=_conversation_args(config),
+        kwargs={'budget': ConversationBudget.from_dict(config)},
+        owner_sid=request.sid
     )
-    conversation_thread.daemon = True
-    conversation_thread.start()
+    if session is None:
+        return {"status": "error", "message": "Too many active conversations"}
     
     return {"status": "success", "conversation_id": conversation_id}
 
 @socketio.on('pause_conversation')
 def handle_pause_conversation(data=None):
-    global conversation_active
-    
-    print("暫停對話請求已接收")  # 增加調試信息
-    conversation_active = False
-    time.sleep(0.5)  # 確保暫停狀態已設置
-    return {"status": "success", "message": "Conversation paused"}
+    logger.debug("暫停對話請求已接收")
+    conv_id, session = _resolve_session(data)
+    if session is None:
+        return {"status": "error", "message": "No active conversation ID"}
+    session.pause()
+    return {"status": "success", "message": "Conversation paused", "conversation_id": conv_id}
 
 @socketio.on('resume_conversation')
 def handle_resume_conversation(data=None):
-    global conversation_active, conversation_thread, conversation_id
-    
-    print("繼續對話請求已接收")  # 增加調試信息
+    logger.debug("繼續對話請求已接收")
+    conv_id, session = _resolve_session(data)
     
     # 檢查 conversation_id 是否存在
-    if not conversation_id:
+    if not conv_id:
         return {"status": "error", "message": "No active conversation ID"}
         
-    # 如果線程已經結束，重新啟動
-    if conversation_thread and not conversation_thread.is_alive():
+    # 如果線程已經結束（或伺服器重啟過），重新啟動
+    if session is None or not session.is_alive():
         # 獲取最後對話的配置
-        convo = db_manager.get_conversation_by_id(conversation_id)
+        convo = db_manager.get_conversation_by_id(conv_id)
         if not convo:
             return {"status": "error", "message": "Conversation not found"}
             
         # 重新啟動對話線程
-        conversation_active = True
-        conversation_thread = threading.Thread(
-            target=resume_conversation_thread,
-            args=(conversation_id,)
-        )
-        conversation_thread.daemon = True
-        conversation_thread.start()
-        return {"status": "success", "message": "Conversation restarted"}
+        resume_target = resume_conversation_async if CONVERSATION_RUNNER == "asyncio" else resume_conversation_thread
+        _watch(room_name(conv_id))
+        session = session_manager.start(conv_id, resume_target, owner_sid=request.sid)
+        if session is None:
+            return {"status": "error", "message": "Too many active conversations"}
+        return {"status": "success", "message": "Conversation restarted", "conversation_id": conv_id}
     else:
         # 簡單地恢復現有對話
-        conversation_active = True
-        return {"status": "success", "message": "Conversation resumed"}
+        session.owner_sid = request.sid
+        _watch(session.room)
+        session.resume()
+        return {"status": "success", "message": "Conversation resumed", "conversation_id": conv_id}
 
-# 添加一個新函數用於恢復對話
-def resume_conversation_thread(conv_id):
-    """重新啟動一個已經暫停的對話"""
-    global conversation_active
+def _serialize_token_stats(token_stats):
+    """Convert Decimal values in token stats to float for JSON serialization."""
+    if token_stats:
+        token_stats['total_cost'] = float(token_stats['total_cost'])
+        if 'bot_stats' in token_stats:
+            for bot_name in token_stats['bot_stats']:
+                if 'cost' in token_stats['bot_stats'][bot_name]:
+                    token_stats['bot_stats'][bot_name]['cost'] = float(token_stats['bot_stats'][bot_name]['cost'])
+    return token_stats
+
+def _room_size(room):
+    """Number of clients in `room` connected to this process, or 0 if the manager cannot tell."""
+    try:
+        return sum(1 for _ in socketio.server.manager.get_participants('/', room))
+    except Exception:
+        # 指標不應影響事件送出；不同 client manager 的行為可能不一致
+        return 0
+
+def _emit(event, data, room):
+    """Emit `event` to a conversation room, counting it and its recipients on this process."""
+    SOCKETIO_EVENTS.inc(event=event)
+    SOCKETIO_EVENT_DELIVERIES.inc(_room_size(room), event=event)
+    with tracer.span("emit", event=event):
+        socketio.emit(event, data, to=room)
+
+def _emit_token_stats(session):
+    _emit('token_stats_update', session.token_stats.to_dict(), session.room)
+
+def _count_usage(model, prompt_tokens, completion_tokens, cost_usd):
+    LLM_TOKENS.inc(prompt_tokens, model=model, kind="prompt")
+    LLM_TOKENS.inc(completion_tokens, model=model, kind="completion")
+    LLM_COST_USD.inc(float(cost_usd), model=model)
+
+def _add_token_stats(session, bot_name, prompt_tokens, completion_tokens, cost_twd, cost_usd):
+    """Add usage to the session's totals and send watchers only the increment.
+
+    Clients apply the `token_stats_delta` to the snapshot they got from
+    `token_stats_update` or `watch_conversation`.
+    """
+    session.token_stats.add(bot_name, prompt_tokens, completion_tokens, cost_twd, cost_usd)
+    _emit('token_stats_delta', {
+        'conversation_id': session.conversation_id,
+        'bot': bot_name,
+        'prompt_tokens': prompt_tokens,
+        'completion_tokens': completion_tokens,
+        'total_tokens': prompt_tokens + completion_tokens,
+        'cost': float(cost_twd),
+        'cost_usd': float(cost_usd)
+    }, session.room)
+
+def _report_error(session, e):
+    error_msg = f"Error in conversation: {str(e)}"
+    logger.error(error_msg, extra=fields(conversation_id=session.conversation_id))
+    session.last_error = str(e)
+    _emit('error', {'message': error_msg}, session.room)
+
+def _load_resume_args(session):
+    """Read the stored configuration needed to continue a conversation."""
+    conv_id = session.conversation_id
     
     # 獲取對話配置
     convo = db_manager.get_conversation_by_id(conv_id)
     if not convo:
-        socketio.emit('error', {'message': f"Error: Conversation {conv_id} not found"})
-        return
+        _emit('error', {'message': f"Error: Conversation {conv_id} not found"}, session.room)
+        return None
         
-    # 獲取最後一則消息
-    messages = db_manager.get_messages_by_conversation_id(conv_id)
+    # 讀取完整歷史，讓兩個機器人恢復上下文
+    messages = db_manager.get_conversation_history(conv_id)
     if not messages:
-        socketio.emit('error', {'message': f"Error: No messages in conversation {conv_id}"})
-        return
+        _emit('error', {'message': f"Error: No messages in conversation {conv_id}"}, session.room)
+        return None
         
     last_message = messages[-1]
     
-    # 恢復對話
-    run_conversation(
-        conv_id,
+    args = (
         convo['bot1_name'], 
         convo['bot1_system_prompt'], 
         convo['bot1_model'],
         convo['bot2_name'], 
         convo['bot2_system_prompt'], 
         convo['bot2_model'],
-        last_message['content'],
-        is_resuming=True
+        last_message['content']
     )
+    # 預算限制整個對話，已完成的回合也要算進去
+    kwargs = {
+        'budget': ConversationBudget.from_dict(json.loads(convo['budget']) if convo.get('budget') else None),
+        'prior_turns': len(messages) - 1,
+        'history': messages
+    }
+    return args, kwargs
 
-def run_conversation(
-    conv_id, 
+# 添加一個新函數用於恢復對話
+def resume_conversation_thread(session):
+    """重新啟動一個已經暫停的對話"""
+    loaded = _load_resume_args(session)
+    if loaded is not None:
+        # 恢復對話
+        args, kwargs = loaded
+        run_conversation(session, *args, is_resuming=True, **kwargs)
+
+async def resume_conversation_async(session):
+    """asyncio 模式下重新啟動一個已經暫停的對話"""
+    loop = asyncio.get_running_loop()
+    loaded = await loop.run_in_executor(None, _load_resume_args, session)
+    if loaded is not None:
+        args, kwargs = loaded
+        await run_conversation_async(session, *args, is_resuming=True, **kwargs)
+
+def _open_conversation(
+    session, 
     bot1_name, bot1_system_prompt, bot1_model,
     bot2_name, bot2_system_prompt, bot2_model,
     initial_message,
-    is_resuming=False
+    is_resuming=False,
+    history=None
 ):
-    global conversation_active
+    """Build the conversation state and send the opening events.
     
-    print(f"啟動對話 ID:{conv_id}, 初始訊息:{initial_message[:20]}...")  # 調試日誌
+    `history` holds the stored messages of a resumed conversation.
+    """
+    conv_id = session.conversation_id
     
-    # Initialize conversation history for each bot - different handling based on model
-    # o1-mini doesn't support system messages, so we need to use a different approach
-    if bot1_model == "o1-mini":
-        # For o1-mini, we'll prepend the system prompt to the first user message
-        bot1_messages = []  # No system message for o1-mini
-    else:
-        bot1_messages = [{"role": "system", "content": bot1_system_prompt}]
-        
-    if bot2_model == "o1-mini":
-        # For o1-mini, we'll prepend the system prompt to the first user message
-        bot2_messages = []  # No system message for o1-mini
-    else:
-        bot2_messages = [{"role": "system", "content": bot2_system_prompt}]
+    logger.info("啟動對話", extra=fields(conversation_id=conv_id, resuming=is_resuming))
+    
+    state = ConversationState(
+        conv_id,
+        BotConfig(bot1_name, bot1_system_prompt, bot1_model),
+        BotConfig(bot2_name, bot2_system_prompt, bot2_model),
+        initial_message,
+        is_resuming=is_resuming,
+        history_policy=history_policy,
+        # 完整歷史不需要逐則計算 token
+        count_message_tokens=count_message_tokens if history_policy.name != "full" else None
+    )
+    if history:
+        state.restore(history)
     
-    # Start with initial message from Bot 1
-    current_message = initial_message
-    current_bot = "bot1" if not is_resuming else "bot2"  # 如果是恢復對話，從bot2開始
+    if is_resuming:
+        session.token_stats = TokenStats.from_dict(db_manager.get_conversation_token_stats(conv_id))
+    else:
+        session.token_stats = TokenStats()
     
     # Add initial message to database with zero tokens (it's not from API)
     if not is_resuming:
-        db_manager.add_message_with_tokens(conv_id, bot1_name, current_message, 0, 0, 0)
+        db_manager.add_message_with_tokens(conv_id, bot1_name, initial_message, 0, 0, 0)
+        session.token_stats.add(bot1_name, 0, 0, 0, 0)
     
         # 只有在新對話時才發送初始消息
-        socketio.emit('new_message', {
+        _emit('new_message', {
             'bot': bot1_name,
-            'message': current_message,
+            'message': initial_message,
             'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
             'tokens': 0,
             'cost': 0
-        })
+        }, session.room)
     
     # Emit token stats update
-    token_stats = db_manager.get_conversation_token_stats(conv_id)
-    # 確保在發送前轉換Decimal對象
-    if token_stats:
-        token_stats['total_cost'] = float(token_stats['total_cost'])
-        if 'bot_stats' in token_stats:
-            for bot_name in token_stats['bot_stats']:
-                if 'cost' in token_stats['bot_stats'][bot_name]:
-                    token_stats['bot_stats'][bot_name]['cost'] = float(token_stats['bot_stats'][bot_name]['cost'])
+    _emit_token_stats(session)
+    return state
+
+def _usage_tuple(usage, model, messages, reply):
+    """(prompt_tokens, completion_tokens, total_tokens), counted locally if the API gave no usage."""
+    if usage is not None:
+        return usage.prompt_tokens, usage.completion_tokens, usage.total_tokens
+    prompt_tokens = estimate_prompt_tokens(messages, model)
+    completion_tokens = count_tokens(reply, model)
+    return prompt_tokens, completion_tokens, prompt_tokens + completion_tokens
+
+def _request_token_estimate(model, messages):
+    """(prompt_tokens, completion_tokens) upper bound of a request, counted locally."""
+    completion_tokens = get_capabilities(model).max_output_tokens
+    return estimate_prompt_tokens(messages, model), completion_tokens
+
+def _retry_forwarder(on_delta):
+    """Wrap `on_delta` so a retried request first tells clients to discard the partial reply."""
+    streamed = [False]
+    def forward(delta, reset=False):
+        streamed[0] = not reset
+        on_delta(delta, reset=reset)
+    def start_attempt():
+        if streamed[0]:
+            on_delta("", reset=True)
+            streamed[0] = False
+        return forward
+    return start_attempt
+
+def _cached_completion(model, messages, on_delta):
+    """Look the request up in the response cache: (key, result or None).
+
+    A hit is forwarded to `on_delta` in one piece, so clients see it like a
+    streamed reply. In replay mode a miss raises ReplayMissError.
+    """
+    if not response_cache.enabled:
+        return None, None
+    key, result = response_cache.lookup(model, messages, get_capabilities(model).request_params())
+    if result is not None and on_delta:
+        on_delta(result[0])
+    return key, result
+
+def request_completion(model, messages, on_delta=None):
+    """Request a reply through the response cache and the shared scheduler (rate limits and retries).
+
+    Returns (reply, prompt_tokens, completion_tokens, total_tokens).
+    """
+    key, result = _cached_completion(model, messages, on_delta)
+    if result is not None:
+        return result
+    start_attempt = _retry_forwarder(on_delta) if on_delta else (lambda: None)
+    result = request_scheduler.call(
+        model,
+        lambda: _request_completion_once(model, messages, start_attempt()),
+        estimate_tokens=lambda: sum(_request_token_estimate(model, messages)),
+        usage_of=lambda result: result[3]
+    )
+    if key:
+        response_cache.put(key, model, result)
+    return result
+
+async def request_completion_async(model, messages, on_delta=None):
+    """Async counterpart of request_completion."""
+    key, result = _cached_completion(model, messages, on_delta)
+    if result is not None:
+        return result
+    start_attempt = _retry_forwarder(on_delta) if on_delta else (lambda: None)
+    result = await request_scheduler.call_async(
+        model,
+        lambda: _request_completion_once_async(model, messages, start_attempt()),
+        estimate_tokens=lambda: sum(_request_token_estimate(model, messages)),
+        usage_of=lambda result: result[3]
+    )
+    if key:
+        response_cache.put(key, model, result)
+    return result
+
+@contextmanager
+def _timed_request(model, on_delta):
+    """Observe a provider request's latency; yields `on_delta` wrapped to observe the first token."""
+    start = time.perf_counter()
+    outcome = "error"
+    forward = None
+    if on_delta:
+        waiting = [True]
+        def forward(delta, reset=False):
+            if waiting[0] and not reset:
+                waiting[0] = False
+                LLM_TIME_TO_FIRST_TOKEN_SECONDS.observe(time.perf_counter() - start, model=model)
+            on_delta(delta, reset=reset)
+    try:
+        yield forward
+        outcome = "ok"
+    finally:
+        LLM_REQUEST_SECONDS.observe(time.perf_counter() - start, model=model, outcome=outcome)
+
+def _request_completion_once(model, messages, on_delta=None):
+    """Request a reply from the configured provider, streaming content deltas to `on_delta`.
+
+    Returns (reply, prompt_tokens, completion_tokens, total_tokens).
+    """
+    with tracer.span("provider_request", model=model), _timed_request(model, on_delta) as on_delta:
+        reply, usage = llm_provider.complete(model, messages, get_capabilities(model), on_delta)
+    return (reply,) + _usage_tuple(usage, model, messages, reply)
+
+async def _request_completion_once_async(model, messages, on_delta=None):
+    with tracer.span("provider_request", model=model), _timed_request(model, on_delta) as on_delta:
+        reply, usage = await llm_provider.complete_async(model, messages, get_capabilities(model), on_delta)
+    if usage is None:
+        # 在本地計算 token，放到執行緒池避免卡住事件迴圈
+        counts = await asyncio.get_running_loop().run_in_executor(None, _usage_tuple, None, model, messages, reply)
+        return (reply,) + counts
+    return (reply,) + _usage_tuple(usage, model, messages, reply)
+
+def _delta_emitter(session, turn):
+    """Return a DeltaBuffer that pushes streamed content of `turn` to the conversation room.
+
+    Deltas are coalesced into one frame per STREAM_FLUSH_INTERVAL; flush()
+    it before announcing the complete message.
+    """
+    def emit_delta(delta, reset=False):
+        data = {
+            'conversation_id': session.conversation_id,
+            'stream_id': turn.stream_id,
+            'bot': turn.responding_bot,
+            'delta': delta
+        }
+        if reset:
+            # 請求重試，前端要清掉已顯示的部分內容
+            data['reset'] = True
+        _emit('message_delta', data, session.room)
+    return DeltaBuffer(emit_delta, STREAM_FLUSH_INTERVAL)
+
+def estimate_turn_cost(turn):
+    """Pre-flight estimate of a turn: (tokens, cost_usd, cost_twd).
+
+    The prompt is counted locally and the reply is assumed to use its whole
+    completion limit, so the estimate is an upper bound.
+    """
+    prompt_tokens, completion_tokens = _request_token_estimate(turn.model, turn.messages)
+    cost_usd, cost_twd = cost_calculator.calculate_cost(turn.model, prompt_tokens, completion_tokens)
+    return prompt_tokens + completion_tokens, cost_usd, cost_twd
+
+def _check_budget(session, budget, turns, turn=None):
+    """Return True if the next turn fits the budget; otherwise notify clients and return False.
+
+    `turns` is the number of replies the conversation has had so far. With
+    `turn` given, its estimated cost is added to the current totals.
+    """
+    if budget is None:
+        return True
+    stats = session.token_stats
+    tokens, cost_usd, cost_twd = 0, 0, 0
+    if turn is not None and budget.limits_spend:
+        tokens, cost_usd, cost_twd = estimate_turn_cost(turn)
+    exceeded = budget.exceeded(
+        turns=turns + 1,
+        tokens=stats.total_tokens + tokens,
+        cost_twd=stats.total_cost + float(cost_twd),
+        cost_usd=stats.total_cost_usd + float(cost_usd)
+    )
+    if exceeded is None:
+        return True
+    
+    logger.info("對話已達預算上限", extra=fields(conversation_id=session.conversation_id, limit=exceeded))
+    _emit('budget_exhausted', {
+        'conversation_id': session.conversation_id,
+        'limit': exceeded,
+        'budget': budget.to_dict(),
+        'turns': turns,
+        'total_tokens': stats.total_tokens,
+        'total_cost': stats.total_cost,
+        'total_cost_usd': stats.total_cost_usd,
+        'estimated_tokens': tokens,
+        'estimated_cost': float(cost_twd),
+        'estimated_cost_usd': float(cost_usd)
+    }, session.room)
+    return False
+
+def _record_summary(session, state, turn, summary, prompt_tokens, completion_tokens):
+    """Apply a history summary and add its cost to the conversation totals."""
+    logger.debug("歷史紀錄已摘要", extra=sampled(
+        conversation_id=session.conversation_id, bot=turn.responding_bot, messages=turn.summarized
+    ))
+    state.apply_summary(turn, summary)
+    cost_usd, cost_twd = cost_calculator.calculate_cost(turn.model, prompt_tokens, completion_tokens)
+    db_manager.add_usage(session.conversation_id, turn.responding_bot, prompt_tokens, completion_tokens, float(cost_twd))
+    _count_usage(turn.model, prompt_tokens, completion_tokens, cost_usd)
+    _add_token_stats(session, turn.responding_bot, prompt_tokens, completion_tokens, cost_twd, cost_usd)
+
+def _next_turn(session, state):
+    """Build the next request, summarizing history that fell out of the window first."""
+    turn = state.next_turn()
+    summary_request = state.summary_request(turn)
+    if summary_request:
+        summary, prompt_tokens, completion_tokens, _ = request_completion(turn.model, summary_request)
+        _record_summary(session, state, turn, summary, prompt_tokens, completion_tokens)
+        turn = state.next_turn()
+    return turn
+
+async def _next_turn_async(session, state):
+    turn = state.next_turn()
+    summary_request = state.summary_request(turn)
+    if summary_request:
+        summary, prompt_tokens, completion_tokens, _ = await request_completion_async(turn.model, summary_request)
+        await asyncio.get_running_loop().run_in_executor(
+            None, tracer.bind(_record_summary), session, state, turn, summary, prompt_tokens, completion_tokens
+        )
+        turn = state.next_turn()
+    return turn
+
+def _complete_turn(session, state, turn, reply, prompt_tokens, completion_tokens, total_tokens):
+    """Record a reply: update history, store it, and notify clients."""
+    conv_id = session.conversation_id
+    responding_bot = turn.responding_bot
+    
+    # Calculate cost
+    with tracer.span("cost"):
+        cost_usd, cost_twd = cost_calculator.calculate_cost(turn.model, prompt_tokens, completion_tokens)
+    _count_usage(turn.model, prompt_tokens, completion_tokens, cost_usd)
+    
+    # Update conversation history
+    state.record_reply(turn, reply)
     
-    socketio.emit('token_stats_update', token_stats)
+    # Store message in database with token information
+    with tracer.span("db_write"):
+        db_manager.add_message_with_tokens(
+            conv_id, 
+            responding_bot, 
+            reply, 
+            prompt_tokens, 
+            completion_tokens, 
+            float(cost_twd)  # Convert Decimal to float for SQLite compatibility
+        )
+    
+    # 構造消息事件數據
+    event_data = {
+        'stream_id': turn.stream_id,
+        'bot': responding_bot,
+        'message': reply,
+        'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        'prompt_tokens': prompt_tokens,
+        'completion_tokens': completion_tokens,
+        'total_tokens': total_tokens,
+        'cost_usd': float(cost_usd),  # 添加美元價格
+        'cost': float(cost_twd)  # 新台幣價格
+    }
+    
+    logger.debug("回應完成", extra=sampled(
+        conversation_id=conv_id, bot=responding_bot, model=turn.model, tokens=total_tokens
+    ))
+    _emit('new_message', event_data, session.room)
+    
+    # Emit the change to the token stats
+    _add_token_stats(session, responding_bot, prompt_tokens, completion_tokens, cost_twd, cost_usd)
+    session.record_turn(total_tokens)
+
+def _run_turn(session, state, budget, turns):
+    """Run one reply, traced phase by phase. Returns False if the budget stops the conversation."""
+    with tracer.trace("turn", conversation_id=session.conversation_id, turn=turns + 1) as span:
+        turn_start = time.perf_counter()
+        # Determine which bot is replying and build its request
+        with tracer.span("history"):
+            turn = _next_turn(session, state)
+        span.set(bot=turn.responding_bot, model=turn.model)
+        with tracer.span("budget"):
+            if not _check_budget(session, budget, turns, turn):
+                return False
+        
+        with tracer.span("model_request"):
+            deltas = _delta_emitter(session, turn)
+            reply, prompt_tokens, completion_tokens, total_tokens = request_completion(
+                turn.model, turn.messages, on_delta=deltas
+            )
+            deltas.flush()
+        
+        with tracer.span("complete_turn"):
+            _complete_turn(session, state, turn, reply, prompt_tokens, completion_tokens, total_tokens)
+        CONVERSATION_TURN_SECONDS.observe(time.perf_counter() - turn_start, model=turn.model)
+    return True
+
+async def _run_turn_async(session, state, budget, turns):
+    loop = asyncio.get_running_loop()
+    with tracer.trace("turn", conversation_id=session.conversation_id, turn=turns + 1) as span:
+        turn_start = time.perf_counter()
+        with tracer.span("history"):
+            turn = await _next_turn_async(session, state)
+        span.set(bot=turn.responding_bot, model=turn.model)
+        if budget is not None and budget.limits_spend:
+            with tracer.span("budget"):
+                fits = await loop.run_in_executor(None, tracer.bind(_check_budget), session, budget, turns, turn)
+            if not fits:
+                return False
+        
+        with tracer.span("model_request"):
+            deltas = _delta_emitter(session, turn)
+            reply, prompt_tokens, completion_tokens, total_tokens = await request_completion_async(
+                turn.model, turn.messages, on_delta=deltas
+            )
+            deltas.flush()
+        
+        with tracer.span("complete_turn"):
+            await loop.run_in_executor(
+                None, tracer.bind(_complete_turn),
+                session, state, turn, reply, prompt_tokens, completion_tokens, total_tokens
+            )
+        CONVERSATION_TURN_SECONDS.observe(time.perf_counter() - turn_start, model=turn.model)
+    return True
+
+def run_conversation(
+    session, 
+    bot1_name, bot1_system_prompt, bot1_model,
+    bot2_name, bot2_system_prompt, bot2_model,
+    initial_message,
+    is_resuming=False,
+    budget=None,
+    prior_turns=0,
+    history=None
+):
+    state = _open_conversation(
+        session,
+        bot1_name, bot1_system_prompt, bot1_model,
+        bot2_name, bot2_system_prompt, bot2_model,
+        initial_message,
+        is_resuming=is_resuming,
+        history=history
+    )
     
     # Main conversation loop
-    while conversation_active:
+    while session.active:
         try:
-            # Determine which bot is replying and update history
-            if current_bot == "bot1":
-                responding_bot = bot2_name
-                responding_model = bot2_model
-                
-                # Special handling for o1-mini model
-                if responding_model == "o1-mini":
-                    # For o1-mini we need to prepend the system prompt to the user message
-                    system_prompt_prefix = f"{bot2_system_prompt}\n\n"
-                    enhanced_message = f"{system_prompt_prefix}User message: {current_message}"
-                    messages = [{"role": "user", "content": enhanced_message}]
-                else:
-                    messages = bot2_messages + [{"role": "user", "content": current_message}]
-                
-                next_bot = "bot2"
-            else:
-                responding_bot = bot1_name
-                responding_model = bot1_model
-                
-                # Special handling for o1-mini model
-                if responding_model == "o1-mini":
-                    # For o1-mini we need to prepend the system prompt to the user message
-                    system_prompt_prefix = f"{bot1_system_prompt}\n\n"
-                    enhanced_message = f"{system_prompt_prefix}User message: {current_message}"
-                    messages = [{"role": "user", "content": enhanced_message}]
-                else:
-                    messages = bot1_messages + [{"role": "user", "content": current_message}]
-                
-                next_bot = "bot1"
-            
-            print(f"請求 {responding_bot} 使用 {responding_model} 回應...")  # 調試日誌
-            
-            # 检查是否为o1系列模型，它们使用不同的参数
-            if responding_model.startswith("o1"):
-                # o1模型需要特殊处理，增加token限制并处理流式响应
-                try:
-                    # 使用流式响应模式，确保获取完整回复
-                    stream_response = openai.chat.completions.create(
-                        model=responding_model,
-                        messages=messages,
-                        max_completion_tokens=4000,  # 增加token限制
-                        stream=True  # 启用流式响应
-                    )
-                    
-                    # 收集完整的回复内容
-                    collected_response = ""
-                    for chunk in stream_response:
-                        if chunk.choices and chunk.choices[0].delta.content:
-                            collected_response += chunk.choices[0].delta.content
-                    
-                    # 如果流式响应收集到的内容为空，尝试非流式方式
-                    if not collected_response:
-                        print(f"流式响应为空，尝试非流式方式...")
-                        response = openai.chat.completions.create(
-                            model=responding_model,
-                            messages=messages,
-                            max_completion_tokens=4000
-                        )
-                        reply = response.choices[0].message.content
-                        prompt_tokens = response.usage.prompt_tokens
-                        completion_tokens = response.usage.completion_tokens
-                        total_tokens = response.usage.total_tokens
-                    else:
-                        # 使用流式收集的响应，需要额外查询token使用情况
-                        reply = collected_response
-                        # 获取token使用情况
-                        token_check_response = openai.chat.completions.create(
-                            model=responding_model,
-                            messages=messages,
-                            max_completion_tokens=4000
-                        )
-                        prompt_tokens = token_check_response.usage.prompt_tokens
-                        completion_tokens = token_check_response.usage.completion_tokens
-                        total_tokens = token_check_response.usage.total_tokens
-                
-                except Exception as e:
-                    print(f"流式处理失败: {e}，尝试标准方式...")
-                    # 如果流式处理失败，回退到标准方式
-                    response = openai.chat.completions.create(
-                        model=responding_model,
-                        messages=messages,
-                        max_completion_tokens=4000
-                    )
-                    reply = response.choices[0].message.content
-                    prompt_tokens = response.usage.prompt_tokens
-                    completion_tokens = response.usage.completion_tokens
-                    total_tokens = response.usage.total_tokens
-            else:
-                # 非o1模型使用标准方式
-                response = openai.chat.completions.create(
-                    model=responding_model,
-                    messages=messages,
-                    temperature=0.7,
-                    max_tokens=1000
-                )
-                
-                # Extract response text and token usage
-                reply = response.choices[0].message.content
-                prompt_tokens = response.usage.prompt_tokens
-                completion_tokens = response.usage.completion_tokens
-                total_tokens = response.usage.total_tokens
-            
-            print(f"{responding_bot} 回應 ({total_tokens} tokens): {reply[:30]}...")  # 調試日誌
-            
-            # Calculate cost
-            cost_usd, cost_twd = cost_calculator.calculate_cost(responding_model, prompt_tokens, completion_tokens)
-            
-            # Update conversation history
-            if current_bot == "bot1":
-                bot2_messages.append({"role": "user", "content": current_message})
-                bot2_messages.append({"role": "assistant", "content": reply})
-            else:
-                bot1_messages.append({"role": "user", "content": current_message})
-                bot1_messages.append({"role": "assistant", "content": reply})
-            
-            # Store message in database with token information
-            db_manager.add_message_with_tokens(
-                conv_id, 
-                responding_bot, 
-                reply, 
-                prompt_tokens, 
-                completion_tokens, 
-                float(cost_twd)  # Convert Decimal to float for SQLite compatibility
-            )
-            
-            # 構造消息事件數據
-            event_data = {
-                'bot': responding_bot,
-                'message': reply,
-                'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                'prompt_tokens': prompt_tokens,
-                'completion_tokens': completion_tokens,
-                'total_tokens': total_tokens,
-                'cost_usd': float(cost_usd),  # 添加美元價格
-                'cost': float(cost_twd)  # 新台幣價格
-            }
+            if not _check_budget(session, budget, prior_turns + session.turns):
+                break
+            if not _run_turn(session, state, budget, prior_turns + session.turns):
+                break
             
-            # 確保事件數據不包含無法JSON序列化的內容
-            print(f"發送消息事件: {responding_bot}, {total_tokens} tokens")
-            socketio.emit('new_message', event_data)
-            
-            # Emit updated token stats
-            token_stats = db_manager.get_conversation_token_stats(conv_id)
-            # 確保在發送前轉換Decimal對象
-            if token_stats:
-                token_stats['total_cost'] = float(token_stats['total_cost'])
-                if 'bot_stats' in token_stats:
-                    for bot_name in token_stats['bot_stats']:
-                        if 'cost' in token_stats['bot_stats'][bot_name]:
-                            token_stats['bot_stats'][bot_name]['cost'] = float(token_stats['bot_stats'][bot_name]['cost'])
-            
-            socketio.emit('token_stats_update', token_stats)
+            # Small delay to avoid API rate limits
+            time.sleep(TURN_DELAY)
             
-            # Update current message and bot for next iteration
-            current_message = reply
-            current_bot = next_bot
+        except Exception as e:
+            _report_error(session, e)
+            break
+
+async def run_conversation_async(
+    session, 
+    bot1_name, bot1_system_prompt, bot1_model,
+    bot2_name, bot2_system_prompt, bot2_model,
+    initial_message,
+    is_resuming=False,
+    budget=None,
+    prior_turns=0,
+    history=None
+):
+    """asyncio 版本的對話迴圈：API 請求不佔用執行緒，資料庫寫入交給執行緒池"""
+    loop = asyncio.get_running_loop()
+    state = await loop.run_in_executor(None, functools.partial(
+        _open_conversation,
+        session,
+        bot1_name, bot1_system_prompt, bot1_model,
+        bot2_name, bot2_system_prompt, bot2_model,
+        initial_message,
+        is_resuming=is_resuming,
+        history=history
+    ))
+    
+    while session.active:
+        try:
+            if not _check_budget(session, budget, prior_turns + session.turns):
+                break
+            if not await _run_turn_async(session, state, budget, prior_turns + session.turns):
+                break
             
-            # Small delay to avoid API rate limits
-            time.sleep(1)
+            await asyncio.sleep(TURN_DELAY)
             
         except Exception as e:
-            error_msg = f"Error in conversation: {str(e)}"
-            print(error_msg)
-            socketio.emit('error', {'message': error_msg})
+            _report_error(session, e)
             break
 
+# Headless batch simulations
+batch_jobs = {}
+# 保留供 /api/batch/<id> 查詢的已完成批次數量，超過時先移除最舊的
+MAX_FINISHED_BATCHES = 100
+
+async def _run_batch_conversation(session, config):
+    await run_conversation_async(session, *_conversation_args(config), budget=ConversationBudget.from_dict(config))
+
+def _run_batch_conversation_thread(session, config):
+    run_conversation(session, *_conversation_args(config), budget=ConversationBudget.from_dict(config))
+
+def start_batch(configs, concurrency):
+    """Start a batch in the background and return the job immediately.
+    
+    Batches run on the shared event loop, except under serve.py: an asyncio
+    loop inside an eventlet or gevent green thread is not supported, so
+    there each conversation runs on a (green) thread, like the thread runner.
+    """
+    job = BatchJob([_parse_conversation_config(config) for config in configs], concurrency)
+    finished = [batch_id for batch_id, other in batch_jobs.items() if other.finished_at is not None]
+    for batch_id in finished[:max(0, len(finished) - MAX_FINISHED_BATCHES + 1)]:
+        del batch_jobs[batch_id]
+    batch_jobs[job.id] = job
+    if green_thread_library():
+        threading.Thread(
+            target=run_batch_threaded,
+            args=(job, _create_conversation, _run_batch_conversation_thread),
+            name=f"batch-{job.id}",
+            daemon=True
+        ).start()
+    else:
+        session_manager.loop_runner.submit(run_batch(job, _create_conversation, _run_batch_conversation))
+    return job
+
+@app.route('/api/batch', methods=['POST'])
+def create_batch():
+    """Start a batch from a JSONL body (or an uploaded `file`) of conversation configs."""
+    if 'file' in request.files:
+        text = request.files['file'].read().decode('utf-8')
+    else:
+        text = request.get_data(as_text=True)
+    
+    try:
+        configs = load_batch_configs(
+            text.splitlines(),
+            default_max_turns=request.args.get('max_turns', 10, type=int)
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if not configs:
+        return jsonify({"error": "No conversation configs provided"}), 400
+    
+    job = start_batch(configs, request.args.get('concurrency', 5, type=int))
+    return jsonify(job.summary()), 202
+
+@app.route('/api/batch/<batch_id>', methods=['GET'])
+def get_batch(batch_id):
+    job = batch_jobs.get(batch_id)
+    if job is None:
+        return jsonify({"error": "Batch not found"}), 404
+    return jsonify(job.summary())
+
+def start_background_tasks():
+    """Start the price refresh and tokenizer warm-up threads of a serving process."""
+    if os.getenv("PRICING_REFRESH", "1") == "1":
+        model_pricing.start_background_refresh()
+    # 背景預先載入各模型的 tokenizer，避免第一個回合等待
+    threading.Thread(target=warm_up, args=(available_models,), daemon=True).start()
+
 if __name__ == '__main__':
     # Ensure database tables are created
     db_manager.init_db()
-    socketio.run(app, debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    start_background_tasks()
+    # 開發用伺服器；正式環境請使用 serve.py
+    socketio.run(app, debug=os.getenv("FLASK_DEBUG", "0") == "1",
+                 host=os.getenv("HOST", "0.0.0.0"), port=int(os.getenv("PORT", "5000")),
+                 allow_unsafe_werkzeug=True)
@@ -0,0 +1,132 @@
+"""Local message queue for running several server workers without Redis.
+
+Usage:
+    python message_queue.py --port 5600
+    SOCKETIO_MESSAGE_QUEUE=local://127.0.0.1:5600 python serve.py --port 5001
+    SOCKETIO_MESSAGE_QUEUE=local://127.0.0.1:5600 python serve.py --port 5002
+
+The broker relays every line it receives to all connected workers.
+LocalQueueManager is a Socket.IO client manager that publishes through it,
+so an event emitted on one worker also reaches the clients connected to the
+others. It stands in for Redis on a single host; for real deployments set
+SOCKETIO_MESSAGE_QUEUE to a redis:// (or other kombu) URL instead.
+"""
+import argparse
+import json
+import logging
+import socket
+import socketserver
+import threading
+import time
+
+import socketio
+
+logger = logging.getLogger(__name__)
+
+
+def parse_url(url):
+    """("host", port) of a local://host:port URL."""
+    host, _, port = url[len("local://"):].rstrip("/").rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+class _BrokerHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        broker = self.server
+        with broker.lock:
+            broker.clients.add(self.wfile)
+        try:
+            for line in self.rfile:
+                broker.relay(line)
+        finally:
+            with broker.lock:
+                broker.clients.discard(self.wfile)
+
+
+class LocalBroker(socketserver.ThreadingTCPServer):
+    """Relays newline-delimited messages to every connected client."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address):
+        super().__init__(address, _BrokerHandler)
+        self.clients = set()
+        self.lock = threading.Lock()
+
+    def relay(self, line):
+        with self.lock:
+            clients = list(self.clients)
+        for client in clients:
+            try:
+                client.write(line)
+                client.flush()
+            except OSError:
+                with self.lock:
+                    self.clients.discard(client)
+
+
+class LocalQueueManager(socketio.PubSubManager):
+    """Socket.IO client manager backed by a LocalBroker at local://host:port."""
+
+    name = "local"
+
+    def __init__(self, url="local://127.0.0.1:5600", channel="flask-socketio", write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.address = parse_url(url)
+        self._sender = None
+        self._send_lock = threading.Lock()
+
+    def _connect(self):
+        return socket.create_connection(self.address)
+
+    def _publish(self, data):
+        line = (json.dumps({"channel": self.channel, "data": data}) + "\n").encode("utf-8")
+        with self._send_lock:
+            for attempt in range(2):
+                try:
+                    if self._sender is None:
+                        self._sender = self._connect()
+                    self._sender.sendall(line)
+                    return
+                except OSError:
+                    # 連線中斷時重新連線一次
+                    self._sender = None
+                    if attempt:
+                        raise
+
+    def _listen(self):
+        while True:
+            try:
+                with self._connect() as connection, connection.makefile("rb") as stream:
+                    for line in stream:
+                        message = json.loads(line)
+                        if message.get("channel") == self.channel:
+                            yield message["data"]
+            except (OSError, ValueError) as e:
+                logger.warning("Message queue connection lost, reconnecting: %s", e)
+                time.sleep(1)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Relay Socket.IO events between local server workers")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5600)
+    return parser.parse_args(argv)
+
+
+def main_cli(argv=None):
+    args = parse_args(argv)
+    broker = LocalBroker((args.host, args.port))
+    print(f"Message queue listening on local://{args.host}:{args.port}")
+    try:
+        broker.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        broker.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main_cli())
@@ -0,0 +1,214 @@
+"""In-process metrics in the Prometheus text format.
+
+A minimal, dependency-free registry of counters, gauges and histograms with
+labels. `REGISTRY.render()` produces the text served on /metrics. Gauges
+can be backed by a callback that is evaluated at scrape time.
+"""
+import bisect
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+# 秒數，涵蓋資料庫操作 (毫秒) 到模型回應 (數十秒)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class _Metric:
+    type_name = None
+
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} expects labels {self.label_names}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.type_name}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_sample(key, value))
+        return lines
+
+    def _render_sample(self, key, value):
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    """A value that only goes up."""
+
+    type_name = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """A value that goes up and down, or is read from `callback()` at scrape time."""
+
+    type_name = "gauge"
+
+    def __init__(self, name, description, labels=(), callback=None):
+        super().__init__(name, description, labels)
+        self.callback = callback
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        if self.callback is not None:
+            self.set(self.callback())
+        return super().render()
+
+
+class Histogram(_Metric):
+    """Observations counted into cumulative buckets, with their sum and count."""
+
+    type_name = "histogram"
+
+    def __init__(self, name, description, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, description, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # 每個 bucket 的次數 (非累計)，最後一格為 +Inf；另記總和與次數
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][bisect.bisect_left(self.buckets, value)] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the `with` block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _render_sample(self, key, state):
+        counts, total, count = state
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += bucket_count
+            labels = _format_labels(self.label_names, key, [("le", _format_value(bound))])
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.label_names, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+def timed(histogram, **labels):
+    """Decorator observing each call's duration in `histogram`."""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with histogram.time(**labels):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class Registry:
+    """A named set of metrics."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, description, labels=()):
+        return self._register(Counter(name, description, labels))
+
+    def gauge(self, name, description, labels=(), callback=None):
+        return self._register(Gauge(name, description, labels, callback))
+
+    def histogram(self, name, description, labels=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, description, labels, buckets))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# Model requests (one observation per attempt; cache hits are not requests)
+LLM_REQUEST_SECONDS = REGISTRY.histogram(
+    "simulator_llm_request_seconds", "Model API request latency", ("model", "outcome"))
+LLM_TIME_TO_FIRST_TOKEN_SECONDS = REGISTRY.histogram(
+    "simulator_llm_time_to_first_token_seconds", "Time from sending a request to its first streamed content",
+    ("model",))
+LLM_TOKENS = REGISTRY.counter(
+    "simulator_llm_tokens_total", "Tokens recorded for replies and summaries", ("model", "kind"))
+LLM_COST_USD = REGISTRY.counter(
+    "simulator_llm_cost_usd_total", "Cost in USD recorded for replies and summaries", ("model",))
+COST_CALCULATION_SECONDS = REGISTRY.histogram(
+    "simulator_cost_calculation_seconds", "Time spent looking up prices and computing a cost")
+
+# Conversations
+CONVERSATION_TURN_SECONDS = REGISTRY.histogram(
+    "simulator_conversation_turn_seconds", "Time from building a turn's request to storing its reply", ("model",))
+ACTIVE_CONVERSATIONS = REGISTRY.gauge(
+    "simulator_active_conversations", "Conversations currently running in this process")
+
+# Socket.IO
+SOCKETIO_EVENTS = REGISTRY.counter(
+    "simulator_socketio_events_total", "Events emitted to conversation rooms", ("event",))
+SOCKETIO_EVENT_DELIVERIES = REGISTRY.counter(
+    "simulator_socketio_event_deliveries_total",
+    "Event copies sent to clients connected to this process (fan-out)", ("event",))
+
+# Database and HTTP
+DB_OPERATION_SECONDS = REGISTRY.histogram(
+    "simulator_db_operation_seconds", "Time spent in DatabaseManager operations", ("kind", "operation"))
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "simulator_http_request_seconds", "History and export route latency, until the body is sent",
+    ("endpoint", "status"))
@@ -0,0 +1,134 @@
+"""Local OpenAI-compatible chat completions server for load tests.
+
+Usage:
+    python mock_server.py --port 8001 --latency 0.2 --tokens-per-second 50 --error-rate 0.02
+
+Then point the simulator at it:
+    OPENAI_BASE_URL=http://127.0.0.1:8001/v1 OPENAI_API_KEY=mock python main.py
+
+It serves POST /v1/chat/completions (streamed or not, with usage) and
+GET /v1/models, answering with MockBackend's filler replies at the
+configured latency and token rate. A share of requests fails with 429 or
+5xx errors so the retry path is exercised too.
+"""
+import argparse
+import json
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from llm.mock import MockBackend
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    backend = MockBackend()
+
+    def log_message(self, format, *args):
+        pass  # 壓力測試時不輸出每個請求
+
+    def _send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.rstrip("/") != "/v1/models":
+            self._send_json(404, {"error": {"message": "Not found"}})
+            return
+        self._send_json(200, {"object": "list", "data": [{"id": "mock", "object": "model", "owned_by": "mock"}]})
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/v1/chat/completions":
+            self._send_json(404, {"error": {"message": "Not found"}})
+            return
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        backend = self.backend
+        time.sleep(backend.latency)
+
+        error = backend.injected_error()
+        if error:
+            self._send_json(error.status_code, {"error": {"message": str(error), "type": "mock_error"}},
+                            headers=error.response.headers)
+            return
+
+        messages = request.get("messages", [])
+        words = backend.reply(messages)
+        usage = backend.usage(messages, words)
+        usage_body = {"prompt_tokens": usage.prompt_tokens, "completion_tokens": usage.completion_tokens,
+                      "total_tokens": usage.total_tokens}
+        base = {"id": f"chatcmpl-{uuid.uuid4().hex[:24]}", "created": int(time.time()),
+                "model": request.get("model", "mock")}
+
+        if not request.get("stream"):
+            self._send_json(200, {**base, "object": "chat.completion", "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "".join(backend.deltas(words))},
+                "finish_reason": "stop"
+            }], "usage": usage_body})
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        delay = backend.token_delay()
+        for delta in backend.deltas(words):
+            if delay:
+                time.sleep(delay)
+            self._send_event({**base, "object": "chat.completion.chunk", "choices": [
+                {"index": 0, "delta": {"content": delta}, "finish_reason": None}
+            ]})
+        self._send_event({**base, "object": "chat.completion.chunk", "choices": [
+            {"index": 0, "delta": {}, "finish_reason": "stop"}
+        ]})
+        if (request.get("stream_options") or {}).get("include_usage"):
+            self._send_event({**base, "object": "chat.completion.chunk", "choices": [], "usage": usage_body})
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.close_connection = True
+
+    def _send_event(self, body):
+        self.wfile.write(f"data: {json.dumps(body)}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serve simulated chat completions over an OpenAI-compatible API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=50, help="streaming rate (0 = all at once)")
+    parser.add_argument("--reply-tokens", type=int, default=60, help="words per reply")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests failing with 429/5xx")
+    parser.add_argument("--seed", type=int, default=None, help="seed for error injection")
+    return parser.parse_args(argv)
+
+
+def main_cli(argv=None):
+    args = parse_args(argv)
+    MockHandler.backend = MockBackend(
+        latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        reply_tokens=args.reply_tokens,
+        error_rate=args.error_rate,
+        seed=args.seed
+    )
+    server = ThreadingHTTPServer((args.host, args.port), MockHandler)
+    server.daemon_threads = True
+    print(f"Mock OpenAI API listening on http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main_cli())
@@ -0,0 +1,119 @@
+"""Wall-clock sampling profiler for a running server.
+
+Every `interval` seconds the stack of each thread is read with
+sys._current_frames(), so conversations on other threads (and the asyncio
+runner's loop) are profiled without instrumenting or restarting anything.
+Overhead is one stack walk per thread per sample.
+
+Samples are taken whether or not a thread is running: a thread waiting on
+a socket, a lock or sleep() is counted in the blocking call just like one
+that computes. Profiles therefore show where time goes (mostly waiting for
+the model API), not CPU usage; filter by thread or look below the blocking
+frames to find code that actually burns CPU.
+
+The result is available as collapsed stacks ("thread;module:function;... count",
+the input of flamegraph.pl and speedscope) or as the functions with the
+most samples.
+
+Green threads (serve.py's eventlet and gevent workers) are not OS threads,
+so sys._current_frames() cannot see them. A sampler running as one of them
+would only ever catch the others while they are switched out, never while
+they compute. `green_thread_library()` tells callers to refuse profiling there.
+"""
+import sys
+import threading
+import time
+from collections import Counter
+
+
+def green_thread_library():
+    """Name of the library ("eventlet" or "gevent") that replaced threads with green threads, or None."""
+    eventlet_patcher = sys.modules.get("eventlet.patcher")
+    if eventlet_patcher is not None and eventlet_patcher.is_monkey_patched("thread"):
+        return "eventlet"
+    gevent_monkey = sys.modules.get("gevent.monkey")
+    if gevent_monkey is not None and gevent_monkey.is_module_patched("threading"):
+        return "gevent"
+    return None
+
+
+class Profile:
+    """Stack samples collected by SamplingProfiler."""
+
+    def __init__(self, stacks, samples, duration, interval):
+        self.stacks = stacks
+        self.samples = samples
+        self.duration = duration
+        self.interval = interval
+
+    def collapsed(self):
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in self.stacks.most_common())
+
+    def top(self, limit=30):
+        """Functions by samples spent in the function itself ("self") and below it ("total")."""
+        own = Counter()
+        total = Counter()
+        for stack, count in self.stacks.items():
+            frames = stack[1:]
+            if frames:
+                own[frames[-1]] += count
+            for frame in set(frames):
+                total[frame] += count
+        return {
+            "samples": self.samples,
+            "duration": round(self.duration, 3),
+            "interval": self.interval,
+            "functions": [
+                {"function": frame, "self": count, "total": total[frame]}
+                for frame, count in own.most_common(limit)
+            ]
+        }
+
+
+class SamplingProfiler:
+    """Samples the stacks of every thread but its own, running or waiting. One profile runs at a time."""
+
+    def __init__(self, interval=0.005, max_depth=64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self._lock = threading.Lock()
+
+    def run(self, seconds, thread_filter=None):
+        """Sample for `seconds` and return a Profile, or None if another profile is running.
+
+        With `thread_filter`, only threads whose name contains it are sampled
+        (e.g. "conversation" for the thread runner's conversations).
+        """
+        if not self._lock.acquire(blocking=False):
+            return None
+        try:
+            return self._sample(seconds, thread_filter)
+        finally:
+            self._lock.release()
+
+    def _sample(self, seconds, thread_filter):
+        own_id = threading.get_ident()
+        stacks = Counter()
+        samples = 0
+        start = time.perf_counter()
+        deadline = start + seconds
+        while time.perf_counter() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                name = names.get(thread_id, str(thread_id))
+                if thread_id == own_id or (thread_filter and thread_filter not in name):
+                    continue
+                stacks[self._stack(name, frame)] += 1
+            samples += 1
+            time.sleep(self.interval)
+        return Profile(stacks, samples, time.perf_counter() - start, self.interval)
+
+    def _stack(self, thread_name, frame):
+        frames = []
+        while frame is not None and len(frames) < self.max_depth:
+            code = frame.f_code
+            frames.append(f"{frame.f_globals.get('__name__', '?')}:{code.co_name}:{code.co_firstlineno}")
+            frame = frame.f_back
+        frames.append(thread_name)
+        frames.reverse()
+        return tuple(frames)
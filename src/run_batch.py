@@ -0,0 +1,68 @@
+"""Run a batch of AI-to-AI conversations without the web UI.
+
+Usage:
+    python run_batch.py configs.jsonl --concurrency 20 --max-turns 10
+
+Each line of the JSONL file is one conversation config with the same keys as
+the `start_conversation` event (bot1_name, bot1_system_prompt, bot1_model,
+bot2_name, ..., initial_message, conversation_title, max_turns).
+"""
+import argparse
+import asyncio
+import json
+import sys
+
+import main
+from engine.batch import BatchJob, load_batch_configs, run_batch
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run conversation simulations in parallel")
+    parser.add_argument("configs", help="JSONL file of conversation configs ('-' for stdin)")
+    parser.add_argument("--concurrency", type=int, default=5, help="maximum conversations running at once")
+    parser.add_argument("--max-turns", type=int, default=10, help="turns per conversation when a config has no max_turns")
+    parser.add_argument("--turn-delay", type=float, default=None, help="seconds to wait between turns (default: CONVERSATION_TURN_DELAY)")
+    parser.add_argument("--db", default=None, help="SQLite database path (default: conversations.db)")
+    parser.add_argument("--output", default=None, help="write the JSON summary to this file")
+    return parser.parse_args(argv)
+
+
+def main_cli(argv=None):
+    args = parse_args(argv)
+
+    if args.configs == "-":
+        lines = sys.stdin.readlines()
+    else:
+        with open(args.configs, "r", encoding="UTF-8") as f:
+            lines = f.readlines()
+
+    configs = load_batch_configs(lines, default_max_turns=args.max_turns)
+    if not configs:
+        print("No conversation configs found", file=sys.stderr)
+        return 1
+
+    if args.db:
+        main.db_manager.db_path = args.db
+    if args.turn_delay is not None:
+        main.TURN_DELAY = args.turn_delay
+    main.db_manager.init_db()
+
+    job = BatchJob([main._parse_conversation_config(config) for config in configs], args.concurrency)
+    # Load tokenizers up front instead of on each conversation's first turn
+    main.warm_up({config[key] for config in job.configs for key in ("bot1_model", "bot2_model")})
+    summary = asyncio.run(run_batch(job, main._create_conversation, main._run_batch_conversation))
+
+    print(f"Conversations: {summary['completed']} completed, {summary['failed']} failed")
+    print(f"Turns: {summary['turns']} ({summary['turns_per_sec']:.2f} turns/sec)")
+    print(f"Tokens: {summary['tokens']} ({summary['tokens_per_sec']:.2f} tokens/sec)")
+    print(f"Elapsed: {summary['elapsed_seconds']:.2f}s")
+
+    if args.output:
+        with open(args.output, "w", encoding="UTF-8") as f:
+            json.dump(summary, f, indent=2)
+
+    return 0 if summary['failed'] == 0 else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
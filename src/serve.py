@@ -0,0 +1,57 @@
+"""Production entry point: Socket.IO on a cooperative (eventlet or gevent) server.
+
+Usage:
+    python serve.py --port 5000
+    python serve.py --worker gevent --port 5001 --message-queue local://127.0.0.1:5600
+
+Unlike `python main.py` (werkzeug, one OS thread per conversation, debug
+options), this patches the standard library for green threads before the
+app is imported, so thousands of connections and conversations share a few
+OS threads. Conversations use the thread runner, whose threads become green
+threads. Several workers can serve the same clients when they share a
+message queue (see message_queue.py); put them behind a load balancer with
+sticky sessions, since a conversation is controlled by the worker running it.
+"""
+import argparse
+import os
+import sys
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run the simulator server in production mode")
+    parser.add_argument("--worker", choices=("eventlet", "gevent"), default=os.getenv("SERVER_WORKER", "eventlet"),
+                        help="cooperative networking library (gevent must be installed separately)")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "5000")))
+    parser.add_argument("--message-queue", default=None,
+                        help="share events with other workers (redis://..., local://host:port)")
+    return parser.parse_args(argv)
+
+
+def main_cli(argv=None):
+    args = parse_args(argv)
+
+    # 必須在匯入 main (以及 openai、sqlite 連線池等) 之前完成 monkey patch
+    if args.worker == "eventlet":
+        import eventlet
+        eventlet.monkey_patch()
+    else:
+        from gevent import monkey
+        monkey.patch_all()
+
+    os.environ["SOCKETIO_ASYNC_MODE"] = args.worker
+    os.environ["CONVERSATION_RUNNER"] = "thread"
+    if args.message_queue:
+        os.environ["SOCKETIO_MESSAGE_QUEUE"] = args.message_queue
+
+    import main
+    main.db_manager.init_db()
+    main.start_background_tasks()
+    main.logger.info("Serving", extra=main.fields(worker=args.worker, host=args.host, port=args.port,
+                                                  message_queue=main.SOCKETIO_MESSAGE_QUEUE))
+    main.socketio.run(main.app, host=args.host, port=args.port, debug=False, log_output=main.SOCKETIO_DEBUG)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -4,6 +4,28 @@ document.addEventListener('DOMContentLoaded', () => {
     let activeConversationId = null;
     let isConversationActive = false;
     let currentConversationDetails = null;
+    // 最近一次的統計快照，token_stats_delta 會累加到這裡
+    let currentTokenStats = null;
+    
+    // Pagination state (cursor = id of the oldest item loaded so far)
+    const CONVERSATIONS_PAGE_SIZE = 50;
+    const MESSAGES_PAGE_SIZE = 100;
+    let conversationsCursor = null;
+    let conversationsLoading = false;
+    let messagesCursor = null;
+    let messagesLoading = false;
+    let messagesConversationId = null;
+    
+    // Full-text search state (results are ranked, so pages are addressed by offset)
+    const SEARCH_PAGE_SIZE = 20;
+    let searchQuery = '';
+    let searchOffset = null;
+    let searchLoading = false;
+    let searchTimer = null;
+    let searchRequestId = 0;
+    
+    // Replies that are still being streamed, keyed by stream_id
+    const streamingMessages = new Map();
 
     // DOM Elements
     const startBtn = document.getElementById('startBtn');
@@ -12,6 +34,7 @@ document.addEventListener('DOMContentLoaded', () => {
     const exportTXTBtn = document.getElementById('exportTXTBtn');
     const newConversationBtn = document.getElementById('newConversationBtn');
     const conversationsList = document.getElementById('conversationsList');
+    const searchInput = document.getElementById('searchInput');
     const conversationEl = document.getElementById('conversation');
     const statusMessage = document.getElementById('statusMessage');
     const connectionStatus = document.getElementById('connectionStatus');
@@ -39,6 +62,8 @@ document.addEventListener('DOMContentLoaded', () => {
     const bot2SystemPrompt = document.getElementById('bot2SystemPrompt');
     const initialMessage = document.getElementById('initialMessage');
     const conversationTitle = document.getElementById('conversationTitle');
+    const maxTurns = document.getElementById('maxTurns');
+    const maxCostTwd = document.getElementById('maxCostTwd');
     
     // Token stats elements
     const totalTokensElement = document.getElementById('totalTokens');
@@ -52,6 +77,29 @@ document.addEventListener('DOMContentLoaded', () => {
     const modalTotalTokensElement = document.getElementById('modalTotalTokens');
     const modalTotalCostElement = document.getElementById('modalTotalCost');
     
+    // Sentinels that trigger loading the next page when they scroll into view
+    const conversationsSentinel = document.createElement('div');
+    conversationsSentinel.className = 'list-sentinel';
+    const messagesSentinel = document.createElement('div');
+    messagesSentinel.className = 'list-sentinel';
+    
+    const pageObserver = new IntersectionObserver((entries) => {
+        entries.forEach(entry => {
+            if (!entry.isIntersecting) return;
+            if (entry.target === conversationsSentinel) {
+                if (searchQuery) {
+                    loadMoreSearchResults();
+                } else {
+                    loadMoreConversations();
+                }
+            } else if (entry.target === messagesSentinel) {
+                loadOlderMessages();
+            }
+        });
+    });
+    pageObserver.observe(conversationsSentinel);
+    pageObserver.observe(messagesSentinel);
+    
     // Load conversations on page load
     loadConversations();
     
@@ -61,6 +109,10 @@ document.addEventListener('DOMContentLoaded', () => {
         connectionIndicator.classList.remove('disconnected');
         connectionIndicator.classList.add('connected');
         setStatus('已連線到伺服器');
+        // 重新連線後房間訂閱會遺失，重新訂閱目前的對話
+        if (activeConversationId !== null) {
+            watchConversation(activeConversationId);
+        }
     });
     
     socket.on('disconnect', () => {
@@ -72,8 +124,12 @@ document.addEventListener('DOMContentLoaded', () => {
         updateButtonStates();
     });
     
+    socket.on('message_delta', (data) => {
+        appendMessageDelta(data);
+    });
+    
     socket.on('new_message', (data) => {
-        addMessage(data.bot, data.message, data.timestamp);
+        addMessage(data.bot, data.message, data.timestamp, data.stream_id);
         scrollToBottom();
     });
     
@@ -81,10 +137,28 @@ document.addEventListener('DOMContentLoaded', () => {
         updateTokenStats(data);
     });
     
+    socket.on('token_stats_delta', (data) => {
+        applyTokenStatsDelta(data);
+    });
+    
     socket.on('error', (data) => {
         setStatus(`錯誤: ${data.message}`, true);
     });
     
+    socket.on('budget_exhausted', (data) => {
+        if (data.conversation_id !== activeConversationId) return;
+        const limitNames = {
+            max_turns: '回合數',
+            max_tokens: 'Token 數',
+            max_cost_twd: '費用 (NT$)',
+            max_cost_usd: '費用 (USD)'
+        };
+        isConversationActive = false;
+        pauseBtn.innerHTML = '<i class="fas fa-play"></i> 繼續';
+        updateButtonStates();
+        setStatus(`對話已停止：已達${limitNames[data.limit] || data.limit}上限`);
+    });
+    
     // Button event handlers
     startBtn.addEventListener('click', startConversation);
     pauseBtn.addEventListener('click', togglePause);
@@ -102,57 +176,210 @@ document.addEventListener('DOMContentLoaded', () => {
     loadConversationBtn.addEventListener('click', loadSelectedConversation);
     deleteConversationBtn.addEventListener('click', deleteSelectedConversation);
     
+    // 輸入停頓後才送出搜尋
+    searchInput.addEventListener('input', () => {
+        clearTimeout(searchTimer);
+        searchTimer = setTimeout(() => {
+            const query = searchInput.value.trim();
+            if (query) {
+                searchConversations(query);
+            } else {
+                loadConversations();
+            }
+        }, 300);
+    });
+    
     // Changes to system prompts during active conversation
     bot1SystemPrompt.addEventListener('change', updateSystemPrompts);
     bot2SystemPrompt.addEventListener('change', updateSystemPrompts);
     
     // Functions
     function loadConversations() {
-        fetch('/api/conversations')
+        // Reload the sidebar from the first (newest) page
+        searchQuery = '';
+        searchInput.value = '';
+        searchRequestId++;
+        conversationsList.innerHTML = '';
+        conversationsCursor = null;
+        fetchConversationsPage(true);
+    }
+    
+    function loadMoreConversations() {
+        if (conversationsCursor === null || conversationsLoading) return;
+        fetchConversationsPage(false);
+    }
+    
+    function fetchConversationsPage(isFirstPage) {
+        conversationsLoading = true;
+        let url = `/api/conversations?limit=${CONVERSATIONS_PAGE_SIZE}`;
+        if (!isFirstPage) {
+            url += `&before_id=${conversationsCursor}`;
+        }
+        
+        fetch(url)
             .then(response => response.json())
             .then(data => {
-                conversationsList.innerHTML = '';
+                conversationsSentinel.remove();
                 if (data.conversations && data.conversations.length > 0) {
+                    const fragment = document.createDocumentFragment();
                     data.conversations.forEach(conversation => {
-                        const item = document.createElement('div');
-                        item.className = 'conversation-item';
-                        item.dataset.id = conversation.id;
-                        
-                        const title = document.createElement('div');
-                        title.className = 'conversation-title';
-                        
-                        // 优先使用自定义标题，如果没有则显示默认格式
-                        if (conversation.title) {
-                            title.textContent = conversation.title;
-                        } else {
-                            title.textContent = `${conversation.bot1_name} & ${conversation.bot2_name}`;
-                        }
-                        
-                        const date = document.createElement('div');
-                        date.className = 'conversation-date';
-                        date.textContent = conversation.timestamp;
-                        
-                        item.appendChild(title);
-                        item.appendChild(date);
-                        
-                        item.addEventListener('click', () => openConversationDetails(conversation));
-                        
-                        conversationsList.appendChild(item);
+                        fragment.appendChild(createConversationItem(conversation));
                     });
-                } else {
+                    conversationsList.appendChild(fragment);
+                } else if (isFirstPage) {
                     const noConversations = document.createElement('div');
                     noConversations.className = 'no-conversations';
                     noConversations.textContent = '還沒有對話記錄';
                     conversationsList.appendChild(noConversations);
                 }
+                
+                conversationsCursor = data.next_before_id;
+                if (conversationsCursor !== null) {
+                    conversationsList.appendChild(conversationsSentinel);
+                }
             })
             .catch(error => {
                 console.error('Failed to load conversations:', error);
                 setStatus('載入對話歷史失敗', true);
+            })
+            .finally(() => {
+                conversationsLoading = false;
+            });
+    }
+    
+    function searchConversations(query) {
+        searchQuery = query;
+        searchOffset = 0;
+        conversationsList.innerHTML = '';
+        fetchSearchPage(true);
+    }
+    
+    function loadMoreSearchResults() {
+        if (searchOffset === null || searchLoading) return;
+        fetchSearchPage(false);
+    }
+    
+    function fetchSearchPage(isFirstPage) {
+        // 較早送出的搜尋晚回來時直接丟棄
+        const requestId = ++searchRequestId;
+        searchLoading = true;
+        const url = `/api/search?q=${encodeURIComponent(searchQuery)}&limit=${SEARCH_PAGE_SIZE}&offset=${searchOffset}`;
+        
+        fetch(url)
+            .then(response => response.json())
+            .then(data => {
+                if (requestId !== searchRequestId) return;
+                conversationsSentinel.remove();
+                if (data.error) {
+                    showListMessage(data.error.includes('characters') ? '請輸入至少 3 個字的搜尋詞' : data.error);
+                    searchOffset = null;
+                    return;
+                }
+                if (data.results.length > 0) {
+                    const fragment = document.createDocumentFragment();
+                    data.results.forEach(result => {
+                        fragment.appendChild(createSearchResultItem(result));
+                    });
+                    conversationsList.appendChild(fragment);
+                } else if (isFirstPage) {
+                    showListMessage('找不到符合的對話');
+                }
+                
+                searchOffset = data.next_offset;
+                if (searchOffset !== null) {
+                    conversationsList.appendChild(conversationsSentinel);
+                }
+            })
+            .catch(error => {
+                console.error('Search failed:', error);
+                setStatus('搜尋失敗', true);
+            })
+            .finally(() => {
+                if (requestId === searchRequestId) {
+                    searchLoading = false;
+                }
+            });
+    }
+    
+    function showListMessage(text) {
+        const message = document.createElement('div');
+        message.className = 'no-conversations';
+        message.textContent = text;
+        conversationsList.appendChild(message);
+    }
+    
+    function createSearchResultItem(result) {
+        const item = document.createElement('div');
+        item.className = 'conversation-item';
+        item.dataset.id = result.conversation_id;
+        
+        const title = document.createElement('div');
+        title.className = 'conversation-title';
+        title.textContent = result.type === 'message' ? `${result.title || ''} · ${result.bot_name}` : result.title;
+        
+        // 伺服器已跳脫 HTML，只保留標示符合文字的 <mark>
+        const snippet = document.createElement('div');
+        snippet.className = 'search-snippet';
+        snippet.innerHTML = result.snippet || '';
+        
+        const date = document.createElement('div');
+        date.className = 'conversation-date';
+        date.textContent = result.timestamp;
+        
+        item.appendChild(title);
+        item.appendChild(snippet);
+        item.appendChild(date);
+        
+        item.addEventListener('click', () => openConversationDetails(result.conversation_id));
+        
+        return item;
+    }
+    
+    function createConversationItem(conversation) {
+        const item = document.createElement('div');
+        item.className = 'conversation-item';
+        item.dataset.id = conversation.id;
+        
+        const title = document.createElement('div');
+        title.className = 'conversation-title';
+        
+        // 优先使用自定义标题，如果没有则显示默认格式
+        if (conversation.title) {
+            title.textContent = conversation.title;
+        } else {
+            title.textContent = `${conversation.bot1_name} & ${conversation.bot2_name}`;
+        }
+        
+        const date = document.createElement('div');
+        date.className = 'conversation-date';
+        date.textContent = conversation.timestamp;
+        
+        item.appendChild(title);
+        item.appendChild(date);
+        
+        item.addEventListener('click', () => openConversationDetails(conversation.id));
+        
+        return item;
+    }
+    
+    function openConversationDetails(conversationId) {
+        // The sidebar list omits system prompts, so fetch the full record without messages
+        fetch(`/api/conversation/${conversationId}?limit=0`)
+            .then(response => response.json())
+            .then(data => {
+                if (!data.conversation) {
+                    setStatus(`載入對話失敗: ${data.error || '未知錯誤'}`, true);
+                    return;
+                }
+                showConversationDetails(data.conversation);
+            })
+            .catch(error => {
+                console.error('Failed to load conversation details:', error);
+                setStatus('載入對話失敗', true);
             });
     }
     
-    function openConversationDetails(conversation) {
+    function showConversationDetails(conversation) {
         currentConversationDetails = conversation;
         
         modalTimestamp.textContent = conversation.timestamp;
@@ -177,7 +404,7 @@ document.addEventListener('DOMContentLoaded', () => {
         
         // Reset current conversation state
         if (isConversationActive) {
-            socket.emit('pause_conversation', (response) => {
+            socket.emit('pause_conversation', { conversation_id: activeConversationId }, (response) => {
                 resetConversationUI();
                 loadConversationMessages(conversationId);
             });
@@ -200,15 +427,27 @@ document.addEventListener('DOMContentLoaded', () => {
     }
     
     function loadConversationMessages(conversationId) {
-        fetch(`/api/conversation/${conversationId}`)
+        // Load the newest page; older pages are fetched when scrolling up
+        messagesConversationId = conversationId;
+        messagesCursor = null;
+        messagesLoading = true;
+        
+        fetch(`/api/conversation/${conversationId}?limit=${MESSAGES_PAGE_SIZE}`)
             .then(response => response.json())
             .then(data => {
                 if (data.messages && data.messages.length > 0) {
                     conversationEl.innerHTML = '';
                     
+                    const fragment = document.createDocumentFragment();
                     data.messages.forEach(message => {
-                        addMessage(message.bot_name, message.content, message.timestamp);
+                        fragment.appendChild(createMessageElement(message.bot_name, message.content, message.timestamp));
                     });
+                    conversationEl.appendChild(fragment);
+                    
+                    messagesCursor = data.next_before_id;
+                    if (messagesCursor !== null) {
+                        conversationEl.prepend(messagesSentinel);
+                    }
                     
                     // Update token stats if available
                     if (data.token_stats) {
@@ -217,12 +456,58 @@ document.addEventListener('DOMContentLoaded', () => {
                     
                     scrollToBottom();
                     activeConversationId = conversationId;
+                    // 訂閱這個對話的即時事件 (例如另一個視窗正在執行它)
+                    watchConversation(conversationId);
+                    // 載入後可以直接按「繼續」，伺服器會從資料庫恢復完整上下文
+                    updateButtonStates();
                     setStatus(`已載入對話 (ID: ${conversationId})`);
                 }
             })
             .catch(error => {
                 console.error('Failed to load conversation messages:', error);
                 setStatus('載入對話訊息失敗', true);
+            })
+            .finally(() => {
+                messagesLoading = false;
+            });
+    }
+    
+    function loadOlderMessages() {
+        if (messagesCursor === null || messagesLoading || messagesConversationId !== activeConversationId) return;
+        messagesLoading = true;
+        const conversationId = messagesConversationId;
+        
+        fetch(`/api/conversation/${conversationId}?limit=${MESSAGES_PAGE_SIZE}&before_id=${messagesCursor}`)
+            .then(response => response.json())
+            .then(data => {
+                if (conversationId !== messagesConversationId) return;
+                
+                const container = document.querySelector('.conversation-container');
+                const previousHeight = container ? container.scrollHeight : 0;
+                
+                messagesSentinel.remove();
+                const fragment = document.createDocumentFragment();
+                (data.messages || []).forEach(message => {
+                    fragment.appendChild(createMessageElement(message.bot_name, message.content, message.timestamp));
+                });
+                conversationEl.prepend(fragment);
+                
+                messagesCursor = data.next_before_id;
+                if (messagesCursor !== null) {
+                    conversationEl.prepend(messagesSentinel);
+                }
+                
+                // Keep the current view in place after prepending older messages
+                if (container) {
+                    container.scrollTop += container.scrollHeight - previousHeight;
+                }
+            })
+            .catch(error => {
+                console.error('Failed to load older messages:', error);
+                setStatus('載入對話訊息失敗', true);
+            })
+            .finally(() => {
+                messagesLoading = false;
             });
     }
     
@@ -261,7 +546,7 @@ document.addEventListener('DOMContentLoaded', () => {
     function resetConversation() {
         if (isConversationActive) {
             if (confirm('目前對話尚在進行中，確定要開始新對話嗎？')) {
-                socket.emit('pause_conversation', (response) => {
+                socket.emit('pause_conversation', { conversation_id: activeConversationId }, (response) => {
                     resetConversationUI();
                 });
             }
@@ -272,7 +557,10 @@ document.addEventListener('DOMContentLoaded', () => {
     
     function resetConversationUI() {
         conversationEl.innerHTML = '';
+        streamingMessages.clear();
         activeConversationId = null;
+        messagesConversationId = null;
+        messagesCursor = null;
         isConversationActive = false;
         updateButtonStates();
         
@@ -312,7 +600,11 @@ document.addEventListener('DOMContentLoaded', () => {
             initial_message: initialMessage.value.trim() || 'Hello!',
             
             // 添加自定义对话标题
-            conversation_title: conversationTitle.value.trim() || null
+            conversation_title: conversationTitle.value.trim() || null,
+            
+            // 預算上限，留空則使用伺服器預設值
+            ...(maxTurns.value ? { max_turns: Number(maxTurns.value) } : {}),
+            ...(maxCostTwd.value ? { max_cost_twd: Number(maxCostTwd.value) } : {})
         };
         
         // Clear previous conversation
@@ -339,7 +631,7 @@ document.addEventListener('DOMContentLoaded', () => {
         if (pauseBtn.disabled) return;
         
         if (isConversationActive) {
-            socket.emit('pause_conversation', (response) => {
+            socket.emit('pause_conversation', { conversation_id: activeConversationId }, (response) => {
                 if (response && response.status === 'success') {
                     isConversationActive = false;
                     pauseBtn.innerHTML = '<i class="fas fa-play"></i> 繼續';
@@ -350,7 +642,7 @@ document.addEventListener('DOMContentLoaded', () => {
                 }
             });
         } else {
-            socket.emit('resume_conversation', (response) => {
+            socket.emit('resume_conversation', { conversation_id: activeConversationId }, (response) => {
                 if (response && response.status === 'success') {
                     isConversationActive = true;
                     pauseBtn.innerHTML = '<i class="fas fa-pause"></i> 暫停';
@@ -390,9 +682,47 @@ document.addEventListener('DOMContentLoaded', () => {
         window.open(url, '_blank');
     }
     
-    function addMessage(botName, text, timestamp) {
+    function addMessage(botName, text, timestamp, streamId = null) {
         console.log('Adding message:', botName, text.substring(0, 30) + '...', timestamp); // 增加調試日誌
         
+        // 如果這則訊息已經以串流方式顯示，直接以完整內容取代
+        const streaming = streamId ? streamingMessages.get(streamId) : null;
+        if (streaming) {
+            streaming.contentEl.innerText = text;
+            streaming.element.querySelector('.message-header span').textContent = timestamp || new Date().toLocaleString();
+            streaming.element.classList.remove('streaming');
+            streamingMessages.delete(streamId);
+        } else {
+            conversationEl.appendChild(createMessageElement(botName, text, timestamp));
+        }
+        
+        // 確保消息顯示後立即滾動到底部，強制使用requestAnimationFrame確保UI更新
+        requestAnimationFrame(() => {
+            scrollToBottom();
+        });
+    }
+    
+    function appendMessageDelta(data) {
+        let streaming = streamingMessages.get(data.stream_id);
+        if (!streaming) {
+            const element = createMessageElement(data.bot, '', null);
+            element.classList.add('streaming');
+            conversationEl.appendChild(element);
+            streaming = { element, contentEl: element.querySelector('.message-content') };
+            streamingMessages.set(data.stream_id, streaming);
+        }
+        
+        // 請求重試時伺服器會送出 reset，清掉前一次嘗試的部分內容
+        if (data.reset) {
+            streaming.contentEl.textContent = '';
+        }
+        
+        // .message-content 使用 pre-wrap，直接附加文字節點即可保留換行
+        streaming.contentEl.appendChild(document.createTextNode(data.delta));
+        scrollToBottom();
+    }
+    
+    function createMessageElement(botName, text, timestamp) {
         const messageEl = document.createElement('div');
         // 修正判斷邏輯，確保正確分配bot1或bot2樣式
         messageEl.className = 'message';
@@ -414,12 +744,7 @@ document.addEventListener('DOMContentLoaded', () => {
         
         messageEl.appendChild(headerEl);
         messageEl.appendChild(contentEl);
-        conversationEl.appendChild(messageEl);
-        
-        // 確保消息顯示後立即滾動到底部，強制使用requestAnimationFrame確保UI更新
-        requestAnimationFrame(() => {
-            scrollToBottom();
-        });
+        return messageEl;
     }
     
     function setStatus(message, isError = false) {
@@ -458,8 +783,34 @@ document.addEventListener('DOMContentLoaded', () => {
     }
 
     // Update token stats in the UI
+    function watchConversation(conversationId) {
+        socket.emit('watch_conversation', { conversation_id: conversationId }, (response) => {
+            if (response && response.token_stats && response.conversation_id === activeConversationId) {
+                updateTokenStats(response.token_stats);
+            }
+        });
+    }
+    
+    // Add one token_stats_delta to the latest snapshot and redraw
+    function applyTokenStatsDelta(delta) {
+        const stats = currentTokenStats || { total_tokens: 0, total_cost: 0, total_cost_usd: 0, bot_stats: {} };
+        stats.total_tokens = (stats.total_tokens || 0) + delta.total_tokens;
+        stats.total_cost = (stats.total_cost || 0) + delta.cost;
+        stats.total_cost_usd = (stats.total_cost_usd || 0) + delta.cost_usd;
+        stats.bot_stats = stats.bot_stats || {};
+        const bot = stats.bot_stats[delta.bot] ||
+            (stats.bot_stats[delta.bot] = { prompt_tokens: 0, completion_tokens: 0, total_tokens: 0, cost: 0, cost_usd: 0 });
+        bot.prompt_tokens += delta.prompt_tokens;
+        bot.completion_tokens += delta.completion_tokens;
+        bot.total_tokens += delta.total_tokens;
+        bot.cost += delta.cost;
+        bot.cost_usd += delta.cost_usd;
+        updateTokenStats(stats);
+    }
+    
     function updateTokenStats(data) {
         if (!data) return;
+        currentTokenStats = data;
         
         // Update total tokens and cost
         totalTokensElement.textContent = data.total_tokens || 0;
@@ -0,0 +1,217 @@
+"""Lightweight trace spans written to a local file.
+
+    tracer = Tracer(FileExporter("traces.jsonl", "otlp"), sample_rate=0.1)
+    with tracer.trace("turn", conversation_id=1):
+        with tracer.span("model_request"):
+            ...
+
+`trace()` starts a sampled root span; `span()` opens a child of the current
+span and does nothing outside a sampled trace, so instrumented code costs
+almost nothing while tracing is off. The current span is kept in a context
+variable, which follows threads and asyncio tasks; use `bind()` to carry it
+into an executor.
+
+Spans are written by a background thread, one JSON object per line: either
+this module's flat format ("json") or OTLP/JSON export requests ("otlp"),
+which the OpenTelemetry Collector's otlpjsonfile receiver can read.
+"""
+import contextvars
+import functools
+import json
+import logging
+import queue
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+TRACE_FORMATS = ("json", "otlp")
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "attributes", "start_ns", "end_ns", "error")
+
+    def __init__(self, name, trace_id, parent_id, attributes):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = random.getrandbits(64) or 1
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.error = None
+
+    def set(self, **attributes):
+        """Add attributes to the span."""
+        self.attributes.update(attributes)
+
+    def to_dict(self):
+        return {
+            "trace_id": f"{self.trace_id:032x}",
+            "span_id": f"{self.span_id:016x}",
+            "parent_id": f"{self.parent_id:016x}" if self.parent_id else None,
+            "name": self.name,
+            "start": self.start_ns / 1e9,
+            "duration_ms": (self.end_ns - self.start_ns) / 1e6,
+            "attributes": self.attributes,
+            "error": self.error
+        }
+
+    def to_otlp(self):
+        span = {
+            "traceId": f"{self.trace_id:032x}",
+            "spanId": f"{self.span_id:016x}",
+            "name": self.name,
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in self.attributes.items()]
+        }
+        if self.parent_id:
+            span["parentSpanId"] = f"{self.parent_id:016x}"
+        if self.error is not None:
+            span["status"] = {"code": 2, "message": self.error}  # STATUS_CODE_ERROR
+        return span
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class _NoopSpan:
+    def set(self, **attributes):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+class _SpanScope:
+    """Makes a span current for the `with` block and exports it on exit."""
+
+    __slots__ = ("span", "exporter", "token")
+
+    def __init__(self, span, exporter):
+        self.span = span
+        self.exporter = exporter
+        self.token = None
+
+    def __enter__(self):
+        self.token = _current_span.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        self.span.end_ns = time.time_ns()
+        if exc is not None:
+            self.span.error = f"{exc_type.__name__}: {exc}"
+        _current_span.reset(self.token)
+        self.exporter.export(self.span)
+        return False
+
+
+class Tracer:
+    """Creates spans and hands finished ones to `exporter` (None disables tracing).
+
+    `sample_rate` is the share of `trace()` calls that are recorded; it can be
+    changed while the server runs.
+    """
+
+    def __init__(self, exporter=None, sample_rate=1.0):
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+
+    @property
+    def enabled(self):
+        return self.exporter is not None
+
+    def trace(self, name, **attributes):
+        """Start a new trace, or do nothing if it is not sampled."""
+        if self.exporter is None or random.random() >= self.sample_rate:
+            return _NOOP
+        return _SpanScope(Span(name, random.getrandbits(128) or 1, None, attributes), self.exporter)
+
+    def span(self, name, **attributes):
+        """Open a child of the current span, or do nothing outside a sampled trace."""
+        parent = _current_span.get()
+        if parent is None or self.exporter is None:
+            return _NOOP
+        return _SpanScope(Span(name, parent.trace_id, parent.span_id, attributes), self.exporter)
+
+    @staticmethod
+    def bind(function):
+        """Wrap `function` to run inside the current span, e.g. on an executor thread."""
+        return functools.partial(contextvars.copy_context().run, function)
+
+    def close(self):
+        if self.exporter is not None:
+            self.exporter.close()
+
+
+class FileExporter:
+    """Appends finished spans to `path` from a background thread.
+
+    `fmt` is "json" (one flat span per line) or "otlp" (one OTLP/JSON
+    ExportTraceServiceRequest per line, batching the spans written together).
+    """
+
+    def __init__(self, path, fmt="json", service_name="ai-conversation-simulator"):
+        if fmt not in TRACE_FORMATS:
+            raise ValueError(f"Unknown trace format {fmt!r}, expected one of {', '.join(TRACE_FORMATS)}")
+        self.path = path
+        self.fmt = fmt
+        self.service_name = service_name
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self, span):
+        self._queue.put(span)
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _lines(self, spans):
+        if self.fmt == "json":
+            return [json.dumps(span.to_dict(), ensure_ascii=False, default=str) for span in spans]
+        request = {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+            "scopeSpans": [{"scope": {"name": __name__}, "spans": [span.to_otlp() for span in spans]}]
+        }]}
+        return [json.dumps(request, ensure_ascii=False)]
+
+    def _run(self):
+        stop = False
+        while not stop:
+            spans = [self._queue.get()]
+            # 一次取出已完成的 span 批次寫入
+            while True:
+                try:
+                    spans.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in spans:
+                stop = True
+                spans = [span for span in spans if span is not None]
+            if not spans:
+                continue
+            try:
+                with open(self.path, "a", encoding="utf-8") as output:
+                    output.write("\n".join(self._lines(spans)) + "\n")
+            except OSError as e:
+                logger.error("Could not write %d trace spans to %s: %s", len(spans), self.path, e)
@@ -0,0 +1,64 @@
+import threading
+import time
+
+from engine.batch import BatchJob, run_batch_threaded
+
+
+def test_threaded_batch_limits_concurrency_and_records_results():
+    job = BatchJob([{'fail': index == 2} for index in range(6)], concurrency=2)
+    lock = threading.Lock()
+    running = []
+    peak = []
+    ids = iter(range(1, 100))
+
+    def create_conversation(config):
+        with lock:
+            return next(ids)
+
+    def run_conversation(session, config):
+        with lock:
+            running.append(session.conversation_id)
+            peak.append(len(running))
+        time.sleep(0.02)
+        with lock:
+            running.remove(session.conversation_id)
+        if config['fail']:
+            raise RuntimeError("boom")
+        session.record_turn(10)
+
+    summary = run_batch_threaded(job, create_conversation, run_conversation)
+
+    assert max(peak) == 2
+    assert summary['status'] == "finished"
+    assert (summary['completed'], summary['failed']) == (5, 1)
+    assert (summary['turns'], summary['tokens']) == (5, 50)
+    assert sorted(summary['conversation_ids']) == list(range(1, 7))
+    assert summary['errors'][0]['error'] == "boom"
+
+
+def test_batches_use_threads_under_green_threads(tmp_path, monkeypatch):
+    import main
+
+    main.db_manager.close()
+    monkeypatch.setattr(main.db_manager, "db_path", str(tmp_path / "batch.db"))
+    main.db_manager.init_db()
+    # serve.py: 不可把批次交給 asyncio 事件迴圈
+    monkeypatch.setattr(main, "green_thread_library", lambda: "eventlet")
+    monkeypatch.setattr(main.session_manager.loop_runner, "submit", None)
+    threads = []
+
+    def run_conversation(session, *args, budget=None):
+        threads.append(threading.current_thread().name)
+        session.record_turn(budget.max_turns)
+
+    monkeypatch.setattr(main, "run_conversation", run_conversation)
+    try:
+        job = main.start_batch([{'max_turns': 3}, {'max_turns': 4}], concurrency=2)
+        deadline = time.time() + 5
+        while job.finished_at is None and time.time() < deadline:
+            time.sleep(0.01)
+        assert job.summary()['status'] == "finished"
+        assert job.tokens == 7
+        assert all(name.startswith(f"batch-{job.id}") for name in threads)
+    finally:
+        main.db_manager.close()
@@ -0,0 +1,27 @@
+import json
+import os
+import subprocess
+import sys
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+
+
+def test_small_benchmark_run_writes_json_results(tmp_path):
+    # 獨立行程執行: benchmark 匯入時會把模型換成模擬後端
+    output = tmp_path / "results.json"
+    completed = subprocess.run(
+        [sys.executable, os.path.join(SRC, "benchmark.py"), "--conversations", "3", "--turns", "2",
+         "--memory-conversations", "2", "--memory-turns", "2", "--db-rows", "50", "--db-batch", "10",
+         "--export-messages", "20", "--timeout", "60", "--output", str(output)],
+        cwd=tmp_path, env={**os.environ, "MOCK_LATENCY": "0"}, capture_output=True, text=True, timeout=120)
+    assert completed.returncode == 0, completed.stderr
+
+    results = json.loads(output.read_text())
+    assert json.loads(completed.stdout) == results
+    conversations = results["conversations"]
+    assert (conversations["finished"], conversations["errors"]) == (True, 0)
+    assert set(conversations["turn_latency_ms"]) == {"p50", "p90", "p99", "mean", "max"}
+    assert results["memory"]["reached"] is True
+    assert results["database"]["rows"] == 50
+    assert results["export"]["messages"] == 20
+    assert all(results["export"][name]["bytes"] > 0 for name in ("csv", "txt", "jsonl"))
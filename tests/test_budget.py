@@ -0,0 +1,73 @@
+from types import SimpleNamespace
+from unittest import mock
+
+import pytest
+
+import main
+from engine.budget import ConversationBudget
+from engine.history import FullHistoryPolicy
+from engine.session_manager import ConversationSession
+from llm.providers import OpenAIProvider
+
+USAGE = SimpleNamespace(prompt_tokens=20, completion_tokens=5, total_tokens=25)
+
+
+def _chunks():
+    yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content="Sure"))], usage=None)
+    yield SimpleNamespace(choices=[], usage=USAGE)
+
+
+def test_budget_from_dict_treats_empty_and_zero_as_unlimited():
+    budget = ConversationBudget.from_dict({"max_turns": "3", "max_tokens": "", "max_cost_twd": "0", "max_cost_usd": 1.5})
+    assert budget.to_dict() == {"max_turns": 3, "max_cost_usd": 1.5}
+    assert budget.limits_spend
+    assert not ConversationBudget.from_dict(None).limits_spend
+
+
+def test_budget_reports_the_first_exceeded_limit():
+    budget = ConversationBudget(max_turns=5, max_tokens=100, max_cost_twd=10.0)
+    assert budget.exceeded(turns=5, tokens=100, cost_twd=10.0) is None
+    assert budget.exceeded(turns=6, tokens=101) == "max_turns"
+    assert budget.exceeded(turns=1, tokens=101, cost_twd=11) == "max_tokens"
+    assert budget.exceeded(turns=1, cost_twd=10.01) == "max_cost_twd"
+
+
+@pytest.fixture
+def conversation(tmp_path, monkeypatch):
+    main.db_manager.close()
+    monkeypatch.setattr(main.db_manager, "db_path", str(tmp_path / "budget.db"))
+    main.db_manager.init_db()
+    provider = OpenAIProvider(api_key="test")
+    create = mock.MagicMock(side_effect=lambda **kwargs: _chunks())
+    provider._client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    monkeypatch.setattr(main, "llm_provider", provider)
+    monkeypatch.setattr(main, "TURN_DELAY", 0)
+    monkeypatch.setattr(main, "history_policy", FullHistoryPolicy())
+    events = []
+    monkeypatch.setattr(main, "_emit", lambda event, data, room=None: events.append((event, data)))
+
+    def run(**limits):
+        budget = ConversationBudget(**limits)
+        config = main._parse_conversation_config({"bot1_model": "gpt-4o", "bot2_model": "gpt-4o"})
+        session = ConversationSession(main._create_conversation(config))
+        session.resume()
+        main.run_conversation(session, *main._conversation_args(config), budget=budget)
+        exhausted = [data for event, data in events if event == "budget_exhausted"]
+        return create.call_count, exhausted
+
+    yield run
+    main.db_manager.close()
+
+
+def test_turn_limit_stops_the_conversation(conversation):
+    requests, exhausted = conversation(max_turns=2)
+    assert requests == 2
+    assert [(data["limit"], data["turns"]) for data in exhausted] == [("max_turns", 2)]
+
+
+def test_turn_over_token_budget_is_never_sent(conversation):
+    # 預估值包含整個回覆上限 (gpt-4o 為 1000)，第一回合就超過 500
+    requests, exhausted = conversation(max_tokens=500)
+    assert requests == 0
+    assert exhausted[0]["limit"] == "max_tokens"
+    assert exhausted[0]["estimated_tokens"] > 500
@@ -0,0 +1,104 @@
+from types import SimpleNamespace
+
+import pytest
+
+import main
+from engine import delta_buffer
+from engine.delta_buffer import DeltaBuffer
+from engine.session_manager import room_name
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(delta_buffer, "time", clock)
+    return clock
+
+
+def test_deltas_are_coalesced_per_interval(clock):
+    frames = []
+    buffer = DeltaBuffer(lambda text, reset: frames.append((text, reset)), interval=0.05)
+    buffer("He")
+    buffer("l")
+    clock.now += 0.02
+    buffer("lo")
+    assert frames == [("He", False)]
+    clock.now += 0.05
+    buffer(" there")
+    buffer("!")
+    assert frames == [("He", False), ("llo there", False)]
+    buffer.flush()
+    buffer.flush()
+    assert frames[-1] == ("!", False) and len(frames) == 3
+
+
+def test_reset_drops_pending_deltas(clock):
+    frames = []
+    buffer = DeltaBuffer(lambda text, reset: frames.append((text, reset)), interval=0.05)
+    buffer("Hel")
+    buffer("lo")
+    buffer("", reset=True)
+    buffer("Hi")
+    buffer.flush()
+    assert frames == [("Hel", False), ("", True), ("Hi", False)]
+
+
+def test_zero_interval_sends_every_delta(clock):
+    frames = []
+    buffer = DeltaBuffer(lambda text, reset: frames.append(text), interval=0)
+    for delta in ("a", "b", "c"):
+        buffer(delta)
+    assert frames == ["a", "b", "c"]
+
+
+def _deliveries(event):
+    return main.SOCKETIO_EVENT_DELIVERIES._values.get((event,), 0)
+
+
+def test_events_reach_only_the_watchers_of_a_conversation(tmp_path, monkeypatch):
+    main.db_manager.close()
+    monkeypatch.setattr(main.db_manager, "db_path", str(tmp_path / "delivery.db"))
+    main.db_manager.init_db()
+    watcher = main.socketio.test_client(main.app)
+    other = main.socketio.test_client(main.app)
+    try:
+        assert watcher.emit("watch_conversation", {"conversation_id": 7}, callback=True)["status"] == "success"
+        assert other.emit("watch_conversation", {"conversation_id": 8}, callback=True)["status"] == "success"
+        before = _deliveries("test_event")
+
+        main._emit("test_event", {"value": 1}, room_name(7))
+
+        assert [event["name"] for event in watcher.get_received()] == ["test_event"]
+        assert other.get_received() == []
+        assert _deliveries("test_event") - before == 1
+        # 改看另一個對話後不再收到原本對話的事件
+        watcher.emit("watch_conversation", {"conversation_id": 8}, callback=True)
+        assert main._room_size(room_name(7)) == 0
+        assert main._room_size(room_name(8)) == 2
+    finally:
+        watcher.disconnect()
+        other.disconnect()
+        main.db_manager.close()
+
+
+def test_unknown_room_size_does_not_block_the_event(monkeypatch):
+    def get_participants(namespace, room):
+        raise NotImplementedError
+
+    monkeypatch.setattr(main.socketio.server, "manager", SimpleNamespace(get_participants=get_participants))
+    sent = []
+    monkeypatch.setattr(main.socketio, "emit", lambda event, data, to=None: sent.append((event, to)))
+    before = _deliveries("test_event")
+
+    main._emit("test_event", {}, "conversation_1")
+
+    assert sent == [("test_event", "conversation_1")]
+    assert _deliveries("test_event") == before
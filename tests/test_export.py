@@ -0,0 +1,47 @@
+import pytest
+
+import main
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    main.db_manager.close()
+    monkeypatch.setattr(main.db_manager, "db_path", str(tmp_path / "export.db"))
+    main.db_manager.init_db()
+    yield main.app.test_client()
+    main.db_manager.close()
+
+
+def _interleaved(db):
+    # 兩個同時進行的對話，訊息 id 交錯寫入
+    first = db.create_conversation("A", "prompt", "gpt-4o", "B", "prompt", "gpt-4o", title="first")
+    second = db.create_conversation("C", "prompt", "gpt-4o", "D", "prompt", "gpt-4o", title="second")
+    for turn in range(3):
+        db.add_message(first, "A", f"first {turn}")
+        db.add_message(second, "C", f"second {turn}")
+    return first, second
+
+
+def test_iter_messages_groups_by_conversation(client):
+    first, second = _interleaved(main.db_manager)
+    messages = list(main.db_manager.iter_messages(chunk_size=2))
+    assert [(msg["conversation_id"], msg["content"]) for msg in messages] == (
+        [(first, f"first {turn}") for turn in range(3)] + [(second, f"second {turn}") for turn in range(3)]
+    )
+
+
+def test_txt_export_writes_one_heading_per_conversation(client):
+    first, second = _interleaved(main.db_manager)
+    text = client.get("/api/export?format=txt").get_data(as_text=True)
+
+    assert text.count("=== Conversation") == 2
+    first_heading = text.index(f"=== Conversation {first}: first ===")
+    second_heading = text.index(f"=== Conversation {second}: second ===")
+    assert first_heading < text.index("first 2") < second_heading < text.index("second 0")
+
+
+@pytest.mark.parametrize("ids", ["1,2", [1, "2"], [True], {"1": 1}])
+def test_export_rejects_invalid_json_ids(client, ids):
+    response = client.post("/api/export?format=jsonl", json={"ids": ids})
+    assert response.status_code == 400
+    assert "ids" in response.get_json()["error"]
@@ -0,0 +1,130 @@
+import pytest
+
+from engine.conversation import BotConfig, ConversationState
+from engine.history import SlidingWindowPolicy, SummarizingPolicy, create_history_policy
+
+
+def _history(pairs):
+    # 系統提示、pairs 組 user/assistant，最後是最新的 user 訊息
+    history = [{"role": "system", "content": "prompt"}]
+    for index in range(1, pairs + 1):
+        history.append({"role": "user", "content": f"u{index}"})
+        history.append({"role": "assistant", "content": f"a{index}"})
+    history.append({"role": "user", "content": "new"})
+    return history
+
+
+def _contents(messages):
+    return [message["content"] for message in messages]
+
+
+def test_window_keeps_system_prompt_and_newest_messages():
+    policy = SlidingWindowPolicy(lambda model: 65, reserve_tokens=0)
+    history = _history(3)
+    messages, dropped = policy.select(history, [10] * len(history), "gpt-4o")
+    assert _contents(messages) == ["prompt", "u2", "a2", "u3", "a3", "new"]
+    assert dropped == 2
+
+
+def test_window_never_starts_with_an_assistant_message():
+    policy = SlidingWindowPolicy(lambda model: 55, reserve_tokens=0)
+    history = _history(3)
+    messages, dropped = policy.select(history, [10] * len(history), "gpt-4o")
+    # a2 還放得下，但不能單獨放入，視窗從 u3 開始
+    assert _contents(messages) == ["prompt", "u3", "a3", "new"]
+    assert dropped == 4
+
+
+def test_window_budget_uses_reserve_and_max_tokens():
+    assert SlidingWindowPolicy(lambda model: 8000, reserve_tokens=1000).budget("gpt-4o") == 7000
+    assert SlidingWindowPolicy(lambda model: 8000, reserve_tokens=1000, max_tokens=500).budget("gpt-4o") == 500
+    # 超出預算時仍會送出系統提示與最新訊息
+    history = _history(2)
+    messages, dropped = SlidingWindowPolicy(lambda model: 5, reserve_tokens=0).select(
+        history, [10] * len(history), "gpt-4o")
+    assert _contents(messages) == ["prompt", "new"]
+    assert dropped == 4
+
+
+def test_window_sends_summary_after_system_prompt():
+    policy = SlidingWindowPolicy(lambda model: 1000, reserve_tokens=0)
+    history = _history(1)
+    messages, dropped = policy.select(history, [10] * len(history), "gpt-4o", summary="they met")
+    assert messages[1] == {"role": "system", "content": "Summary of the earlier conversation: they met"}
+    assert _contents(messages[2:]) == ["u1", "a1", "new"]
+    assert dropped == 0
+
+
+def test_summary_waits_for_interval_and_caps_at_four_intervals():
+    policy = SummarizingPolicy(lambda model: 1000, interval=3)
+    history = _history(10)[:-1]
+    assert policy.summary_request(history, 2) is None
+
+    messages, count = policy.summary_request(history, 3)
+    assert count == 3
+    assert messages[1]["content"] == "New messages:\nuser: u1\nassistant: a1\nuser: u2"
+
+    # 一次最多整理 4 × interval 則
+    messages, count = policy.summary_request(history, 20, summary="earlier")
+    assert count == 12
+    assert messages[1]["content"].startswith("Previous summary: earlier\n\nNew messages:\nuser: u1\n")
+    assert messages[1]["content"].endswith("assistant: a6")
+
+
+def test_state_replaces_summarized_messages():
+    policy = SummarizingPolicy(lambda model: 45, reserve_tokens=0, interval=2)
+    bot = BotConfig("Bot", "prompt", "gpt-4o")
+    state = ConversationState(1, bot, BotConfig("Other", "prompt", "gpt-4o"), "hello",
+                              history_policy=policy, count_message_tokens=lambda message, model: 10)
+    state.histories["bot2"] += _history(3)[1:-1]
+    state.token_counts["bot2"] += [10] * 6
+
+    turn = state.next_turn()
+    assert turn.dropped == 4
+    assert state.summary_request(turn) is not None
+    assert turn.summarized == 4
+    state.apply_summary(turn, "they talked")
+
+    assert _contents(state.histories["bot2"]) == ["prompt", "u3", "a3"]
+    assert len(state.token_counts["bot2"]) == 3
+    turn = state.next_turn()
+    assert _contents(turn.messages) == ["prompt", "Summary of the earlier conversation: they talked", "hello"]
+
+
+def test_unknown_policy_is_rejected():
+    assert create_history_policy("full", None).name == "full"
+    with pytest.raises(ValueError):
+        create_history_policy("latest", None)
+
+
+def _stored(*pairs):
+    return [{"bot_name": name, "content": content} for name, content in pairs]
+
+
+def test_restore_assigns_messages_by_bot_name():
+    state = ConversationState(1, BotConfig("Alice", "be Alice", "gpt-4o"), BotConfig("Bob", "be Bob", "gpt-4o"),
+                              "hi", is_resuming=True)
+    state.restore(_stored(("Alice", "hi"), ("Bob", "b1"), ("Alice", "a1"), ("Bob", "b2")))
+
+    assert state.histories["bot1"][1:] == [
+        {"role": "user", "content": "b1"}, {"role": "assistant", "content": "a1"}]
+    assert state.histories["bot2"][1:] == [
+        {"role": "user", "content": "hi"}, {"role": "assistant", "content": "b1"},
+        {"role": "user", "content": "a1"}, {"role": "assistant", "content": "b2"}]
+    # Bob 說了最後一句，接著由 Alice 回應
+    turn = state.next_turn()
+    assert turn.responding_bot == "Alice"
+    assert turn.messages[-1] == {"role": "user", "content": "b2"}
+
+
+def test_restore_alternates_when_both_bots_share_a_name():
+    state = ConversationState(1, BotConfig("Bot", "first", "gpt-4o"), BotConfig("Bot", "second", "gpt-4o"),
+                              "hi", is_resuming=True)
+    state.restore(_stored(("Bot", "hi"), ("Bot", "r1"), ("Bot", "r2")))
+
+    assert _contents(state.histories["bot2"]) == ["second", "hi", "r1"]
+    assert _contents(state.histories["bot1"]) == ["first", "r1", "r2"]
+    turn = state.next_turn()
+    assert turn.next_bot == "bot2"
+    assert turn.messages[0]["content"] == "second"
+    assert turn.messages[-1]["content"] == "r2"
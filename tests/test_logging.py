@@ -0,0 +1,78 @@
+import json
+import logging
+import queue
+import threading
+import time
+
+import pytest
+
+from logging_config import JsonFormatter, SamplingFilter, TextFormatter, TEXT_FORMAT, fields, sampled
+from message_queue import LocalBroker, LocalQueueManager, parse_url
+
+
+def _record(level=logging.DEBUG, msg="turn done", extra=None):
+    record = logging.LogRecord("engine", level, __file__, 1, msg, (), None)
+    record.__dict__.update(extra or {})
+    return record
+
+
+def test_fields_become_json_keys_and_text_pairs():
+    record = _record(extra=fields(conversation_id=3, model="gpt-4o"))
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry["message"] == "turn done"
+    assert (entry["level"], entry["conversation_id"], entry["model"]) == ("DEBUG", 3, "gpt-4o")
+    assert TextFormatter(TEXT_FORMAT).format(record).endswith("engine: turn done conversation_id=3 model=gpt-4o")
+
+
+def test_only_sampled_records_below_warning_are_sampled():
+    dropping = SamplingFilter(rate=0)
+    assert not dropping.filter(_record(extra=sampled(turn=1)))
+    assert dropping.filter(_record(extra=fields(turn=1)))
+    assert dropping.filter(_record(level=logging.WARNING, extra=sampled(turn=1)))
+    assert SamplingFilter(rate=1).filter(_record(extra=sampled(turn=1)))
+
+
+def test_parse_url_defaults_the_host():
+    assert parse_url("local://10.0.0.2:5600/") == ("10.0.0.2", 5600)
+    assert parse_url("local://:5601") == ("127.0.0.1", 5601)
+
+
+@pytest.fixture
+def broker():
+    broker = LocalBroker(("127.0.0.1", 0))
+    thread = threading.Thread(target=broker.serve_forever, daemon=True)
+    thread.start()
+    yield broker
+    broker.shutdown()
+    broker.server_close()
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_broker_relays_events_on_the_same_channel(broker):
+    url = "local://127.0.0.1:%d" % broker.server_address[1]
+    listener = LocalQueueManager(url)
+    received = queue.Queue()
+
+    def listen():
+        for data in listener._listen():
+            received.put(data)
+
+    threading.Thread(target=listen, daemon=True).start()
+    _wait_for(lambda: len(broker.clients) == 1)
+
+    publishers = [LocalQueueManager(url, channel="other-app"), LocalQueueManager(url)]
+    try:
+        publishers[0]._publish({"method": "emit", "event": "ignored"})
+        publishers[1]._publish({"method": "emit", "event": "new_message"})
+        assert received.get(timeout=5) == {"method": "emit", "event": "new_message"}
+        # 其他頻道的訊息不會轉給這個 worker
+        assert received.empty()
+    finally:
+        for publisher in publishers:
+            publisher._sender.close()
@@ -0,0 +1,71 @@
+import pytest
+
+import main
+from metrics import Registry
+
+
+def test_counters_render_labels_in_the_text_format():
+    registry = Registry()
+    counter = registry.counter("app_events_total", "Events", ("event",))
+    counter.inc(event="new_message")
+    counter.inc(2, event='say "hi"\n')
+    assert registry.render().splitlines() == [
+        "# HELP app_events_total Events",
+        "# TYPE app_events_total counter",
+        'app_events_total{event="new_message"} 1',
+        'app_events_total{event="say \\"hi\\"\\n"} 2',
+    ]
+    with pytest.raises(ValueError):
+        counter.inc(kind="other")
+    # 同名指標只註冊一次
+    assert registry.counter("app_events_total", "Events", ("event",)) is counter
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    histogram = registry.histogram("app_seconds", "Latency", buckets=(0.1, 1))
+    for value in (0.05, 0.1, 0.5, 3):
+        histogram.observe(value)
+    assert registry.render().splitlines()[2:] == [
+        'app_seconds_bucket{le="0.1"} 2',
+        'app_seconds_bucket{le="1"} 3',
+        'app_seconds_bucket{le="+Inf"} 4',
+        "app_seconds_sum 3.65",
+        "app_seconds_count 4",
+    ]
+
+
+def test_gauge_callback_is_read_at_scrape_time():
+    registry = Registry()
+    active = [2]
+    registry.gauge("app_active", "Active", callback=lambda: active[0])
+    active[0] = 5
+    assert registry.render().splitlines()[-1] == "app_active 5"
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    main.db_manager.close()
+    monkeypatch.setattr(main.db_manager, "db_path", str(tmp_path / "metrics.db"))
+    main.db_manager.init_db()
+    yield main.app.test_client()
+    main.db_manager.close()
+
+
+def test_metrics_endpoint_reports_route_and_database_timings(client, monkeypatch):
+    main.db_manager.create_conversation("A", "prompt", "gpt-4o", "B", "prompt", "gpt-4o")
+    response = client.get("/api/conversations")
+    assert response.status_code == 200
+    # 路由耗時在回應送完 (關閉) 時才記錄
+    response.close()
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.content_type.startswith("text/plain; version=0.0.4")
+    text = response.get_data(as_text=True)
+    assert 'simulator_db_operation_seconds_count{kind="write",operation="create_conversation"}' in text
+    assert 'simulator_http_request_seconds_count{endpoint="get_conversations",status="200"}' in text
+    assert "simulator_active_conversations 0" in text
+
+    monkeypatch.setenv("METRICS_ENABLED", "0")
+    assert client.get("/metrics").status_code == 404
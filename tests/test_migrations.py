@@ -0,0 +1,126 @@
+import sqlite3
+import time
+from datetime import datetime
+
+import pytest
+
+from database.db_manager import DatabaseManager
+from database.migrations import SCHEMA_VERSION, get_schema_version
+from database.search import parse_query
+
+# 最早版本的資料表 (尚未有 title 欄位，也沒有 user_version)
+BASELINE_SCHEMA = '''
+CREATE TABLE conversations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TEXT,
+    bot1_name TEXT,
+    bot1_system_prompt TEXT,
+    bot1_model TEXT,
+    bot2_name TEXT,
+    bot2_system_prompt TEXT,
+    bot2_model TEXT,
+    total_tokens INTEGER DEFAULT 0,
+    total_cost REAL DEFAULT 0.0
+);
+CREATE TABLE messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    conversation_id INTEGER,
+    timestamp TEXT,
+    bot_name TEXT,
+    content TEXT,
+    prompt_tokens INTEGER DEFAULT 0,
+    completion_tokens INTEGER DEFAULT 0,
+    total_tokens INTEGER DEFAULT 0,
+    cost REAL DEFAULT 0.0,
+    FOREIGN KEY (conversation_id) REFERENCES conversations (id)
+);
+'''
+
+MESSAGES = [
+    # (conversation_id, local timestamp, bot, content, total_tokens, cost)
+    (1, "2024-03-01 08:00:00", "Alice", "hello from the first", 0, 0.0),
+    (2, "2024-03-01 08:00:05", "Carol", "hello from the second", 0, 0.0),
+    (1, "2024-03-01 08:00:10", "Bob", "weather is nice", 30, 0.5),
+    (2, "2024-03-01 08:00:15", "Dave", "rain tomorrow", 40, 0.75),
+    (1, "2024-03-01 08:00:20", "Alice", "indeed", 20, 0.25),
+]
+
+
+@pytest.fixture
+def local_time(monkeypatch):
+    # 本地時間與 UTC 不同，才能確認 created_at 有換算時區
+    monkeypatch.setenv("TZ", "Asia/Taipei")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def _baseline_db(path):
+    conn = sqlite3.connect(path)
+    conn.executescript(BASELINE_SCHEMA)
+    conn.executemany(
+        "INSERT INTO conversations (id, timestamp, bot1_name, bot1_system_prompt, bot1_model, "
+        "bot2_name, bot2_system_prompt, bot2_model) VALUES (?, ?, ?, ?, 'gpt-4o', ?, ?, 'gpt-4o')",
+        [(1, "2024-03-01 08:00:00", "Alice", "You talk about weather", "Bob", "You agree"),
+         (2, "2024-03-01 08:00:05", "Carol", "You forecast", "Dave", "You listen")])
+    conn.executemany(
+        "INSERT INTO messages (conversation_id, timestamp, bot_name, content, total_tokens, cost) "
+        "VALUES (?, ?, ?, ?, ?, ?)", MESSAGES)
+    conn.commit()
+    conn.close()
+
+
+def test_baseline_database_is_migrated_with_its_data(tmp_path, local_time):
+    path = str(tmp_path / "baseline.db")
+    _baseline_db(path)
+    db = DatabaseManager(db_path=path)
+    db.init_db()
+    try:
+        with db.get_connection() as conn:
+            assert get_schema_version(conn) == SCHEMA_VERSION
+            rows = conn.execute("SELECT conversation_id, content, turn, created_at FROM messages ORDER BY id").fetchall()
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(conversations)")]
+
+        assert [(row["conversation_id"], row["content"], row["turn"]) for row in rows] == [
+            (1, "hello from the first", 0),
+            (2, "hello from the second", 0),
+            (1, "weather is nice", 1),
+            (2, "rain tomorrow", 1),
+            (1, "indeed", 2),
+        ]
+        assert [row["created_at"] for row in rows] == [
+            int(datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S").timestamp()) * 1000
+            for _, timestamp, *_ in MESSAGES
+        ]
+        # 台北時間 08:00 = UTC 00:00
+        assert rows[0]["created_at"] == 1709251200000
+        assert "title" in columns and "budget" in columns
+
+        # 各機器人的統計由既有訊息回填
+        bot_stats = db.get_conversation_token_stats(1)["bot_stats"]
+        assert {name: stats["total_tokens"] for name, stats in bot_stats.items()} == {"Alice": 20, "Bob": 30}
+
+        # 遷移後新訊息接續既有的回合數
+        db.add_message(1, "Bob", "bye")
+        assert db.get_messages_by_conversation_id(1)[-1]["turn"] == 3
+
+        results, _ = db.search(parse_query("weather"))
+        assert {(result["type"], result["conversation_id"]) for result in results} >= {("message", 1)}
+    finally:
+        db.close()
+
+
+def test_migrating_twice_changes_nothing(tmp_path):
+    path = str(tmp_path / "twice.db")
+    _baseline_db(path)
+    for _ in range(2):
+        db = DatabaseManager(db_path=path)
+        db.init_db()
+        db.close()
+    conn = sqlite3.connect(path)
+    try:
+        assert conn.execute("SELECT count(*) FROM messages").fetchone()[0] == len(MESSAGES)
+        assert conn.execute("SELECT count(*) FROM conversation_bot_stats").fetchone()[0] == 4
+    finally:
+        conn.close()
@@ -0,0 +1,83 @@
+import asyncio
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+import mock_server
+from llm.mock import MockAPIError, MockBackend
+from llm.models import get_capabilities
+from llm.providers import MockProvider, OpenAIProvider, create_provider
+from llm.scheduler import is_retryable, retry_after
+
+MESSAGES = [{"role": "system", "content": "be brief"}, {"role": "user", "content": "hello there"}]
+
+
+def _backend(**options):
+    return MockBackend(**{"latency": 0, "tokens_per_second": 0, "reply_tokens": 5, **options})
+
+
+def test_capabilities_match_dated_variants_by_prefix():
+    assert get_capabilities("o1-mini-2024-09-12") is get_capabilities("o1-mini")
+    assert not get_capabilities("o1-mini").system_messages
+    assert get_capabilities("o1-preview") is get_capabilities("o1")
+    assert get_capabilities("o1").request_params() == {"max_completion_tokens": 4000}
+    assert get_capabilities("gpt-4o").request_params() == {"max_tokens": 1000, "temperature": 0.7}
+
+
+def test_replies_are_deterministic_per_request():
+    backend = _backend()
+    assert backend.reply(MESSAGES) == _backend().reply(MESSAGES)
+    assert len(backend.reply(MESSAGES)) == 5
+    usage = backend.usage(MESSAGES, backend.reply(MESSAGES))
+    assert (usage.completion_tokens, usage.total_tokens) == (5, usage.prompt_tokens + 5)
+
+
+def test_injected_errors_look_like_retryable_api_errors():
+    backend = _backend(error_rate=1.0, error_statuses=(429,), retry_after=3, seed=1)
+    error = backend.injected_error()
+    assert isinstance(error, MockAPIError)
+    assert is_retryable(error)
+    assert retry_after(error) == 3.0
+    assert _backend(error_rate=0.0).injected_error() is None
+
+
+def test_mock_provider_streams_the_reply():
+    provider = create_provider("mock", mock_backend=_backend())
+    assert isinstance(provider, MockProvider)
+    deltas = []
+    reply, usage = provider.complete("gpt-4o", MESSAGES, get_capabilities("gpt-4o"), deltas.append)
+    assert "".join(deltas) == reply
+    assert len(deltas) == usage.completion_tokens == 5
+    reply_async, _ = asyncio.run(provider.complete_async("gpt-4o", MESSAGES, get_capabilities("gpt-4o")))
+    assert reply_async == reply
+    with pytest.raises(ValueError):
+        create_provider("nobody")
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setattr(mock_server.MockHandler, "backend", _backend())
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), mock_server.MockHandler)
+    httpd.daemon_threads = True
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}/v1"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.mark.parametrize("model", ["gpt-4o", "o1"])
+def test_openai_provider_talks_to_the_mock_server(server, model):
+    provider = OpenAIProvider(api_key="mock", base_url=server)
+    expected = "".join(MockBackend.deltas(_backend().reply(MESSAGES)))
+    deltas = []
+
+    reply, usage = provider.complete(model, MESSAGES, get_capabilities(model), deltas.append)
+    assert reply == expected
+    assert "".join(deltas) == expected
+    assert usage.completion_tokens == 5
+
+    reply, usage = asyncio.run(provider.complete_async(model, MESSAGES, get_capabilities(model)))
+    assert reply == expected
+    assert usage.completion_tokens == 5
@@ -0,0 +1,83 @@
+import json
+from unittest import mock
+
+import pytest
+
+from engine import pricing as pricing_module
+from engine.pricing import ExchangeRates, ModelPricing, PricingTable
+
+
+def test_parsed_rates_keep_defaults():
+    rates = ExchangeRates.parse("JPY=150")
+    assert rates.rate("jpy") == 150.0
+    assert rates.rate("TWD") == 31.5
+    assert rates.rate("USD") == 1.0
+
+
+def test_parsed_rate_overrides_default():
+    assert ExchangeRates.parse("TWD=32").rate("TWD") == 32.0
+
+
+def test_unknown_currency_names_the_setting():
+    with pytest.raises(ValueError, match="EXCHANGE_RATES"):
+        ExchangeRates.parse("").rate("EUR")
+
+
+PRICES = {
+    "sample_spec": {"max_tokens": "set to max output tokens"},
+    "gpt-4o": {"input_cost_per_token": 2.5e-06, "max_input_tokens": 128000},
+    "openai/gpt-4o": {"input_cost_per_token": 9.9, "max_input_tokens": 1},
+    "gpt-3.5-turbo": {"input_cost_per_token": 5e-07, "max_tokens": 16385},
+}
+
+
+def test_table_lookup_normalizes_names():
+    table = PricingTable(PRICES)
+    assert len(table) == 2
+    # 帶前綴的重複項目不覆蓋原本的名稱
+    assert table.lookup("gpt-4o")["input_cost_per_token"] == 2.5e-06
+    assert table.lookup("openai/GPT-4o") is table.lookup("gpt-4o")
+    assert table.lookup("gpt-4o-2024-08-06") is table.lookup("gpt-4o")
+    assert table.lookup("gpt4o") is table.lookup("gpt-4o")
+    assert table.lookup("claude-3") is None
+
+
+def _write(path, data):
+    path.write_text(json.dumps(data), encoding="UTF-8")
+    return str(path)
+
+
+def test_pricing_prefers_cache_then_snapshot_and_falls_back(tmp_path):
+    snapshot = _write(tmp_path / "snapshot.json", PRICES)
+    pricing = ModelPricing(str(tmp_path / "missing.json"), snapshot_path=snapshot)
+    assert pricing.get_context_limit("gpt-4o-mini-2024") == 128000
+    # 不認得的模型使用 fallback_model 的價格
+    assert pricing.get_model_data("mystery-model") is pricing.table.lookup("gpt-3.5-turbo")
+    assert pricing.get_context_limit("mystery-model") == 16385
+
+    cache = _write(tmp_path / "cache.json", {"gpt-4o": {"input_cost_per_token": 1.0}})
+    assert ModelPricing(cache, snapshot_path=snapshot).get_model_data("gpt-4o") == {"input_cost_per_token": 1.0}
+
+
+def test_refresh_swaps_the_table_and_keeps_it_on_failure(tmp_path, monkeypatch):
+    snapshot = _write(tmp_path / "snapshot.json", PRICES)
+    cache_path = str(tmp_path / "cache" / "prices.json")
+    pricing = ModelPricing(cache_path, snapshot_path=snapshot)
+    assert pricing.is_stale()
+    assert pricing.get_model_data("gpt-4o")["input_cost_per_token"] == 2.5e-06
+
+    new_prices = {"gpt-4o": {"input_cost_per_token": 5e-06}}
+    response = mock.Mock(json=lambda: new_prices, raise_for_status=lambda: None)
+    monkeypatch.setattr(pricing_module.requests, "get", lambda url, timeout: response)
+    assert pricing.refresh() is True
+    assert pricing.get_model_data("gpt-4o")["input_cost_per_token"] == 5e-06
+    assert not pricing.is_stale()
+    with open(cache_path, encoding="UTF-8") as f:
+        assert json.load(f) == new_prices
+
+    def offline(url, timeout):
+        raise OSError("network unreachable")
+
+    monkeypatch.setattr(pricing_module.requests, "get", offline)
+    assert pricing.refresh() is False
+    assert pricing.get_model_data("gpt-4o")["input_cost_per_token"] == 5e-06
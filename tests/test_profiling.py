@@ -0,0 +1,141 @@
+import json
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import main
+from profiler import Profile, SamplingProfiler
+from tracing import FileExporter, Tracer
+
+
+class ListExporter:
+    def __init__(self):
+        self.spans = []
+
+    def export(self, span):
+        self.spans.append(span)
+
+
+def test_spans_nest_within_a_trace():
+    exporter = ListExporter()
+    tracer = Tracer(exporter)
+    with tracer.trace("turn", conversation_id=1) as root:
+        with tracer.span("model_request", model="gpt-4o"):
+            pass
+        with pytest.raises(TimeoutError), tracer.span("store"):
+            raise TimeoutError("db busy")
+        root.set(reply_tokens=5)
+
+    child, failed, parent = exporter.spans
+    assert {child.trace_id, failed.trace_id} == {parent.trace_id}
+    assert child.parent_id == failed.parent_id == parent.span_id
+    assert parent.parent_id is None and parent.attributes == {"conversation_id": 1, "reply_tokens": 5}
+    assert failed.error == "TimeoutError: db busy"
+
+
+def test_spans_outside_sampled_traces_are_not_recorded():
+    exporter = ListExporter()
+    tracer = Tracer(exporter, sample_rate=0)
+    with tracer.trace("turn"), tracer.span("model_request"):
+        pass
+    with Tracer(exporter).span("orphan"):
+        pass
+    assert exporter.spans == []
+
+
+def test_bind_carries_the_span_into_an_executor():
+    exporter = ListExporter()
+    tracer = Tracer(exporter)
+
+    def count_tokens():
+        with tracer.span("count_tokens"):
+            pass
+
+    with tracer.trace("turn") as root, ThreadPoolExecutor(1) as executor:
+        executor.submit(tracer.bind(count_tokens)).result()
+        # 沒有 bind 時執行緒不在任何 span 內
+        executor.submit(count_tokens).result()
+    assert len(exporter.spans) == 2
+    assert exporter.spans[0].name == "count_tokens"
+    assert exporter.spans[0].parent_id == root.span_id
+
+
+@pytest.mark.parametrize("fmt", ["json", "otlp"])
+def test_file_exporter_writes_one_json_document_per_line(tmp_path, fmt):
+    path = tmp_path / "traces.jsonl"
+    tracer = Tracer(FileExporter(str(path), fmt))
+    with tracer.trace("turn", conversation_id=1), tracer.span("model_request"):
+        pass
+    tracer.close()
+
+    documents = [json.loads(line) for line in path.read_text().splitlines()]
+    if fmt == "json":
+        assert sorted(document["name"] for document in documents) == ["model_request", "turn"]
+    else:
+        spans = [span for document in documents
+                 for span in document["resourceSpans"][0]["scopeSpans"][0]["spans"]]
+        turn = next(span for span in spans if span["name"] == "turn")
+        assert turn["attributes"] == [{"key": "conversation_id", "value": {"intValue": "1"}}]
+        assert next(span for span in spans if span["name"] == "model_request")["parentSpanId"] == turn["spanId"]
+
+
+def test_top_splits_self_and_total_samples():
+    stacks = Counter({("conversation-1", "main:run", "main:request"): 3, ("conversation-1", "main:run"): 1})
+    top = Profile(stacks, samples=4, duration=0.02, interval=0.005).top()
+    assert top["functions"] == [
+        {"function": "main:request", "self": 3, "total": 3},
+        {"function": "main:run", "self": 1, "total": 4},
+    ]
+
+
+def _parked_in_wait(event):
+    event.wait()
+
+
+def test_waiting_threads_are_sampled():
+    # 取樣的是牆鐘時間: 等待中的執行緒同樣會被記錄
+    event = threading.Event()
+    thread = threading.Thread(target=_parked_in_wait, args=(event,), name="conversation-7")
+    thread.start()
+    profiler = SamplingProfiler(interval=0.001)
+    try:
+        profile = profiler.run(0.05, thread_filter="conversation-7")
+    finally:
+        event.set()
+        thread.join()
+
+    assert profile.samples > 0
+    assert {stack[0] for stack in profile.stacks} == {"conversation-7"}
+    assert any(frame.startswith("test_profiling:_parked_in_wait:") for stack in profile.stacks for frame in stack)
+
+
+def test_only_one_profile_runs_at_a_time():
+    profiler = SamplingProfiler()
+    with profiler._lock:
+        assert profiler.run(0.01) is None
+
+
+@pytest.fixture
+def admin(monkeypatch):
+    monkeypatch.setattr(main, "ADMIN_TOKEN", "secret")
+    return main.app.test_client()
+
+
+def test_profile_route_requires_the_admin_token(admin, monkeypatch):
+    assert admin.get("/admin/profile?seconds=0.01").status_code == 401
+    assert admin.get("/admin/profile?seconds=0.01", headers={"Authorization": "Bearer wrong"}).status_code == 401
+    monkeypatch.setattr(main, "ADMIN_TOKEN", None)
+    assert admin.get("/admin/profile?seconds=0.01").status_code == 404
+
+
+def test_profile_route_returns_the_profile(admin, monkeypatch):
+    headers = {"Authorization": "Bearer secret"}
+    response = admin.get("/admin/profile?seconds=0.01&format=json", headers=headers)
+    assert response.status_code == 200
+    assert response.get_json()["samples"] > 0
+    assert admin.get("/admin/profile?seconds=600", headers=headers).status_code == 400
+
+    monkeypatch.setattr(main, "green_thread_library", lambda: "eventlet")
+    assert admin.get("/admin/profile?seconds=0.01", headers=headers).status_code == 501
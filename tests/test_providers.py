@@ -0,0 +1,94 @@
+import asyncio
+from types import SimpleNamespace
+from unittest import mock
+
+import pytest
+
+from llm.models import get_capabilities
+from llm.providers import OpenAIProvider
+
+USAGE = SimpleNamespace(prompt_tokens=12, completion_tokens=3, total_tokens=15)
+FULL_REPLY = SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="Hello there"))], usage=USAGE)
+
+
+def _chunk(text):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))], usage=None)
+
+
+def _broken_stream():
+    # 送出一個片段後連線中斷
+    yield _chunk("Hel")
+    raise ConnectionError("stream interrupted")
+
+
+async def _broken_stream_async():
+    for chunk in _broken_stream():
+        yield chunk
+
+
+def _create(stream, reply):
+    def create(**kwargs):
+        return stream() if kwargs.get("stream") else reply
+    return create
+
+
+class Recorder:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, delta, reset=False):
+        self.calls.append((delta, reset))
+
+
+def test_stream_fallback_resets_streamed_text():
+    provider = OpenAIProvider(api_key="test")
+    create = mock.MagicMock(side_effect=_create(_broken_stream, FULL_REPLY))
+    provider._client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    on_delta = Recorder()
+
+    reply, usage = provider.complete("o1", [{"role": "user", "content": "hi"}], get_capabilities("o1"), on_delta)
+
+    assert (reply, usage) == ("Hello there", USAGE)
+    assert create.call_count == 2
+    assert on_delta.calls == [("Hel", False), ("", True)]
+
+
+def test_stream_fallback_resets_streamed_text_async():
+    provider = OpenAIProvider(api_key="test")
+
+    async def create(**kwargs):
+        return _broken_stream_async() if kwargs.get("stream") else FULL_REPLY
+
+    provider._async_client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    on_delta = Recorder()
+
+    reply, usage = asyncio.run(provider.complete_async(
+        "o1", [{"role": "user", "content": "hi"}], get_capabilities("o1"), on_delta))
+
+    assert reply == "Hello there"
+    assert on_delta.calls == [("Hel", False), ("", True)]
+
+
+def test_broken_stream_without_fallback_raises():
+    provider = OpenAIProvider(api_key="test")
+    create = mock.MagicMock(side_effect=_create(_broken_stream, FULL_REPLY))
+    provider._client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+    with pytest.raises(ConnectionError):
+        provider.complete("gpt-4o", [{"role": "user", "content": "hi"}], get_capabilities("gpt-4o"), Recorder())
+    assert create.call_count == 1
+
+
+def test_reset_reaches_the_client_through_main(monkeypatch):
+    import main
+
+    provider = OpenAIProvider(api_key="test")
+    create = mock.MagicMock(side_effect=_create(_broken_stream, FULL_REPLY))
+    provider._client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    monkeypatch.setattr(main, "llm_provider", provider)
+    on_delta = Recorder()
+
+    result = main.request_completion("o1", [{"role": "user", "content": "hi"}], on_delta)
+
+    assert result == ("Hello there", 12, 3, 15)
+    assert on_delta.calls == [("Hel", False), ("", True)]
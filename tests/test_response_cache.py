@@ -0,0 +1,82 @@
+import json
+import os
+
+import pytest
+
+from llm import cache as cache_module
+from llm.cache import ReplayMissError, ResponseCache, cache_key
+
+MESSAGES = [{"role": "user", "content": "你好"}]
+PARAMS = {"max_tokens": 100, "temperature": 0.7}
+RESULT = ("哈囉", 10, 2, 12)
+
+
+def test_key_depends_on_request_not_dict_order():
+    assert cache_key("gpt-4o", MESSAGES, PARAMS) == cache_key("gpt-4o", MESSAGES, dict(reversed(PARAMS.items())))
+    assert cache_key("gpt-4o", MESSAGES, PARAMS) != cache_key("gpt-4o-mini", MESSAGES, PARAMS)
+    assert cache_key("gpt-4o", MESSAGES, PARAMS) != cache_key("gpt-4o", MESSAGES, {**PARAMS, "temperature": 0})
+
+
+def test_recorded_response_is_replayed_from_disk(tmp_path):
+    recorder = ResponseCache("record", directory=str(tmp_path))
+    key, result = recorder.lookup("gpt-4o", MESSAGES, PARAMS)
+    assert result is None
+    recorder.put(key, "gpt-4o", RESULT)
+    with open(recorder._path(key), encoding="UTF-8") as f:
+        assert json.load(f)["reply"] == "哈囉"
+    # record 模式即使已有紀錄也會重新呼叫 API
+    assert recorder.lookup("gpt-4o", MESSAGES, PARAMS) == (key, None)
+
+    # 新的行程只有磁碟上的紀錄
+    replay = ResponseCache("replay", directory=str(tmp_path))
+    assert replay.lookup("gpt-4o", MESSAGES, PARAMS) == (key, RESULT)
+    with pytest.raises(ReplayMissError):
+        replay.lookup("gpt-4o", [{"role": "user", "content": "other"}], PARAMS)
+
+
+def test_expired_disk_entries_are_removed(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache_module.time, "time", lambda: now[0])
+    cache = ResponseCache("on", directory=str(tmp_path), ttl=60)
+    key = cache_key("gpt-4o", MESSAGES, PARAMS)
+    cache.put(key, "gpt-4o", RESULT)
+
+    fresh = ResponseCache("on", directory=str(tmp_path), ttl=60)
+    now[0] += 30
+    assert fresh.get(key) == RESULT
+
+    expired = ResponseCache("on", directory=str(tmp_path), ttl=60)
+    now[0] += 60
+    assert expired.get(key) is None
+    assert not os.path.exists(cache._path(key))
+
+
+def test_memory_tier_is_bounded():
+    cache = ResponseCache("on", max_entries=2)
+    keys = [cache_key("gpt-4o", [{"role": "user", "content": str(index)}], PARAMS) for index in range(3)]
+    for key in keys:
+        cache.put(key, "gpt-4o", RESULT)
+    assert cache.get(keys[0]) is None
+    assert cache.get(keys[2]) == RESULT
+
+
+def test_unknown_mode_is_rejected():
+    with pytest.raises(ValueError):
+        ResponseCache("sometimes")
+
+
+def test_cache_hit_skips_the_provider(monkeypatch):
+    import main
+    from llm.models import get_capabilities
+
+    cache = ResponseCache("on")
+    cache.put(cache_key("gpt-4o", MESSAGES, get_capabilities("gpt-4o").request_params()), "gpt-4o", RESULT)
+    monkeypatch.setattr(main, "response_cache", cache)
+
+    def unreachable(*args, **kwargs):
+        raise AssertionError("the provider must not be called on a cache hit")
+
+    monkeypatch.setattr(main.llm_provider, "complete", unreachable)
+    deltas = []
+    assert main.request_completion("gpt-4o", MESSAGES, lambda delta, reset=False: deltas.append(delta)) == RESULT
+    assert deltas == ["哈囉"]
@@ -0,0 +1,50 @@
+from types import SimpleNamespace
+from unittest import mock
+
+import main
+from engine.history import FullHistoryPolicy
+from engine.session_manager import ConversationSession
+from llm.providers import OpenAIProvider
+
+USAGE = SimpleNamespace(prompt_tokens=20, completion_tokens=5, total_tokens=25)
+
+
+def _chunks():
+    yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content="b2"))], usage=None)
+    yield SimpleNamespace(choices=[], usage=USAGE)
+
+
+def test_resumed_conversation_sends_the_stored_history(tmp_path, monkeypatch):
+    main.db_manager.close()
+    monkeypatch.setattr(main.db_manager, "db_path", str(tmp_path / "resume.db"))
+    main.db_manager.init_db()
+    provider = OpenAIProvider(api_key="test")
+    create = mock.MagicMock(side_effect=lambda **kwargs: _chunks())
+    provider._client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    monkeypatch.setattr(main, "llm_provider", provider)
+    monkeypatch.setattr(main, "TURN_DELAY", 0)
+    monkeypatch.setattr(main, "history_policy", FullHistoryPolicy())
+    try:
+        db = main.db_manager
+        # 已進行兩回合，預算只剩一回合
+        conv_id = db.create_conversation("Alice", "be Alice", "gpt-4o", "Bob", "be Bob", "gpt-4o",
+                                         budget={"max_turns": 3})
+        for bot, content in (("Alice", "hi"), ("Bob", "b1"), ("Alice", "a1")):
+            db.add_message(conv_id, bot, content)
+        session = ConversationSession(conv_id)
+        session.resume()
+
+        main.resume_conversation_thread(session)
+
+        assert session.last_error is None
+        assert create.call_count == 1
+        assert create.call_args.kwargs["messages"] == [
+            {"role": "system", "content": "be Bob"},
+            {"role": "user", "content": "hi"},
+            {"role": "assistant", "content": "b1"},
+            {"role": "user", "content": "a1"},
+        ]
+        messages = db.get_messages_by_conversation_id(conv_id)
+        assert [(message["bot_name"], message["content"], message["turn"]) for message in messages][-1] == ("Bob", "b2", 3)
+    finally:
+        main.db_manager.close()
@@ -0,0 +1,184 @@
+import asyncio
+import threading
+import time
+from email.utils import format_datetime
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from llm import scheduler
+from llm.scheduler import ConcurrencyLimit, RequestScheduler, TokenBucket, retry_after
+
+
+class FakeClock:
+    """Stands in for the time module: sleeping only advances the clock."""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(scheduler, "time", clock)
+    return clock
+
+
+class StatusError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = SimpleNamespace(headers=headers or {})
+
+
+def test_token_bucket_waits_for_debt_and_refills(clock):
+    bucket = TokenBucket(60)  # 每秒補 1
+    assert bucket.reserve(60) == 0.0
+    assert bucket.reserve(30) == pytest.approx(30.0)
+    clock.now += 30
+    assert bucket.reserve(1) == pytest.approx(1.0)
+    clock.now += 120
+    # 補滿後最多一分鐘的量
+    assert bucket.reserve(0) == 0.0
+    assert bucket.level == pytest.approx(60.0)
+
+
+def test_token_bucket_caps_oversized_requests_and_adjusts(clock):
+    bucket = TokenBucket(60)
+    assert bucket.reserve(1000) == 0.0
+    assert bucket.level == 0.0
+    bucket.adjust(-30)
+    assert bucket.reserve(40) == pytest.approx(10.0)
+    bucket.adjust(-1000)
+    assert bucket.level == pytest.approx(60.0)
+
+
+def test_retry_after_headers(clock):
+    assert retry_after(StatusError(429, {"retry-after-ms": "1500"})) == 1.5
+    assert retry_after(StatusError(429, {"retry-after": "7"})) == 7.0
+    date = format_datetime(datetime.fromtimestamp(clock.now + 20, tz=timezone.utc), usegmt=True)
+    assert retry_after(StatusError(503, {"retry-after": date})) == pytest.approx(20.0)
+    assert retry_after(StatusError(429, {"retry-after": "soon"})) is None
+    assert retry_after(StatusError(429)) is None
+
+
+def test_retry_after_blocks_the_models_other_requests(clock):
+    pool = RequestScheduler(max_retries=3)
+    limiter = pool._limiter("gpt-4o")
+    assert pool._retry_delay(limiter, StatusError(429, {"retry-after": "12"}), 0) == 12.0
+    assert limiter.blocked_until == clock.now + 12
+    assert pool._reserve(limiter, 0) == pytest.approx(12.0)
+    # 非 429 不阻擋其他請求；不可重試的錯誤與用完次數時直接拋出
+    assert pool._retry_delay(limiter, StatusError(503, {"retry-after": "500"}), 0) == scheduler.MAX_RETRY_AFTER
+    assert limiter.blocked_until == clock.now + 12
+    assert pool._retry_delay(limiter, StatusError(400), 0) is None
+    assert pool._retry_delay(limiter, StatusError(429), 3) is None
+
+
+def test_backoff_without_retry_after_is_jittered_and_capped(clock):
+    pool = RequestScheduler(backoff_base=1.0, backoff_max=8.0, max_retries=10)
+    limiter = pool._limiter("gpt-4o")
+    for attempt, step in [(0, 1.0), (2, 4.0), (6, 8.0)]:
+        delay = pool._retry_delay(limiter, StatusError(500), attempt)
+        assert step / 2 <= delay <= step
+
+
+def test_retries_reserve_tokens_once(clock):
+    pool = RequestScheduler(default_tpm=600, max_retries=5)
+    errors = [StatusError(429, {"retry-after": "2"}), StatusError(502, {"retry-after": "3"})]
+
+    def request():
+        if errors:
+            raise errors.pop(0)
+        return "reply"
+
+    assert pool.call("gpt-4o", request, estimate_tokens=lambda: 100, usage_of=lambda result: 150) == "reply"
+    assert clock.sleeps == [0.0, 2.0, 0.0, 3.0, 0.0]
+    # 三次嘗試只扣一次預估，再依實際用量修正；等待的 5 秒補回 50
+    assert pool._limiter("gpt-4o").tokens.level == pytest.approx(600 - 150 + 50)
+
+
+def test_failed_request_refunds_its_tokens(clock):
+    pool = RequestScheduler(default_tpm=600, max_retries=1)
+
+    def request():
+        raise StatusError(500, {"retry-after": "1"})
+
+    with pytest.raises(StatusError):
+        pool.call("gpt-4o", request, estimate_tokens=lambda: 100, usage_of=lambda result: 0)
+    assert pool._limiter("gpt-4o").tokens.level == pytest.approx(600)
+
+
+def test_async_retries_reserve_tokens_once(clock, monkeypatch):
+    async def fake_sleep(seconds):
+        clock.sleep(seconds)
+
+    monkeypatch.setattr(scheduler.asyncio, "sleep", fake_sleep)
+    pool = RequestScheduler(default_tpm=600, max_retries=5)
+    errors = [StatusError(429, {"retry-after": "2"})]
+
+    async def request():
+        if errors:
+            raise errors.pop(0)
+        return "reply"
+
+    async def run():
+        return await pool.call_async("gpt-4o", request, estimate_tokens=lambda: 100, usage_of=lambda result: 100)
+
+    assert asyncio.run(run()) == "reply"
+    assert clock.sleeps == [0.0, 2.0, 0.0]
+    assert pool._limiter("gpt-4o").tokens.level == pytest.approx(600 - 100 + 20)
+
+
+def test_concurrency_limit_serves_threads_in_order():
+    limit = ConcurrencyLimit(1)
+    limit.acquire()
+    order = []
+    threads = []
+    for index in range(3):
+        def worker(index=index):
+            limit.acquire()
+            order.append(index)
+            limit.release()
+
+        thread = threading.Thread(target=worker)
+        thread.start()
+        # 等到執行緒真的排入佇列再啟動下一個
+        while len(limit._waiters) < index + 1:
+            time.sleep(0.001)
+        threads.append(thread)
+    limit.release()
+    for thread in threads:
+        thread.join(timeout=5)
+    assert order == [0, 1, 2]
+    assert limit.available == 1
+
+
+def test_concurrency_limit_hands_slot_past_cancelled_coroutine():
+    async def run():
+        limit = ConcurrencyLimit(1)
+        await limit.acquire_async()
+        cancelled = asyncio.ensure_future(limit.acquire_async())
+        waiting = asyncio.ensure_future(limit.acquire_async())
+        await asyncio.sleep(0)
+        # 名額已交給第一位等待者，但它在拿到之前就被取消，名額要轉給下一位
+        limit.release()
+        cancelled.cancel()
+        await asyncio.wait_for(waiting, timeout=5)
+        assert cancelled.cancelled()
+        limit.release()
+        return limit.available, len(limit._waiters)
+
+    assert asyncio.run(run()) == (1, 0)
@@ -0,0 +1,65 @@
+from database.db_manager import DatabaseManager
+from database.search import HIGHLIGHT_END, HIGHLIGHT_START, excerpt, parse_query
+
+
+def _mark(text, term):
+    return text.replace(term, f"{HIGHLIGHT_START}{term}{HIGHLIGHT_END}")
+
+
+def test_excerpt_keeps_words_and_match_whole():
+    words = " ".join(f"word{i:03d}" for i in range(200))
+    marked = _mark(words, "word150")
+    cut = excerpt(marked, length=80)
+    assert cut.startswith("…") and cut.endswith("…")
+    assert f"{HIGHLIGHT_START}word150{HIGHLIGHT_END}" in cut
+    # 兩端都在空白處斷開，不會切到單字中間
+    assert all(part.startswith("word") and len(part) == 7 for part in cut.strip("…").replace(HIGHLIGHT_START, "")
+               .replace(HIGHLIGHT_END, "").split())
+    assert len(cut) <= 82
+
+
+def test_excerpt_is_longer_than_fts_snippet_limit():
+    text = "天氣" * 200 + "預報" + "下雨" * 200
+    cut = excerpt(_mark(text, "預報"))
+    assert len(cut) > 64 * 2
+    assert cut.count(HIGHLIGHT_START) == cut.count(HIGHLIGHT_END) == 1
+
+
+def test_short_terms_fold_unicode_case(tmp_path):
+    db = DatabaseManager(db_path=str(tmp_path / "search.db"))
+    db.init_db()
+    try:
+        conversation_id = db.create_conversation("A", "prompt", "gpt-4o", "B", "prompt", "gpt-4o", title="t")
+        db.add_message(conversation_id, "A", "Ärger über das Wetter")
+        db.add_message(conversation_id, "A", "Arger uber das Wetter")
+        results, _ = db.search(parse_query("wetter ä"), kinds=("message",))
+        assert [result["snippet"] for result in results] == ["Ärger über das <mark>Wetter</mark>"]
+    finally:
+        db.close()
+
+
+def test_search_without_fts5_scans_rows(tmp_path, monkeypatch):
+    from database import migrations
+    monkeypatch.setattr(migrations, "_fts_tokenizer", lambda cursor: None)
+    db = DatabaseManager(db_path=str(tmp_path / "plain.db"))
+    db.init_db()
+    try:
+        with db.get_connection() as conn:
+            assert conn.execute("SELECT count(*) FROM sqlite_master WHERE name LIKE '%_fts%'").fetchone()[0] == 0
+        first = db.create_conversation("A", "You forecast the WEATHER", "gpt-4o", "B", "prompt", "gpt-4o", title="t")
+        db.add_message(first, "A", "Weather report: rain later")
+        db.add_message(first, "A", "Nothing to see")
+        db.add_message(first, "B", "the weather is fine")
+
+        results, next_offset = db.search(parse_query("weather"), limit=2)
+        assert next_offset == 2
+        assert [(result["type"], result["snippet"], result["rank"]) for result in results] == [
+            ("message", "the <mark>weather</mark> is fine", None),
+            ("message", "<mark>Weather</mark> report: rain later", None),
+        ]
+        results, next_offset = db.search(parse_query("weather"), limit=2, offset=2)
+        assert next_offset is None
+        assert [(result["type"], result["snippet"]) for result in results] == [
+            ("conversation", "You forecast the <mark>WEATHER</mark>")]
+    finally:
+        db.close()
@@ -0,0 +1,84 @@
+"""One turn must cost exactly one chat completion request, for every model family."""
+import asyncio
+from types import SimpleNamespace
+from unittest import mock
+
+import pytest
+
+import main
+from engine.budget import ConversationBudget
+from engine.history import FullHistoryPolicy
+from engine.session_manager import ConversationSession
+from llm.providers import OpenAIProvider
+
+MODELS = ["o1", "o1-mini", "gpt-4o"]
+
+USAGE = SimpleNamespace(prompt_tokens=12, completion_tokens=3, total_tokens=15)
+
+
+def _chunks():
+    # 串流回覆: 兩個內容片段，最後一個片段只帶 usage (stream_options.include_usage)
+    for text in ("Hello", " there"):
+        yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))], usage=None)
+    yield SimpleNamespace(choices=[], usage=USAGE)
+
+
+async def _chunks_async():
+    for chunk in _chunks():
+        yield chunk
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    main.db_manager.close()
+    monkeypatch.setattr(main.db_manager, "db_path", str(tmp_path / "test.db"))
+    main.db_manager.init_db()
+    yield main.db_manager
+    main.db_manager.close()
+
+
+@pytest.fixture
+def provider(monkeypatch):
+    provider = OpenAIProvider(api_key="test")
+    monkeypatch.setattr(main, "llm_provider", provider)
+    monkeypatch.setattr(main, "TURN_DELAY", 0)
+    # 送出完整歷史，回合不需要 tiktoken 計數
+    monkeypatch.setattr(main, "history_policy", FullHistoryPolicy())
+    return provider
+
+
+def _start(db, model):
+    config = main._parse_conversation_config({"bot1_model": model, "bot2_model": model, "max_turns": 1})
+    session = ConversationSession(main._create_conversation(config))
+    session.resume()
+    return session, main._conversation_args(config)
+
+
+@pytest.mark.parametrize("model", MODELS)
+def test_one_request_per_turn(db, provider, model):
+    create = mock.MagicMock(side_effect=lambda **kwargs: _chunks())
+    provider._client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    session, args = _start(db, model)
+
+    main.run_conversation(session, *args, budget=ConversationBudget(max_turns=1))
+
+    assert session.last_error is None
+    assert session.turns == 1
+    assert create.call_count == 1
+    assert create.call_args.kwargs["model"] == model
+    assert create.call_args.kwargs["stream"] is True
+
+
+@pytest.mark.parametrize("model", MODELS)
+def test_one_request_per_turn_async(db, provider, model):
+    create = mock.AsyncMock(side_effect=lambda **kwargs: _chunks_async())
+    provider._async_client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    session, args = _start(db, model)
+
+    asyncio.run(main.run_conversation_async(session, *args, budget=ConversationBudget(max_turns=1)))
+
+    assert session.last_error is None
+    assert session.turns == 1
+    assert create.call_count == 1
+    assert create.call_args.kwargs["model"] == model
+    assert create.call_args.kwargs["stream"] is True
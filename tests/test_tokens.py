@@ -0,0 +1,90 @@
+import threading
+
+import pytest
+
+from engine import tokens
+
+
+class FakeEncoding:
+    name = "fake"
+
+    def encode(self, text, disallowed_special=()):
+        return list(text)
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    for name in ("_encoders", "_encodings", "_load_locks", "_retry_at"):
+        monkeypatch.setattr(tokens, name, {})
+
+
+def test_failed_load_is_retried_after_interval(monkeypatch):
+    clock = [1000.0]
+    calls = []
+
+    def get_encoding(name):
+        calls.append(name)
+        if len(calls) == 1:
+            raise OSError("network unreachable")
+        return FakeEncoding()
+
+    monkeypatch.setattr(tokens.time, "monotonic", lambda: clock[0])
+    monkeypatch.setattr(tokens.tiktoken, "get_encoding", get_encoding)
+
+    assert isinstance(tokens.get_encoding("gpt-4o"), tokens.ApproximateEncoding)
+    # 重試間隔內不再嘗試下載
+    assert isinstance(tokens.get_encoding("gpt-4o"), tokens.ApproximateEncoding)
+    assert calls == ["o200k_base"]
+
+    clock[0] += tokens.LOAD_RETRY_INTERVAL
+    assert isinstance(tokens.get_encoding("gpt-4o"), FakeEncoding)
+    assert tokens.count_tokens("abc", "gpt-4o") == 3
+    assert calls == ["o200k_base", "o200k_base"]
+
+
+def test_slow_load_does_not_block_other_encodings(monkeypatch):
+    release = threading.Event()
+
+    def get_encoding(name):
+        if name == "o200k_base":
+            assert release.wait(5)
+        return FakeEncoding()
+
+    monkeypatch.setattr(tokens.tiktoken, "get_encoding", get_encoding)
+    slow = threading.Thread(target=tokens.get_encoding, args=("gpt-4o",))
+    slow.start()
+    try:
+        assert isinstance(tokens.get_encoding("gpt-3.5-turbo"), FakeEncoding)
+        assert slow.is_alive()
+    finally:
+        release.set()
+        slow.join()
+    assert isinstance(tokens.get_encoding("gpt-4o"), FakeEncoding)
+
+
+def test_batches_share_one_executor_and_small_ones_skip_it(monkeypatch):
+    monkeypatch.setattr(tokens, "get_encoding", lambda model: FakeEncoding())
+    monkeypatch.setattr(tokens, "_executor", None)
+    threads = []
+    encode = FakeEncoding.encode
+
+    def recording_encode(self, text, disallowed_special=()):
+        threads.append(threading.current_thread().name)
+        return encode(self, text)
+
+    monkeypatch.setattr(FakeEncoding, "encode", recording_encode)
+
+    assert tokens.count_tokens_batch(["ab", "cde"]) == [2, 3]
+    assert tokens._executor is None
+    assert threads == [threading.current_thread().name] * 2
+
+    threads.clear()
+    long_texts = ["x" * tokens.PARALLEL_ENCODE_MIN_CHARS, "yy"]
+    assert tokens.count_tokens_batch(long_texts) == [tokens.PARALLEL_ENCODE_MIN_CHARS, 2]
+    executor = tokens._executor
+    assert executor is not None
+    assert all(name.startswith("tokens") for name in threads)
+    assert tokens.estimate_prompt_tokens([{"content": text} for text in long_texts]) == (
+        tokens.PARALLEL_ENCODE_MIN_CHARS + 2 + 2 * tokens.MESSAGE_OVERHEAD_TOKENS + tokens.REPLY_PRIMING_TOKENS)
+    assert tokens._executor is executor
+    executor.shutdown()
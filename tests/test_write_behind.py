@@ -0,0 +1,87 @@
+import threading
+import time
+
+import pytest
+
+from database import write_behind
+from database.db_manager import DatabaseManager
+from database.write_behind import WriteBehindError, WriteBehindWriter
+
+
+def _row(conversation_id, content):
+    return (conversation_id, "2024-01-01 00:00:00", "A", content, 1, 1, 2, 0.1, 0)
+
+
+class FlakyDatabase:
+    """insert_messages stand-in that fails multi-row batches and the listed contents."""
+
+    def __init__(self, failures=None):
+        self.written = []
+        # content -> 還要失敗幾次 (None 表示一直失敗)
+        self.failures = dict(failures or {})
+        self.lock = threading.Lock()
+
+    def insert_messages(self, rows):
+        with self.lock:
+            if len(rows) > 1:
+                raise OSError("disk I/O error")
+            content = rows[0][3]
+            if content in self.failures:
+                remaining = self.failures[content]
+                if remaining is None or remaining > 0:
+                    if remaining is not None:
+                        self.failures[content] = remaining - 1
+                    raise OSError(f"cannot write {content}")
+            self.written.append((rows[0][0], content))
+
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(write_behind, "RETRY_INTERVAL", 0.01)
+
+
+def test_flush_returns_after_rows_queued_before_it(tmp_path):
+    db = DatabaseManager(db_path=str(tmp_path / "write_behind.db"))
+    db.init_db()
+    # 很長的批次間隔: 只有 flush 會讓資料寫入
+    db.enable_write_behind(flush_interval=60, batch_size=1000)
+    try:
+        conversation_id = db.create_conversation("A", "prompt", "gpt-4o", "B", "prompt", "gpt-4o")
+        for index in range(5):
+            db.add_message_with_tokens(conversation_id, "A", f"message {index}", 1, 1, 0.1)
+        start = time.monotonic()
+        messages = db.get_messages_by_conversation_id(conversation_id)
+        assert time.monotonic() - start < 5
+        assert [(msg["content"], msg["turn"]) for msg in messages] == [(f"message {index}", index) for index in range(5)]
+    finally:
+        db.close()
+
+
+def test_failed_batch_is_written_row_by_row_in_order():
+    database = FlakyDatabase(failures={"a1": 2})
+    writer = WriteBehindWriter(database, flush_interval=60, batch_size=1000).start()
+    try:
+        for content in ("a0", "b0", "a1", "a2", "b1"):
+            writer.add_message(_row(content[0], content))
+        assert writer.flush(timeout=5) is True
+    finally:
+        writer.close()
+    # a1 重試兩次後才寫入，a2 必須排在它後面；b 對話不受影響
+    assert [content for _, content in database.written if content.startswith("a")] == ["a0", "a1", "a2"]
+    assert [content for _, content in database.written if content.startswith("b")] == ["b0", "b1"]
+
+
+def test_dropped_rows_are_reported_to_flush():
+    database = FlakyDatabase(failures={"a1": None})
+    writer = WriteBehindWriter(database, flush_interval=60, batch_size=1000).start()
+    try:
+        for content in ("a0", "a1", "a2"):
+            writer.add_message(_row("a", content))
+        with pytest.raises(WriteBehindError, match="1 message rows"):
+            writer.flush(timeout=5)
+        # 錯誤只回報一次
+        writer.add_message(_row("a", "a3"))
+        assert writer.flush(timeout=5) is True
+    finally:
+        writer.close()
+    assert [content for _, content in database.written] == ["a0", "a2", "a3"]